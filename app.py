@@ -1,7 +1,32 @@
 from eve import Eve
 
+import settings
+from data_layer import Mongo
+from metrics import Metrics
+from response_cache import ResponseCache
+from views import collapse_filter, time_range_filter, views
 
-main = Eve()
+
+main = Eve(data=Mongo)
+# registered first, so that time spent by other extensions is accounted
+metrics = Metrics(main)
+main.register_blueprint(views)
+main.on_pre_GET_documents += time_range_filter
+main.on_pre_GET_documents += collapse_filter
+
+
+def import_generation():
+    """
+    :returns: generation of imported data, bumped by import_data.py
+    :rtype: int
+    """
+    meta = main.data.driver.db[settings.META_COLLECTION_NAME].find_one(
+        {'_id': 'generation'})
+    return meta['value'] if meta else 0
+
+
+main.data.track_generation(import_generation)
+response_cache = ResponseCache(main, generation=import_generation)
 
 if __name__ == '__main__':
     main.run()
@@ -0,0 +1,299 @@
+"""
+Benchmarks of parsing, import and API latency, to compare performance of
+revisions of the project.
+
+Measured are: parse throughput of DataBrowser.documents for every data
+file and for all of them, cost of as_dict() for Document and
+DocumentRecord, documents imported per second by import_data.py, and
+latency percentiles of API endpoints along with README's example queries.
+
+Data is imported into a dedicated database of the local mongod (--mongo),
+which is dropped afterwards, or of an in-process stand-in (mongomock) by
+default. The stand-in is much slower than mongod, so that its figures are
+only meaningful when compared with each other. Results are written as JSON.
+"""
+
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import import_data
+import settings
+from data_browser import Corpus, DataBrowser
+
+BENCHMARK_DBNAME = 'reuters_benchmark'
+
+# endpoints timed along with README's example queries (see
+# import_data.README_QUERIES)
+API_URLS = [
+    '/',
+    '/documents',
+    '/documents?page=20',
+    '/documents?cursor=',
+    '/documents?cursor=&sort=-datetime',
+    '/documents?start=1987-03-01T00:00:00&end=1987-03-02T00:00:00',
+    '/topics',
+    '/places',
+    '/people',
+    '/orgs',
+    '/exchanges',
+    '/authors',
+    '/facets',
+    '/facets?where={"topics": "corn"}',
+    '/timeseries',
+    '/timeseries?by=topics',
+    '/timeseries?where={"topics": "corn", "places": "usa"}',
+]
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentiles(samples, points=PERCENTILES):
+    """
+    :param samples: durations in seconds
+    :param points: percentiles to compute
+    :returns: nearest-rank percentiles in milliseconds, keyed as p50, ...,
+      along with the mean
+    :rtype: dict
+    """
+    samples = sorted(samples)
+    results = {
+        'p%d' % point: samples[max(
+            0, -(-point * len(samples) // 100) - 1)] * 1000
+        for point in points}
+    results['mean'] = sum(samples) * 1000 / len(samples)
+    return results
+
+
+def rate(documents, seconds):
+    """
+    :rtype: dict
+    """
+    return {
+        'documents': documents,
+        'seconds': seconds,
+        'docs_per_sec': documents / seconds if seconds else 0.0,
+    }
+
+
+def bench_parse(data_files):
+    """
+    :param data_files: paths to data files
+    :returns: parse throughput of every data file, and of all of them
+    :rtype: dict
+    """
+    results = {'files': {}}
+    documents = seconds = 0
+    for path in data_files:
+        started = time.perf_counter()
+        try:
+            count = len(DataBrowser(path).documents)
+        except Exception as exc:
+            results['files'][path] = {'error': repr(exc)}
+            continue
+        elapsed = time.perf_counter() - started
+        results['files'][path] = rate(count, elapsed)
+        documents += count
+        seconds += elapsed
+    results['total'] = rate(documents, seconds)
+    return results
+
+
+def bench_as_dict(data_file, repeat=3):
+    """
+    :param data_file: path to data file
+    :param repeat: number of times documents are converted
+    :returns: microseconds per as_dict() call, for parsed documents and for
+      records
+    :rtype: dict
+    """
+    data = DataBrowser(data_file)
+    results = {}
+    for name, documents in (('document', data.documents),
+                            ('record', data.records)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for doc in documents:
+                doc.as_dict()
+        results[name] = (time.perf_counter() - started) * 1e6 / (
+            repeat * len(documents))
+    return results
+
+
+def bench_import(mongo_db, data_files, workers=1):
+    """
+    :param mongo_db: instance of pymongo.database.Database, emptied before
+      import
+    :param data_files: paths to data files
+    :param workers: number of parsing processes
+    :returns: throughput of the import, overall and by stage
+    :rtype: dict
+    """
+    mongo_db.client.drop_database(mongo_db.name)
+    args = argparse.Namespace(
+        incremental=False, write_concern=None, workers=workers,
+        batch_size=import_data.DEFAULT_BATCH_SIZE)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        loader = import_data.import_files(mongo_db, data_files, args)
+        import_data.bump_generation(mongo_db)
+    results = rate(
+        loader.write_stats.documents, time.perf_counter() - started)
+    for stats in (loader.parse_stats, loader.write_stats):
+        results[stats.name] = rate(stats.documents, stats.seconds)
+    return results
+
+
+def bench_api(main, urls, repeat=50, cache=False):
+    """
+    :param main: Eve application
+    :param urls: URLs to request
+    :param repeat: number of requests per URL
+    :param cache: whether responses and totals may be served from caches
+    :returns: status, number of failed requests (status other than 2xx)
+      and latency percentiles of successful requests by URL
+    :rtype: dict
+    """
+    client = main.test_client()
+    response_cache = getattr(sys.modules.get('app'), 'response_cache', None)
+    results = {}
+    for url in urls:
+        samples = []
+        errors = 0
+        for _ in range(repeat):
+            if not cache:
+                if response_cache is not None and \
+                        response_cache.backend is not None:
+                    response_cache.backend.clear()
+                main.data.totals.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            # failures are often fast, they would skew latencies
+            if 200 <= response.status_code < 300:
+                samples.append(elapsed)
+            else:
+                errors += 1
+        if errors:
+            print('%d of %d requests failed (%d): %s' % (
+                errors, repeat, response.status_code, url), file=sys.stderr)
+        results[url] = dict(
+            percentiles(samples) if samples else {},
+            status=response.status_code, errors=errors)
+    return results
+
+
+def readme_urls():
+    """
+    :returns: URLs of README's example queries
+    :rtype: list
+    """
+    return [
+        '/documents?where=' + json.dumps(query)
+        for query in import_data.README_QUERIES]
+
+
+def connect(mongo):
+    """
+    :param mongo: whether to use the local mongod instead of mongomock
+    :returns: benchmark database, and description of the server
+    :rtype: tuple
+    """
+    import pymongo
+    if mongo:
+        mongo_con = pymongo.MongoClient(settings.MONGO_HOST)
+        version = 'mongod ' + mongo_con.server_info()['version']
+    else:
+        import mongomock
+        store = mongomock.store.ServerStore()
+
+        class MongoClient(mongomock.MongoClient):
+            # clients of the API and of the importer share data
+            def __init__(self, *args, **kwargs):
+                kwargs['_store'] = store
+                super().__init__(*args, **kwargs)
+
+        pymongo.MongoClient = MongoClient
+        mongo_con = MongoClient()
+        version = 'mongomock ' + mongomock.__version__
+    return mongo_con[BENCHMARK_DBNAME], version
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark parsing, import and API latency.')
+    parser.add_argument(
+        'paths', metavar='path', nargs='*',
+        help='path to data file, all data files of raw_data by default')
+    parser.add_argument(
+        '--mongo', action='store_true', default=False,
+        help='import into the local mongod instead of an in-process '
+             'stand-in')
+    parser.add_argument(
+        '--workers', type=int, default=1, metavar='N',
+        help='number of processes parsing data files during import')
+    parser.add_argument(
+        '--repeat', type=int, default=50, metavar='N',
+        help='number of requests per API endpoint')
+    parser.add_argument(
+        '--cache', action='store_true', default=False,
+        help='let API responses be served from caches')
+    parser.add_argument(
+        '--skip', action='append', default=[],
+        choices=('parse', 'as_dict', 'import', 'api'),
+        help='skip a benchmark, may be repeated')
+    parser.add_argument(
+        '--output', metavar='FILE',
+        help='file to write results to, standard output by default')
+    args = parser.parse_args()
+    data_files = sorted(args.paths) or Corpus('raw_data').data_files
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started': datetime.now(timezone.utc).isoformat(),
+            'data_files': data_files,
+        },
+    }
+    if 'parse' not in args.skip:
+        print('benchmarking parsing', file=sys.stderr)
+        results['parse'] = bench_parse(data_files)
+    if 'as_dict' not in args.skip:
+        print('benchmarking as_dict()', file=sys.stderr)
+        results['as_dict'] = bench_as_dict(data_files[0])
+    if 'import' not in args.skip or 'api' not in args.skip:
+        mongo_db, version = connect(args.mongo)
+        results['environment']['database'] = version
+        try:
+            print('benchmarking import', file=sys.stderr)
+            results['import'] = bench_import(
+                mongo_db, data_files, args.workers)
+            if 'api' not in args.skip:
+                print('benchmarking API', file=sys.stderr)
+                # Eve connects to the database when the application is
+                # created, after mongomock is patched in
+                import app
+                app.main.config['MONGO_DBNAME'] = BENCHMARK_DBNAME
+                results['api'] = bench_api(
+                    app.main, API_URLS + readme_urls(), args.repeat,
+                    args.cache)
+        finally:
+            mongo_db.client.drop_database(BENCHMARK_DBNAME)
+        if 'import' in args.skip:
+            # data is imported anyway for the API
+            del results['import']
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f_obj:
+            f_obj.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,14 @@
 Library to access data within the Reuters text collection files.
 """
 
+import mmap
+import os
 import re
+import sys
+from collections import OrderedDict
 from datetime import datetime
-from itertools import chain
+from glob import glob
+import numpy
 from lxml import etree
 
 
@@ -23,6 +28,67 @@ _MONTHS_DICT = {
     'DEC': 12
     }
 
+# a few dates have stray digits before the hour (e.g. 605:12:19.12), the
+# last two digits are the hour
+_DATE_RE = re.compile(
+    r'(\d{1,2})-(\w{3})-(\d{4})\s+\d*?(\d{2}):(\d{2}):(\d{2}).*')
+
+# document attributes holding lists of categories
+CATEGORIES = ('topics', 'places', 'people', 'orgs', 'exchanges')
+
+# names of vocabularies available across documents
+VOCABULARIES = ('authors',) + CATEGORIES
+
+# fields of documents and of their text, in the order of as_dict() results
+DOCUMENT_FIELDS = ('reuters_id', 'reuters_old_id', 'datetime') + \
+    CATEGORIES + ('text',)
+TEXT_FIELDS = ('type', 'author', 'dateline', 'title', 'body')
+
+# document attributes holding the LEWISSPLIT, CGISPLIT and TOPICS attributes
+# of REUTERS elements, which define the standard training and test splits
+# (e.g. ModApte: LEWISSPLIT="TRAIN" or "TEST", and TOPICS="YES")
+SPLIT_FIELDS = ('lewis_split', 'cgi_split', 'topics_flag')
+
+# data files are UTF-8, documents holding bytes which are not are decoded
+# with this encoding instead (any byte is valid latin-1)
+FALLBACK_ENCODING = 'iso-8859-1'
+
+
+def select_fields(doc, fields, names):
+    """
+    Build the dict of the document's fields selected by dotted paths,
+    accessing only the selected fields.
+
+    :param doc: document or text of a document
+    :param fields: dotted paths to the fields to return, e.g. 'topics' or
+      'text.title' ('text' returns all fields of the text)
+    :param names: names of the fields of the document, DOCUMENT_FIELDS or
+      TEXT_FIELDS
+    :returns: selected fields of the document, in the order of names
+    :rtype: dict
+    :raises ValueError: if a field is unknown
+    """
+    selected = {}
+    for field in fields:
+        name, _, subfield = field.partition('.')
+        if name not in names or subfield and name != 'text':
+            raise ValueError('unknown field: %s' % field)
+        if not subfield:
+            selected[name] = None
+        elif selected.get(name, ()) is not None:
+            selected.setdefault(name, []).append(subfield)
+    result = {}
+    for name in names:
+        if name not in selected:
+            continue
+        value = getattr(doc, name)
+        if name == 'text':
+            value = value.as_dict(selected[name])
+        elif isinstance(value, tuple):
+            value = list(value)
+        result[name] = value
+    return result
+
 
 class DocumentText():
     """
@@ -35,10 +101,14 @@ class DocumentText():
         """
         self._elem = elem
 
-    def as_dict(self):
+    def as_dict(self, fields=None):
         """
-        Return all document's text info as dict.
+        Return document's text info as dict.
+
+        :param fields: names of the fields to return, all of them by default
         """
+        if fields is not None:
+            return select_fields(self, fields, TEXT_FIELDS)
         return {
             'type': self.type,
             'author': self.author,
@@ -98,11 +168,16 @@ class Document():
         """
         self._elem = elem
 
-    def as_dict(self):
+    def as_dict(self, fields=None):
         """
+        :param fields: dotted paths to the fields to return (see
+          select_fields()), all of them by default; other fields are not
+          extracted
         :returns: document's info
         :rtype: dict
         """
+        if fields is not None:
+            return select_fields(self, fields, DOCUMENT_FIELDS)
         return {
             'reuters_id': self.reuters_id,
             'reuters_old_id': self.reuters_old_id,
@@ -137,13 +212,21 @@ class Document():
         :returns: document's datetime referred as DATE in the text collection
         :rtype: instance of datetime.datetime
         """
-        day, month, year, hour, minute, second = re.match(
-            r'(\d{1,2})-(\w{3})-(\d{4})\s+(\d{2}):(\d{2}):(\d{2}).*',
+        day, month, year, hour, minute, second = _DATE_RE.match(
             self._elem.find('DATE').text.strip()).groups()
         return datetime(
             year=int(year), month=_MONTHS_DICT[month], day=int(day),
             hour=int(hour), minute=int(minute), second=int(second))
 
+    @property
+    def cgi_split(self):
+        """
+        :returns: document's split referred as CGISPLIT in the text
+          collection ('TRAINING-SET' or 'PUBLISHED-TESTSET')
+        :rtype: str
+        """
+        return self._elem.attrib.get('CGISPLIT')
+
     @property
     def exchanges(self):
         """
@@ -152,6 +235,15 @@ class Document():
         """
         return sorted(_.text for _ in self._elem.findall('EXCHANGES/D'))
 
+    @property
+    def lewis_split(self):
+        """
+        :returns: document's split referred as LEWISSPLIT in the text
+          collection ('TRAIN', 'TEST' or 'NOT-USED')
+        :rtype: str
+        """
+        return self._elem.attrib.get('LEWISSPLIT')
+
     @property
     def orgs(self):
         """
@@ -192,10 +284,386 @@ class Document():
         """
         return sorted(_.text for _ in self._elem.findall('TOPICS/D'))
 
+    @property
+    def topics_flag(self):
+        """
+        :returns: document's TOPICS attribute in the text collection ('YES',
+          'NO' or 'BYPASS'), telling whether the document was indexed for
+          topics
+        :rtype: str
+        """
+        return self._elem.attrib.get('TOPICS')
+
+
+class DocumentTextRecord():
+    """
+    Compact, read-only copy of a document's text info, detached from the
+    source element. Exposes the same attributes as DocumentText.
+    """
+    __slots__ = ('type', 'author', 'dateline', 'title', 'body')
+
+    def __init__(self, type, author, dateline, title, body):
+        self.type = type
+        self.author = author
+        self.dateline = dateline
+        self.title = title
+        self.body = body
+
+    @classmethod
+    def from_text(cls, text):
+        """
+        :param text: instance of DocumentText
+        :rtype: instance of DocumentTextRecord
+        """
+        author = text.author
+        return cls(
+            sys.intern(text.type),
+            author and sys.intern(author),
+            text.dateline,
+            text.title,
+            text.body)
+
+    def as_dict(self, fields=None):
+        """
+        Return document's text info as dict.
+
+        :param fields: names of the fields to return, all of them by default
+        """
+        if fields is not None:
+            return select_fields(self, fields, TEXT_FIELDS)
+        return {
+            'type': self.type,
+            'author': self.author,
+            'dateline': self.dateline,
+            'title': self.title,
+            'body': self.body
+            }
+
+
+class DocumentRecord():
+    """
+    Compact, read-only copy of a document, detached from the source element.
+
+    All values are extracted once, category values are interned and stored
+    in tuples, so that the parsed tree can be released and attribute access
+    is a plain lookup. Exposes the same attributes as Document.
+    """
+    __slots__ = (
+        'reuters_id', 'reuters_old_id', 'datetime', 'topics', 'places',
+        'people', 'orgs', 'exchanges', 'text') + SPLIT_FIELDS
+
+    def __init__(self, reuters_id, reuters_old_id, datetime, topics, places,
+                 people, orgs, exchanges, text, lewis_split=None,
+                 cgi_split=None, topics_flag=None):
+        self.reuters_id = reuters_id
+        self.reuters_old_id = reuters_old_id
+        self.datetime = datetime
+        self.topics = topics
+        self.places = places
+        self.people = people
+        self.orgs = orgs
+        self.exchanges = exchanges
+        self.text = text
+        self.lewis_split = lewis_split
+        self.cgi_split = cgi_split
+        self.topics_flag = topics_flag
+
+    @classmethod
+    def from_document(cls, doc):
+        """
+        :param doc: instance of Document
+        :rtype: instance of DocumentRecord
+        """
+        return cls(
+            doc.reuters_id,
+            doc.reuters_old_id,
+            doc.datetime,
+            *(tuple(sys.intern(_) for _ in getattr(doc, name))
+              for name in CATEGORIES),
+            DocumentTextRecord.from_text(doc.text),
+            *(value and sys.intern(value)
+              for value in (getattr(doc, name) for name in SPLIT_FIELDS)))
+
+    def as_dict(self, fields=None):
+        """
+        :param fields: dotted paths to the fields to return (see
+          select_fields()), all of them by default; other fields are not
+          extracted
+        :returns: document's info
+        :rtype: dict
+        """
+        if fields is not None:
+            return select_fields(self, fields, DOCUMENT_FIELDS)
+        return {
+            'reuters_id': self.reuters_id,
+            'reuters_old_id': self.reuters_old_id,
+            'datetime': self.datetime,
+            'topics': list(self.topics),
+            'places': list(self.places),
+            'people': list(self.people),
+            'orgs': list(self.orgs),
+            'exchanges': list(self.exchanges),
+            'text': self.text.as_dict(),
+        }
+
+
+class CategoryIndex():
+    """
+    In-memory inverted index of documents by categories, authors and ids.
+
+    Every indexed value is mapped to a bitmap of positions of documents
+    having it, stored as an int, so that boolean combinations of filters
+    are plain bitwise operations. Filters are expressed with the subset of
+    MongoDB query syntax used by the API, e.g.
+    {"$and": [{"topics": "corn"}, {"places": "usa"}]}:
+      - {field: value}, {field: {"$in": [...]}}, {field: {"$all": [...]}},
+        {field: {"$ne": value}}, {field: {"$nin": [...]}},
+        {field: {"$not": condition}},
+      - {"$and": [...]}, {"$or": [...]}, {"$nor": [...]},
+    where field is one of CATEGORIES, 'text.author' or 'reuters_id'.
+    """
+
+    # fields of documents the index is built for
+    FIELDS = CATEGORIES + ('text.author', 'reuters_id')
+
+    def __init__(self, documents):
+        """
+        :param documents: sequence of documents (instances of Document,
+          DocumentRecord or any object with the same interface)
+        """
+        self._bitmaps = {name: {} for name in self.FIELDS}
+        length = 0
+        for position, doc in enumerate(documents):
+            bit = 1 << position
+            for name, values in self._values(doc):
+                bitmaps = self._bitmaps[name]
+                for value in values:
+                    if value is not None:
+                        bitmaps[value] = bitmaps.get(value, 0) | bit
+            length = position + 1
+        self._length = length
+        self._all = (1 << length) - 1
+
+    @staticmethod
+    def _values(doc):
+        """
+        :returns: names of indexed fields along with their values in the
+          document
+        :rtype: generator of tuples
+        """
+        for name in CATEGORIES:
+            yield name, getattr(doc, name)
+        yield 'text.author', [doc.text.author]
+        yield 'reuters_id', [doc.reuters_id]
+
+    def __len__(self):
+        return self._length
+
+    def bitmap(self, spec):
+        """
+        :param spec: filter, see class documentation
+        :returns: bitmap of positions of documents matching the filter
+        :rtype: int
+        """
+        bitmap = self._all
+        for key, condition in spec.items():
+            if key == '$and':
+                for clause in condition:
+                    bitmap &= self.bitmap(clause)
+            elif key == '$or':
+                bitmap &= self._any(condition)
+            elif key == '$nor':
+                bitmap &= ~self._any(condition)
+            elif key in self._bitmaps:
+                bitmap &= self._field_bitmap(key, condition)
+            else:
+                raise ValueError('unsupported filter: %s' % key)
+        return bitmap & self._all
+
+    def _any(self, clauses):
+        bitmap = 0
+        for clause in clauses:
+            bitmap |= self.bitmap(clause)
+        return bitmap
+
+    def _field_bitmap(self, field, condition):
+        bitmaps = self._bitmaps[field]
+        if not isinstance(condition, dict):
+            return self._value_bitmap(bitmaps, field, condition)
+        bitmap = self._all
+        for operator, operand in condition.items():
+            if operator == '$eq':
+                bitmap &= self._value_bitmap(bitmaps, field, operand)
+            elif operator == '$ne':
+                bitmap &= ~self._value_bitmap(bitmaps, field, operand)
+            elif operator == '$in':
+                bitmap &= self._union(bitmaps, field, operand)
+            elif operator == '$nin':
+                bitmap &= ~self._union(bitmaps, field, operand)
+            elif operator == '$all':
+                for value in self._values_list(field, operand):
+                    bitmap &= self._value_bitmap(bitmaps, field, value)
+            elif operator == '$not':
+                bitmap &= ~self._field_bitmap(field, operand)
+            else:
+                raise ValueError('unsupported operator: %s' % operator)
+        return bitmap
+
+    @staticmethod
+    def _value_bitmap(bitmaps, field, value):
+        # values of documents are strings or ids, other values (e.g. lists)
+        # can't be looked up
+        if value is not None and not isinstance(value, (str, int)):
+            raise ValueError('unsupported filter value of %s: %r'
+                             % (field, value))
+        return bitmaps.get(value, 0)
+
+    @staticmethod
+    def _values_list(field, values):
+        if not isinstance(values, list):
+            raise ValueError('unsupported filter value of %s: %r'
+                             % (field, values))
+        return values
+
+    def _union(self, bitmaps, field, values):
+        bitmap = 0
+        for value in self._values_list(field, values):
+            bitmap |= self._value_bitmap(bitmaps, field, value)
+        return bitmap
+
+    def count(self, spec):
+        """
+        :param spec: filter, see class documentation
+        :returns: number of documents matching the filter
+        :rtype: int
+        """
+        return bin(self.bitmap(spec)).count('1')
+
+    def query(self, spec):
+        """
+        :param spec: filter, see class documentation
+        :returns: positions of documents matching the filter, in ascending
+          order
+        :rtype: list
+        """
+        bits = bin(self.bitmap(spec))[:1:-1]
+        positions = []
+        position = bits.find('1')
+        while position != -1:
+            positions.append(position)
+            position = bits.find('1', position + 1)
+        return positions
+
+
+class TimeIndex():
+    """
+    Column of documents' datetimes, sorted once so that time range queries
+    are binary searches.
+    """
+
+    def __init__(self, datetimes):
+        """
+        :param datetimes: datetimes of documents in their order, as
+          numpy.datetime64 array (or anything convertible to it)
+        """
+        self.datetimes = numpy.asarray(datetimes, dtype='datetime64[s]')
+        # positions of documents in chronological order
+        self.order = numpy.argsort(self.datetimes, kind='stable')
+        self._sorted = self.datetimes[self.order]
+
+    @classmethod
+    def from_documents(cls, documents):
+        """
+        :param documents: sequence of documents (instances of Document,
+          DocumentRecord or any object with the same interface)
+        :rtype: instance of TimeIndex
+        """
+        return cls(numpy.fromiter(
+            (numpy.datetime64(doc.datetime, 's') for doc in documents),
+            dtype='datetime64[s]'))
+
+    def __len__(self):
+        return len(self.datetimes)
+
+    def between(self, start=None, end=None):
+        """
+        :param start: datetime (inclusive), or None for no lower bound
+        :param end: datetime (exclusive), or None for no upper bound
+        :returns: positions of documents in the time range, in chronological
+          order
+        :rtype: numpy.ndarray
+        """
+        low, high = 0, len(self._sorted)
+        if start is not None:
+            low = numpy.searchsorted(
+                self._sorted, numpy.datetime64(start, 's'), side='left')
+        if end is not None:
+            high = numpy.searchsorted(
+                self._sorted, numpy.datetime64(end, 's'), side='left')
+        return self.order[low:max(low, high)]
+
+
+def _file_signature(data_file):
+    """
+    :returns: modification time and size of the file, which allow to detect
+      if the file has changed since it was parsed
+    :rtype: tuple
+    """
+    stat = os.stat(data_file)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _merge_vocabularies(vocabularies):
+    """
+    :param vocabularies: iterable of dicts as returned by
+      DataBrowser.vocabularies
+    :returns: vocabularies merged into a single dict of sorted lists
+    :rtype: dict
+    """
+    merged = {name: set() for name in VOCABULARIES}
+    for vocabulary in vocabularies:
+        for name, values in vocabulary.items():
+            merged[name].update(values)
+    return {name: sorted(values) for name, values in merged.items()}
+
+
+def _document_spans(data):
+    """
+    :param data: content of a data file (bytes or instance of mmap.mmap)
+    :returns: start and end offsets of every REUTERS element; an element
+      missing its end tag ends where the next one starts
+    :rtype: generator of tuples
+    """
+    start = data.find(b'<REUTERS')
+    while start != -1:
+        following = data.find(b'<REUTERS', start + 1)
+        end = data.find(b'</REUTERS>', start)
+        if end == -1 or following != -1 and following < end:
+            end = len(data) if following == -1 else following
+        else:
+            end += len(b'</REUTERS>')
+        yield start, end
+        start = following
+
+
+def _invalid_encoding(parser):
+    """
+    :param parser: instance of lxml.etree.XMLParser
+    :returns: whether the last document parsed had bytes invalid in its
+      encoding
+    :rtype: bool
+    """
+    return any(
+        _.type == etree.ErrorTypes.ERR_INVALID_ENCODING
+        for _ in parser.error_log)
+
 
 class DataBrowser():
     """
     Class to extract data from reuters .sgm files.
+
+    The data file is parsed at most once: parsed documents and vocabularies
+    are cached until the file's modification time or size changes.
     """
 
     def __init__(self, data_file):
@@ -203,7 +671,23 @@ class DataBrowser():
         :param data_file: path to data file
         """
         self.data_file = data_file
-        # self._cache = {}
+        # number of documents not valid UTF-8 in the last pass over the
+        # data file, decoded with FALLBACK_ENCODING
+        self.repaired = 0
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        """
+        :param key: name of the cached value
+        :param compute: callable returning the value if it is not cached
+        :returns: cached value, computed if missing or outdated
+        """
+        signature = _file_signature(self.data_file)
+        if self._cache.get('signature') != signature:
+            self._cache = {'signature': signature}
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
 
     @property
     def authors(self):
@@ -211,8 +695,7 @@ class DataBrowser():
         :returns: authors available across all documents in the data file.
         :rtype: list
         """
-        return sorted(set(filter(
-            None, (doc.text.author for doc in self.documents))))
+        return self.vocabularies['authors']
 
     @property
     def documents(self):
@@ -220,13 +703,128 @@ class DataBrowser():
         :returns: documents available in the data file
         :rtype: list
         """
-        # if 'documents' in self._cache:
-        #     return self._cache['documents']
-        with open(self.data_file) as f_obj:
-            raw_data = '<root>' + f_obj.read() + '</root>'
-        parser = etree.XMLParser(recover=True)
-        root = etree.fromstring(raw_data, parser=parser)
-        return [Document(_) for _ in root.findall('REUTERS')]
+        return self._cached('documents', self._parse)
+
+    def _parse(self):
+        """
+        :returns: documents parsed from the data file
+        :rtype: list
+        """
+        return list(self.iter_documents())
+
+    @property
+    def records(self):
+        """
+        Compact copies of documents available in the data file, extracted
+        while the data file is parsed incrementally, so that parsed trees
+        are released (see iter_records()). Cached documents are reused if
+        they were accessed first.
+
+        :rtype: list of DocumentRecord
+        """
+        return self._cached('records', self._extract_records)
+
+    def _extract_records(self):
+        """
+        :returns: records extracted from the data file
+        :rtype: list of DocumentRecord
+        """
+        documents = self._cache.get('documents')
+        if documents is None:
+            documents = self.iter_documents()
+        return [DocumentRecord.from_document(_) for _ in documents]
+
+    def iter_records(self):
+        """
+        Unless documents or records are already cached, the data file is
+        parsed incrementally and no parsed tree is kept in memory.
+
+        :returns: compact copies of documents available in the data file
+        :rtype: generator of DocumentRecord
+        """
+        if 'records' in self._cache:
+            return iter(self.records)
+        if 'documents' in self._cache:
+            documents = self.documents
+        else:
+            documents = self.iter_documents()
+        return (DocumentRecord.from_document(_) for _ in documents)
+
+    def to_dicts(self, fields=None):
+        """
+        Convert all documents of the data file to dicts. Unless documents
+        or records are already cached, the data file is parsed
+        incrementally, and only the requested fields are extracted.
+
+        :param fields: dotted paths to the fields to return (see
+          select_fields()), all of them by default
+        :rtype: list of dict
+        """
+        if 'records' in self._cache:
+            documents = self._cache['records']
+        elif 'documents' in self._cache:
+            documents = self._cache['documents']
+        else:
+            documents = self.iter_documents()
+        return [_.as_dict(fields) for _ in documents]
+
+    @property
+    def vocabularies(self):
+        """
+        Authors and categories available across all documents in the data
+        file, collected in a single pass over the documents.
+
+        :returns: sorted lists of values keyed by 'authors', 'topics',
+          'places', 'people', 'orgs' and 'exchanges'
+        :rtype: dict
+        """
+        return self._cached('vocabularies', self._collect_vocabularies)
+
+    def _collect_vocabularies(self):
+        """
+        :returns: vocabularies of the data file
+        :rtype: dict
+        """
+        vocabularies = {name: set() for name in VOCABULARIES}
+        for doc in self.records:
+            author = doc.text.author
+            if author:
+                vocabularies['authors'].add(author)
+            for name in CATEGORIES:
+                vocabularies[name].update(getattr(doc, name))
+        return {name: sorted(values) for name, values in vocabularies.items()}
+
+    def iter_documents(self):
+        """
+        Iterate over documents in the data file, parsing it incrementally.
+
+        The file is memory-mapped and never decoded or copied as a whole:
+        every ``REUTERS`` element is parsed on its own from the bytes it
+        spans, so memory usage does not depend on the size of the data
+        file. A document holding bytes which are not valid UTF-8 is parsed
+        again with FALLBACK_ENCODING instead of failing the whole file, and
+        is counted in :attr:`repaired`.
+
+        :returns: documents available in the data file
+        :rtype: generator of Document
+        """
+        self.repaired = 0
+        if not os.path.getsize(self.data_file):
+            # empty files can't be mapped
+            return
+        parser = etree.XMLParser(recover=True, collect_ids=False)
+        fallback_parser = etree.XMLParser(
+            recover=True, collect_ids=False, encoding=FALLBACK_ENCODING)
+        with open(self.data_file, 'rb') as f_obj, \
+                mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for start, end in _document_spans(data):
+                raw_doc = data[start:end]
+                elem = etree.fromstring(raw_doc, parser)
+                if _invalid_encoding(parser):
+                    elem = etree.fromstring(raw_doc, fallback_parser)
+                    self.repaired += 1
+                if elem is not None:
+                    yield Document(elem)
 
     @property
     def exchanges(self):
@@ -234,8 +832,7 @@ class DataBrowser():
         :returns: exchanges available across all documents in the data file.
         :rtype: list
         """
-        return sorted(set(chain.from_iterable(
-            doc.exchanges for doc in self.documents)))
+        return self.vocabularies['exchanges']
 
     @property
     def orgs(self):
@@ -243,8 +840,7 @@ class DataBrowser():
         :returns: orgs available across all documents in the data file.
         :rtype: list
         """
-        return sorted(set(chain.from_iterable(
-            doc.orgs for doc in self.documents)))
+        return self.vocabularies['orgs']
 
     @property
     def people(self):
@@ -252,8 +848,7 @@ class DataBrowser():
         :returns: people available across all documents in the data file.
         :rtype: list
         """
-        return sorted(set(chain.from_iterable(
-            doc.people for doc in self.documents)))
+        return self.vocabularies['people']
 
     @property
     def places(self):
@@ -261,8 +856,7 @@ class DataBrowser():
         :returns: places available across all documents in the data file.
         :rtype: list
         """
-        return sorted(set(chain.from_iterable(
-            doc.places for doc in self.documents)))
+        return self.vocabularies['places']
 
     @property
     def topics(self):
@@ -270,5 +864,197 @@ class DataBrowser():
         :returns: topics available across all documents in the data file.
         :rtype: list
         """
-        return sorted(set(chain.from_iterable(
-            doc.topics for doc in self.documents)))
+        return self.vocabularies['topics']
+
+
+class Corpus():
+    """
+    Class to extract data from a directory of reuters .sgm files.
+
+    Every data file is parsed at most once: the most recently used parsed
+    files are kept in a bounded LRU cache, and vocabularies of every file
+    are kept separately, so that they survive eviction of the parsed file.
+    Cached data is invalidated when the file's modification time or size
+    changes.
+    """
+
+    def __init__(self, data_dir, cache_size=4):
+        """
+        :param data_dir: path to directory containing data files
+        :param cache_size: maximum number of parsed data files kept in memory
+        """
+        self.data_dir = data_dir
+        self.cache_size = cache_size
+        self._browsers = OrderedDict()
+        self._vocabularies = {}
+        self._index = None
+        self._time_index = None
+
+    @property
+    def data_files(self):
+        """
+        :returns: paths to data files in the data directory
+        :rtype: list
+        """
+        return sorted(glob(os.path.join(self.data_dir, '*.sgm')))
+
+    def browser(self, data_file):
+        """
+        :param data_file: path to data file
+        :returns: browser over the data file, shared between calls as long
+          as it stays in the cache
+        :rtype: instance of DataBrowser
+        """
+        browser = self._browsers.pop(data_file, None)
+        if browser is None:
+            browser = DataBrowser(data_file)
+        self._browsers[data_file] = browser
+        while len(self._browsers) > self.cache_size:
+            self._browsers.popitem(last=False)
+        return browser
+
+    @property
+    def documents(self):
+        """
+        :returns: documents available across all data files
+        :rtype: list
+        """
+        return list(self.iter_documents())
+
+    def iter_documents(self):
+        """
+        :returns: documents available across all data files, file by file
+        :rtype: generator of Document
+        """
+        for data_file in self.data_files:
+            yield from self.browser(data_file).documents
+
+    @property
+    def index(self):
+        """
+        Index of records available across all data files, built once and
+        rebuilt only if any data file changes.
+
+        :returns: records and their index
+        :rtype: tuple of list of DocumentRecord and CategoryIndex
+        """
+        signatures = [(_, _file_signature(_)) for _ in self.data_files]
+        if self._index is None or self._index[0] != signatures:
+            records = self.records
+            self._index = signatures, records, CategoryIndex(records)
+        return self._index[1:]
+
+    @property
+    def time_index(self):
+        """
+        Datetimes of records available across all data files, in the order
+        of Corpus.index records, built once and rebuilt only if any data
+        file changes.
+
+        :rtype: instance of TimeIndex
+        """
+        records, _ = self.index
+        if self._time_index is None or self._time_index[0] is not records:
+            self._time_index = records, TimeIndex.from_documents(records)
+        return self._time_index[1]
+
+    def between(self, start=None, end=None):
+        """
+        :param start: datetime (inclusive), or None for no lower bound
+        :param end: datetime (exclusive), or None for no upper bound
+        :returns: records in the time range, in chronological order
+        :rtype: list of DocumentRecord
+        """
+        records, _ = self.index
+        return [records[_] for _ in self.time_index.between(start, end)]
+
+    def query(self, spec):
+        """
+        :param spec: filter, see CategoryIndex
+        :returns: records matching the filter
+        :rtype: list of DocumentRecord
+        """
+        records, index = self.index
+        return [records[_] for _ in index.query(spec)]
+
+    @property
+    def records(self):
+        """
+        :returns: compact copies of documents available across all data files
+        :rtype: list of DocumentRecord
+        """
+        return list(self.iter_records())
+
+    def iter_records(self):
+        """
+        :returns: compact copies of documents available across all data
+          files, file by file
+        :rtype: generator of DocumentRecord
+        """
+        for data_file in self.data_files:
+            yield from self.browser(data_file).records
+
+    @property
+    def vocabularies(self):
+        """
+        :returns: vocabularies merged across all data files, see
+          DataBrowser.vocabularies
+        :rtype: dict
+        """
+        vocabularies = []
+        for data_file in self.data_files:
+            signature = _file_signature(data_file)
+            cached = self._vocabularies.get(data_file)
+            if cached is None or cached[0] != signature:
+                cached = self._vocabularies[data_file] = (
+                    signature, self.browser(data_file).vocabularies)
+            vocabularies.append(cached[1])
+        return _merge_vocabularies(vocabularies)
+
+    @property
+    def authors(self):
+        """
+        :returns: authors available across all data files.
+        :rtype: list
+        """
+        return self.vocabularies['authors']
+
+    @property
+    def exchanges(self):
+        """
+        :returns: exchanges available across all data files.
+        :rtype: list
+        """
+        return self.vocabularies['exchanges']
+
+    @property
+    def orgs(self):
+        """
+        :returns: orgs available across all data files.
+        :rtype: list
+        """
+        return self.vocabularies['orgs']
+
+    @property
+    def people(self):
+        """
+        :returns: people available across all data files.
+        :rtype: list
+        """
+        return self.vocabularies['people']
+
+    @property
+    def places(self):
+        """
+        :returns: places available across all data files.
+        :rtype: list
+        """
+        return self.vocabularies['places']
+
+    @property
+    def topics(self):
+        """
+        :returns: topics available across all data files.
+        :rtype: list
+        """
+        return self.vocabularies['topics']
@@ -0,0 +1,292 @@
+"""
+MongoDB data layer of the API: Eve's data layer, with number of documents
+matching a query cached until the import generation changes, and opt-in
+keyset pagination.
+
+Keyset pagination is requested with the cursor parameter, empty for the
+first page. Pages are read with a range query on an indexed key, ordered by
+reuters_id or by datetime (sort=datetime), instead of skipping documents of
+previous pages, so that any page costs the same as the first one. Links to
+next and previous pages carry opaque tokens marking where pages end.
+"""
+
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from eve.io.mongo import Mongo as EveMongo
+from eve.utils import config
+from flask import abort, request
+
+from response_cache import GenerationTracker, LocalBackend
+
+# keys documents can be paginated on in cursor mode, by first sort field;
+# the last field of each key is unique, and each key is served by an index
+KEYSETS = {
+    'reuters_id': ('reuters_id',),
+    'datetime': ('datetime', 'reuters_id'),
+}
+
+
+def encode_cursor(name, direction, values, backward=False):
+    """
+    :param name: name of the key, see KEYSETS
+    :param direction: 1 for ascending order, -1 for descending order
+    :param values: values of key fields of the document the page starts
+      after (or ends before when reading backward)
+    :param backward: whether the page precedes the document
+    :returns: opaque token
+    :rtype: str
+    """
+    values = [
+        {'$date': _.isoformat()} if isinstance(_, datetime) else _
+        for _ in values]
+    token = json.dumps([name, direction, values, backward],
+                       separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """
+    :param token: token returned by encode_cursor()
+    :returns: name of the key, direction, values and backward flag
+    :rtype: tuple
+    :raises ValueError: if the token is malformed
+    """
+    try:
+        name, direction, values, backward = json.loads(
+            base64.urlsafe_b64decode(token.encode('ascii')))
+        values = [
+            datetime.fromisoformat(_['$date']) if isinstance(_, dict) else _
+            for _ in values]
+    except (TypeError, KeyError, UnicodeError, ValueError):
+        raise ValueError('invalid cursor: %s' % token)
+    if name not in KEYSETS or direction not in (1, -1) or \
+            len(values) != len(KEYSETS[name]):
+        raise ValueError('invalid cursor: %s' % token)
+    return name, direction, values, bool(backward)
+
+
+def keyset_condition(fields, direction, values):
+    """
+    :param fields: fields of the key
+    :param direction: 1 to select documents following values in ascending
+      order, -1 in descending order
+    :param values: values of key fields
+    :returns: query selecting documents following values
+    :rtype: dict
+    """
+    operator = '$gt' if direction == 1 else '$lt'
+    clauses = []
+    for position, field in enumerate(fields):
+        clause = dict(zip(fields[:position], values[:position]))
+        clause[field] = {operator: values[position]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+class KeysetPage():
+    """
+    Documents of a page read in cursor mode. Eve iterates it as a cursor,
+    and calls extra() to complete the response with links to adjacent
+    pages.
+    """
+
+    def __init__(self, resource, documents, next_cursor, prev_cursor):
+        """
+        :param resource: name of the resource
+        :param documents: documents of the page
+        :param next_cursor: token of the next page, or None for the last page
+        :param prev_cursor: token of the previous page, or None for the first
+          page
+        """
+        self.resource = resource
+        self.documents = documents
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def _href(self, cursor):
+        args = [
+            (name, value) for name, value in request.args.items(multi=True)
+            if name not in ('cursor', 'page')]
+        args.append(('cursor', cursor))
+        return '%s?%s' % (config.DOMAIN[self.resource]['url'], urlencode(args))
+
+    def extra(self, response):
+        """
+        :param response: response being built by Eve, whose page-based links
+          are replaced
+        """
+        meta = response.get(config.META)
+        if meta is not None:
+            meta.pop('page', None)
+        links = response.get(config.LINKS)
+        if links is None:
+            return
+        for rel in ('prev', 'next', 'last'):
+            links.pop(rel, None)
+        if self.prev_cursor is not None:
+            links['prev'] = {
+                'title': 'previous page', 'href': self._href(self.prev_cursor)}
+        if self.next_cursor is not None:
+            links['next'] = {
+                'title': 'next page', 'href': self._href(self.next_cursor)}
+
+
+class Mongo(EveMongo):
+    """
+    Eve's MongoDB data layer caching totals and paginating on keys in
+    cursor mode.
+
+    Configuration is read from application's config:
+      TOTALS_CACHE_SIZE: maximum number of totals cached by a process
+      RESPONSE_CACHE_GENERATION_CHECK_INTERVAL: number of seconds the import
+        generation is trusted before it is read again
+    """
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.totals = LocalBackend(app.config.get('TOTALS_CACHE_SIZE', 1024))
+        self.tracker = None
+        self._generation = None
+        self._check_interval = app.config.get(
+            'RESPONSE_CACHE_GENERATION_CHECK_INTERVAL', 1.0)
+
+    def track_generation(self, source):
+        """
+        :param source: callable returning the current import generation;
+          totals are not cached until it is set
+        """
+        self.tracker = GenerationTracker(source, self._check_interval)
+
+    def find(self, resource, req, sub_resource_lookup, perform_count=True):
+        if req is None or req.args is None or 'cursor' not in req.args:
+            return self._find_counted(
+                resource, req, sub_resource_lookup, perform_count)
+        return self._find_page(
+            resource, req, sub_resource_lookup, perform_count)
+
+    def _find_counted(self, resource, req, lookup, perform_count):
+        """
+        Eve's find(), with the number of matching documents read from the
+        cache of totals when available.
+        """
+        if not perform_count or self.tracker is None:
+            return super().find(resource, req, lookup, perform_count)
+        generation = self.tracker.value
+        if generation != self._generation:
+            self.totals.clear()
+            self._generation = generation
+        key = totals_key(resource, req, lookup)
+        count = self.totals.get(key)
+        if count is not None:
+            return super().find(resource, req, lookup, False)[0], count
+        cursor, count = super().find(resource, req, lookup, True)
+        self.totals.set(key, count)
+        return cursor, count
+
+    def _find_page(self, resource, req, lookup, perform_count):
+        """
+        Read a page in cursor mode.
+
+        :returns: instance of KeysetPage and total number of documents
+          matching the query, regardless of pages
+        """
+        token = req.args['cursor']
+        if token:
+            try:
+                name, direction, values, backward = decode_cursor(token)
+            except ValueError as exc:
+                abort(400, description=str(exc))
+        else:
+            sort = self._convert_sort_request_to_dict(req) or \
+                [('reuters_id', 1)]
+            name, direction = sort[0]
+            if name not in KEYSETS:
+                abort(400, description=(
+                    'cursor pagination is only available when sorting by '
+                    '%s' % ' or '.join(sorted(KEYSETS))))
+            values, backward = None, False
+        fields = KEYSETS[name]
+        # previous page is read backward from its end
+        order = -direction if backward else direction
+        _, count = self._find_counted(resource, req, lookup, perform_count)
+        if values is not None:
+            condition = keyset_condition(fields, order, values)
+            lookup = self.combine_queries(lookup, condition) \
+                if lookup else condition
+        max_results = req.max_results
+        page_req = copy_request(req)
+        page_req.page = 1
+        # one more document tells whether there is a page after this one
+        page_req.max_results = max_results + 1
+        page_req.sort = repr([(field, order) for field in fields])
+        page_req.projection = _with_fields(req.projection, fields)
+        cursor, _ = super().find(resource, page_req, lookup, False)
+        documents = list(cursor)
+        more = len(documents) > max_results
+        documents = documents[:max_results]
+        if backward:
+            documents.reverse()
+        # the page was reached from the one following it when read backward
+        has_next = values is not None if backward else more
+        has_prev = more if backward else values is not None
+        next_cursor = prev_cursor = None
+        if documents:
+            if has_next:
+                next_cursor = encode_cursor(
+                    name, direction, [documents[-1][_] for _ in fields])
+            if has_prev:
+                prev_cursor = encode_cursor(
+                    name, direction, [documents[0][_] for _ in fields],
+                    backward=True)
+        return KeysetPage(resource, documents, next_cursor, prev_cursor), count
+
+
+def totals_key(resource, req, lookup):
+    """
+    :param resource: name of the resource
+    :param req: instance of eve.utils.ParsedRequest, or None
+    :param lookup: filter added to the request's one, e.g. by hooks
+    :returns: key identifying the number of documents matching the request,
+      including the If-Modified-Since header which Eve turns into a filter
+    :rtype: str
+    """
+    return json.dumps(
+        [resource, req.where if req else None,
+         req.if_modified_since if req else None, lookup],
+        default=str, sort_keys=True)
+
+
+def copy_request(req):
+    """
+    :param req: instance of eve.utils.ParsedRequest
+    :returns: shallow copy of the request
+    """
+    copy = type(req)()
+    copy.__dict__.update(req.__dict__)
+    return copy
+
+
+def _with_fields(projection, fields):
+    """
+    :param projection: projection parameter of a request (JSON), or None
+    :param fields: fields that must be returned
+    :returns: projection parameter also including fields, if it lists the
+      fields to return
+    """
+    if not projection:
+        return projection
+    try:
+        spec = json.loads(projection)
+    except ValueError:
+        # left to Eve to reject
+        return projection
+    if isinstance(spec, dict) and any(spec.values()):
+        spec.update((field, 1) for field in fields)
+        return json.dumps(spec)
+    return projection
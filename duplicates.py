@@ -0,0 +1,300 @@
+"""
+Near-duplicate detection of documents by MinHash signatures of their
+bodies, indexed by locality-sensitive hashing (LSH).
+
+Bodies are split into shingles (sequences of SHINGLE_SIZE words), and the
+Jaccard similarity of two bodies' shingles is estimated by the fraction of
+equal values in their signatures. Signatures are split into BANDS bands:
+documents sharing any band are candidates, so that finding documents
+similar to one only compares it with its candidates instead of the whole
+collection. Documents whose similarity is at least 0.5 are found with a
+probability above 0.87, at least 0.8 with a probability above 0.99.
+
+import_data.py stores signatures and band keys of every document, and marks
+near-duplicates of earlier documents with the reuters_id of the earliest
+one (duplicate_of field).
+
+Usage:
+  python duplicates.py report <path_to_data_file> ...
+"""
+
+import argparse
+import re
+import zlib
+
+import numpy
+
+import settings
+from data_browser import DataBrowser
+
+# number of words per shingle
+SHINGLE_SIZE = 3
+
+# number of hash functions of signatures, split into BANDS bands of
+# NUM_PERM // BANDS rows
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+# hash functions are the upper 32 bits of a * x + b (modulo 2 ** 64) for
+# 32-bit hashes x of shingles, with odd a, so that no division is needed.
+# Coefficients are drawn from a fixed seed so that signatures stored in the
+# database stay comparable. Shingles and bands are hashed by multiplying
+# their values with odd 64-bit factors.
+_SEED = 21578
+_random = numpy.random.RandomState(_SEED)
+_A = _random.randint(0, 2 ** 63, NUM_PERM, dtype=numpy.uint64) * 2 + 1
+_B = _random.randint(0, 2 ** 63, NUM_PERM, dtype=numpy.uint64)
+_SHINGLE_FACTORS = _random.randint(
+    0, 2 ** 63, SHINGLE_SIZE, dtype=numpy.uint64) * 2 + 1
+_BAND_FACTORS = _random.randint(
+    0, 2 ** 63, (BANDS, ROWS), dtype=numpy.uint64) * 2 + 1
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# fields of documents holding their signature and band keys, internal to
+# the database
+SIGNATURE_FIELDS = ('minhash', 'lsh')
+
+
+class _WordHashes(dict):
+    """
+    32-bit hashes of words, computed once per word.
+    """
+
+    def __missing__(self, word):
+        value = self[word] = zlib.crc32(word.encode('utf-8'))
+        return value
+
+
+_word_hashes = _WordHashes()
+
+
+def shingles(text):
+    """
+    :param text: text to split
+    :returns: 32-bit hashes of every sequence of SHINGLE_SIZE consecutive
+      lowercase words, or of all words of shorter texts
+    :rtype: numpy.ndarray of unique uint64
+    """
+    words = _WORD_RE.findall((text or '').lower())
+    hashes = numpy.fromiter(
+        map(_word_hashes.__getitem__, words), dtype=numpy.uint64,
+        count=len(words))
+    size = min(SHINGLE_SIZE, len(hashes))
+    if not size:
+        return hashes
+    combined = numpy.zeros(len(hashes) - size + 1, dtype=numpy.uint64)
+    for offset in range(size):
+        combined += hashes[offset:len(combined) + offset] * \
+            _SHINGLE_FACTORS[offset]
+    return numpy.unique(combined >> numpy.uint64(32))
+
+
+def signature(text):
+    """
+    :param text: text to sign, a document's body
+    :returns: MinHash signature of the text's shingles, or None if it has no
+      words
+    :rtype: numpy.ndarray of NUM_PERM uint32
+    """
+    hashes = shingles(text)
+    if not len(hashes):
+        return None
+    values = numpy.multiply.outer(_A, hashes)
+    values += _B[:, None]
+    # upper bits of the minimum are the minimum of upper bits
+    return (values.min(axis=1) >> numpy.uint64(32)).astype(numpy.uint32)
+
+
+def band_keys(sig):
+    """
+    :param sig: MinHash signature
+    :returns: key of every band of the signature, as signed 64-bit integers
+      (stored as is by MongoDB)
+    :rtype: list
+    """
+    rows = sig.reshape(BANDS, ROWS).astype(numpy.uint64)
+    return (rows * _BAND_FACTORS).sum(axis=1).view(numpy.int64).tolist()
+
+
+def similarity(sig, other):
+    """
+    :returns: estimated Jaccard similarity of the shingles signed by two
+      signatures
+    :rtype: float
+    """
+    return numpy.count_nonzero(sig == other) / NUM_PERM
+
+
+def signature_fields(text):
+    """
+    :param text: document's body
+    :returns: fields holding the signature (minhash, as bytes) and the band
+      keys (lsh) of a document, stored by import_data.py; none if the body
+      has no words
+    :rtype: dict
+    """
+    sig = signature(text)
+    if sig is None:
+        return {}
+    return dict(zip(SIGNATURE_FIELDS, (sig.tobytes(), band_keys(sig))))
+
+
+def from_bytes(data):
+    """
+    :param data: signature as stored in minhash field
+    :rtype: numpy.ndarray
+    """
+    return numpy.frombuffer(data, dtype=numpy.uint32)
+
+
+class LSHIndex():
+    """
+    In-memory LSH index of document signatures, by reuters_id.
+    """
+
+    def __init__(self):
+        self.signatures = {}
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @classmethod
+    def build(cls, documents):
+        """
+        :param documents: documents to index (instances of Document,
+          DocumentRecord or any object with the same interface)
+        :rtype: instance of LSHIndex
+        """
+        index = cls()
+        for doc in documents:
+            sig = signature(doc.text.body)
+            if sig is not None:
+                index.add(doc.reuters_id, sig)
+        return index
+
+    def add(self, reuters_id, sig):
+        """
+        :param reuters_id: reuters_id of the document
+        :param sig: signature of the document's body
+        """
+        self.signatures[reuters_id] = sig
+        for key in band_keys(sig):
+            self._buckets.setdefault(key, []).append(reuters_id)
+
+    def similar(self, sig, threshold=settings.SIMILAR_THRESHOLD):
+        """
+        :param sig: signature to look up
+        :param threshold: minimum similarity of returned documents
+        :returns: reuters_id of indexed documents sharing a band with the
+          signature, along with their similarity if it is at least the
+          threshold, most similar first
+        :rtype: list of tuples
+        """
+        candidates = set()
+        for key in band_keys(sig):
+            candidates.update(self._buckets.get(key, ()))
+        return ranked(
+            ((_, self.signatures[_]) for _ in candidates), sig, threshold)
+
+    def duplicates(self, threshold=settings.DUPLICATES_THRESHOLD):
+        """
+        Group documents whose similarity is at least the threshold,
+        transitively.
+
+        :returns: reuters_id of the earliest document of its group, by
+          reuters_id of every other document of the group
+        :rtype: dict
+        """
+        parents = {}
+
+        def root(reuters_id):
+            # path halving: every visited document is linked to its
+            # grandparent, so that paths stay short
+            while parents.get(reuters_id, reuters_id) != reuters_id:
+                parent = parents[reuters_id]
+                grandparent = parents.get(parent, parent)
+                parents[reuters_id] = grandparent
+                reuters_id = grandparent
+            return reuters_id
+
+        for bucket in self._buckets.values():
+            if len(bucket) < 2:
+                continue
+            for position, reuters_id in enumerate(bucket):
+                sig = self.signatures[reuters_id]
+                for other in bucket[position + 1:]:
+                    first, second = root(reuters_id), root(other)
+                    if first == second or similarity(
+                            sig, self.signatures[other]) < threshold:
+                        continue
+                    parents[max(first, second)] = min(first, second)
+        return {
+            reuters_id: root(reuters_id) for reuters_id in parents
+            if root(reuters_id) != reuters_id}
+
+
+def ranked(candidates, sig, threshold):
+    """
+    :param candidates: iterable of reuters_id along with signature
+    :param sig: signature to compare candidates with
+    :param threshold: minimum similarity of returned candidates
+    :returns: reuters_id of candidates along with their similarity to the
+      signature, if it is at least the threshold, most similar first
+    :rtype: list of tuples
+    """
+    results = []
+    for reuters_id, other in candidates:
+        score = similarity(sig, other)
+        if score >= threshold:
+            results.append((reuters_id, score))
+    results.sort(key=lambda item: (-item[1], item[0]))
+    return results
+
+
+def groups(duplicates):
+    """
+    :param duplicates: as returned by LSHIndex.duplicates()
+    :returns: reuters_id of duplicates by reuters_id of the earliest
+      document of their group, both sorted
+    :rtype: dict
+    """
+    result = {}
+    for reuters_id, original in sorted(duplicates.items()):
+        result.setdefault(original, []).append(reuters_id)
+    return dict(sorted(result.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Find near-duplicate documents of Reuters text '
+                    'collection.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report = commands.add_parser(
+        'report', help='list groups of near-duplicate documents')
+    report.add_argument(
+        'paths', metavar='path', nargs='+',
+        help='path to the data file whose documents are compared')
+    report.add_argument(
+        '--threshold', type=float, default=settings.DUPLICATES_THRESHOLD,
+        help='minimum similarity of near-duplicates')
+    args = parser.parse_args()
+    if args.command == 'report':
+        documents = (
+            record for path in sorted(args.paths)
+            for record in DataBrowser(path).iter_records())
+        index = LSHIndex.build(documents)
+        duplicates = index.duplicates(args.threshold)
+        for original, reuters_ids in groups(duplicates).items():
+            sig = index.signatures[original]
+            print('%d\t%s' % (original, ' '.join(
+                '%d (%.2f)' % (_, similarity(sig, index.signatures[_]))
+                for _ in reuters_ids)))
+        print('%d near-duplicates of %d documents among %d signed documents'
+              % (len(duplicates), len(set(duplicates.values())), len(index)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,516 @@
+"""
+Database-free serving mode of the API: the same read-only endpoints as
+app.py, answered from in-process indexes instead of MongoDB.
+
+Documents are loaded from a directory of .sgm files, or from a snapshot
+built by snapshot.py (EMBEDDED_DATA setting), and are reloaded when data
+files change. Eve's MongoDB data layer (see data_layer.py) is kept: only
+the collections it queries are replaced by in-memory ones, so that where,
+projection, sort and pagination parameters, cursor pagination included,
+are parsed exactly as in app.py and responses have the same shape.
+
+Filters are evaluated on columns of ids and datetimes, on bitmaps of
+categories and authors (see data_browser.CategoryIndex) and on the search
+index for $text (see search.py). Other fields and operators, and sorting
+on fields other than ids and datetime, are rejected with 400.
+
+Endpoints of views.py reading rollups, minhash signatures or near-duplicate
+links are not served, and answer 501 Not Implemented (see UNSUPPORTED_VIEWS),
+as does the collapse parameter of documents:
+  /facets, /timeseries, /documents/<_id>/similar and /documents/export.
+
+Usage:
+  python embedded.py
+"""
+
+import operator
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy
+from bson import ObjectId
+from eve import Eve
+from flask import Blueprint, abort, request
+
+import settings
+from data_browser import CategoryIndex, Corpus
+from data_layer import Mongo
+from metrics import Metrics
+from response_cache import ResponseCache
+from rollups import VocabularyCounter
+from search import SearchIndex
+from settings import DOCS_COLLECTION_NAME
+from snapshot import Snapshot
+from views import time_range_filter
+
+# endpoints of views.py answered with 501 Not Implemented, as documents
+# have neither rollups, minhash signatures nor near-duplicate links here
+UNSUPPORTED_VIEWS = {
+    'facets': '/facets',
+    'timeseries': '/timeseries',
+    'similar': '/documents/<regex("[a-f0-9]{24}"):_id>/similar',
+    'export': '/documents/export',
+}
+
+unsupported_views = Blueprint('unsupported_views', __name__)
+
+_COMPARISONS = {
+    '$eq': operator.eq,
+    '$ne': operator.ne,
+    '$gt': operator.gt,
+    '$gte': operator.ge,
+    '$lt': operator.lt,
+    '$lte': operator.le,
+}
+
+
+def document_id(reuters_id):
+    """
+    :param reuters_id: Reuters ID of a document
+    :returns: _id of the document, derived from its Reuters ID so that URLs
+      of documents don't change when data is reloaded
+    :rtype: bson.ObjectId
+    """
+    return ObjectId('%024x' % reuters_id)
+
+
+# conversions of query operands to values of columns, raising TypeError for
+# operands of another type, which no document matches (as in MongoDB)
+
+def _int_value(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(value)
+    return value
+
+
+def _id_value(value):
+    if not isinstance(value, ObjectId):
+        raise TypeError(value)
+    return int(str(value), 16)
+
+
+def _datetime_value(value):
+    if not isinstance(value, datetime):
+        raise TypeError(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return numpy.datetime64(value, 's')
+
+
+def _column_mask(column, condition, convert):
+    """
+    :param column: values of a field, by position of documents
+    :param condition: value of the field, or dict of operators
+    :param convert: callable converting operands to values of the column
+    :returns: mask of documents matching the condition
+    :rtype: numpy.ndarray
+    """
+    if not isinstance(condition, dict):
+        condition = {'$eq': condition}
+    mask = numpy.ones(len(column), dtype=bool)
+    for operator_, operand in condition.items():
+        if operator_ in _COMPARISONS:
+            try:
+                mask &= _COMPARISONS[operator_](column, convert(operand))
+            except TypeError:
+                if operator_ != '$ne':
+                    mask[:] = False
+        elif operator_ in ('$in', '$nin'):
+            values = []
+            for value in operand:
+                try:
+                    values.append(convert(value))
+                except TypeError:
+                    pass
+            matches = numpy.isin(
+                column, numpy.array(values, dtype=column.dtype))
+            mask &= matches if operator_ == '$in' else ~matches
+        elif operator_ == '$not':
+            mask &= ~_column_mask(column, operand, convert)
+        else:
+            raise ValueError('unsupported operator: %s' % operator_)
+    return mask
+
+
+def _bitmap_mask(bitmap, length):
+    """
+    :param bitmap: bitmap of positions, as returned by CategoryIndex
+    :param length: number of documents
+    :rtype: numpy.ndarray
+    """
+    bits = numpy.frombuffer(
+        bitmap.to_bytes(length // 8 + 1, 'little'), dtype=numpy.uint8)
+    return numpy.unpackbits(bits, bitorder='little')[:length].astype(bool)
+
+
+def _select(doc, paths, include):
+    """
+    :param doc: document as dict
+    :param paths: dotted paths of fields, relative to doc
+    :param include: whether fields are kept, or dropped
+    :returns: copy of the document keeping (or dropping) the fields
+    :rtype: dict
+    """
+    selected = {}
+    for key, value in doc.items():
+        if key in paths:
+            if include:
+                selected[key] = value
+            continue
+        prefix = key + '.'
+        nested = [_[len(prefix):] for _ in paths if _.startswith(prefix)]
+        if nested and isinstance(value, dict):
+            selected[key] = _select(value, nested, include)
+        elif not include:
+            selected[key] = value
+    return selected
+
+
+def project(doc, projection):
+    """
+    :param doc: document as dict
+    :param projection: MongoDB projection: fields to return, or fields not
+      to return if all values are false, by dotted path; _id is returned
+      unless excluded
+    :returns: projected document
+    :rtype: dict
+    """
+    if not projection:
+        return doc
+    fields = {key: value for key, value in projection.items() if key != '_id'}
+    include = any(fields.values()) or \
+        (not fields and bool(projection['_id']))
+    paths = [key for key, value in fields.items() if bool(value) == include]
+    if bool(projection.get('_id', 1)) == include:
+        paths.append('_id')
+    return _select(doc, paths, include)
+
+
+class Cursor():
+    """
+    Iterator over results of a query, exposing the methods of pymongo's
+    cursors Eve relies on.
+    """
+
+    def __init__(self, documents):
+        self._documents = iter(documents)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._documents)
+
+    next = __next__
+
+
+class DocumentCollection():
+    """
+    Documents held in memory, queried as a pymongo collection.
+    """
+
+    def __init__(self, documents, categories, time_index, search_index):
+        """
+        :param documents: sequence of documents (instances of
+          DocumentRecord, SnapshotDocument or any object with the same
+          interface)
+        :param categories: instance of CategoryIndex over the documents
+        :param time_index: instance of TimeIndex over the documents
+        :param search_index: instance of SearchIndex of the documents
+        """
+        self.documents = documents
+        self.categories = categories
+        self.search_index = search_index
+        reuters_ids = numpy.fromiter(
+            (_.reuters_id for _ in documents), dtype='int64',
+            count=len(documents))
+        reuters_old_ids = numpy.fromiter(
+            (_.reuters_old_id for _ in documents), dtype='int64',
+            count=len(documents))
+        # columns of fields along with the conversion of query operands
+        self.columns = {
+            '_id': (reuters_ids, _id_value),
+            'reuters_id': (reuters_ids, _int_value),
+            'reuters_old_id': (reuters_old_ids, _int_value),
+            'datetime': (time_index.datetimes, _datetime_value),
+        }
+
+    def __len__(self):
+        return len(self.documents)
+
+    def mask(self, spec):
+        """
+        :param spec: MongoDB filter, see module documentation
+        :returns: mask of documents matching the filter
+        :rtype: numpy.ndarray
+        :raises ValueError: if the filter is not supported
+        """
+        mask = numpy.ones(len(self), dtype=bool)
+        for key, condition in (spec or {}).items():
+            if key == '$and':
+                for clause in condition:
+                    mask &= self.mask(clause)
+            elif key == '$or':
+                mask &= self._any(condition)
+            elif key == '$nor':
+                mask &= ~self._any(condition)
+            elif key == '$text':
+                mask &= self._text_mask(condition)
+            elif key in self.columns:
+                column, convert = self.columns[key]
+                mask &= _column_mask(column, condition, convert)
+            elif key in CategoryIndex.FIELDS:
+                mask &= _bitmap_mask(
+                    self.categories.bitmap({key: condition}), len(self))
+            else:
+                raise ValueError('unsupported filter: %s' % key)
+        return mask
+
+    def _any(self, clauses):
+        mask = numpy.zeros(len(self), dtype=bool)
+        for clause in clauses:
+            mask |= self.mask(clause)
+        return mask
+
+    def _text_mask(self, condition):
+        if not isinstance(condition, dict) or \
+                not isinstance(condition.get('$search'), str):
+            raise ValueError('unsupported filter: $text')
+        matches = self.search_index.search(
+            condition['$search'], limit=len(self.search_index))
+        return numpy.isin(
+            self.columns['reuters_id'][0], [_ for _, _score in matches])
+
+    def _order(self, positions, sort):
+        """
+        :param positions: positions of documents, in ascending order
+        :param sort: list of (field, direction) pairs, or dict
+        :returns: positions sorted by the fields, in the order of documents
+          for equal values
+        :rtype: numpy.ndarray
+        """
+        if isinstance(sort, dict):
+            sort = sort.items()
+        keys = []
+        for field, direction in reversed(list(sort)):
+            if field not in self.columns:
+                raise ValueError('unsupported sort: %s' % field)
+            values = self.columns[field][0][positions].astype('int64')
+            keys.append(values if direction == 1 else -values)
+        return positions[numpy.lexsort(keys)] if keys else positions
+
+    def _document(self, position, projection):
+        doc = self.documents[position].as_dict()
+        # datetimes are timezone-aware, as returned by Eve's MongoDB clients
+        doc['datetime'] = doc['datetime'].replace(tzinfo=timezone.utc)
+        return project(
+            dict(_id=document_id(doc['reuters_id']), **doc), projection)
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0,
+             **kwargs):
+        """
+        :returns: documents matching the filter, see
+          pymongo.collection.Collection.find()
+        :rtype: instance of Cursor
+        :raises ValueError: if the filter or the sort is not supported
+        """
+        positions = numpy.flatnonzero(self.mask(filter))
+        if sort:
+            positions = self._order(positions, sort)
+        positions = positions[skip:skip + limit if limit else None]
+        return Cursor(
+            self._document(_, projection) for _ in positions.tolist())
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        return next(self.find(filter, projection, limit=1), None)
+
+    def count_documents(self, filter, **kwargs):
+        return int(numpy.count_nonzero(self.mask(filter)))
+
+
+def _aggregate(items, pipeline):
+    """
+    :param items: documents as dicts
+    :param pipeline: MongoDB aggregation pipeline, made of $sort, $skip,
+      $limit, $count and $facet stages
+    :returns: results of the pipeline
+    :rtype: list
+    :raises ValueError: if a stage is not supported
+    """
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$sort':
+            for field, direction in reversed(list(spec.items())):
+                items = sorted(
+                    items, key=operator.itemgetter(field),
+                    reverse=direction == -1)
+        elif name == '$skip':
+            items = items[spec:]
+        elif name == '$limit':
+            items = items[:spec]
+        elif name == '$count':
+            items = [{spec: len(items)}]
+        elif name == '$facet':
+            items = [{
+                key: _aggregate(items, stages)
+                for key, stages in spec.items()}]
+        else:
+            raise ValueError('unsupported stage: %s' % name)
+    return items
+
+
+class ValueCollection():
+    """
+    Values of a vocabulary, as documents with the value as _id and the
+    number of documents having it as count, queried as a pymongo
+    collection.
+    """
+
+    def __init__(self, counts):
+        """
+        :param counts: number of documents by value
+        """
+        self.items = [
+            {'_id': value, 'count': count}
+            for value, count in sorted(counts.items()) if count > 0]
+
+    def find(self, filter=None, projection=None, sort=None, **kwargs):
+        if filter:
+            raise ValueError('unsupported filter: %s' % ', '.join(filter))
+        items = [dict(_) for _ in self.items]
+        if sort:
+            items = _aggregate(items, [{'$sort': dict(sort)}])
+        return Cursor(items)
+
+    def aggregate(self, pipeline, **kwargs):
+        return Cursor(_aggregate([dict(_) for _ in self.items], pipeline))
+
+
+def build_database(documents, categories, time_index, search_index=None):
+    """
+    :param documents: sequence of documents, see DocumentCollection
+    :param categories: instance of CategoryIndex over the documents
+    :param time_index: instance of TimeIndex over the documents
+    :param search_index: instance of SearchIndex of the documents, built
+      from them if not given
+    :returns: collections by name, as named in MongoDB
+    :rtype: dict
+    """
+    if search_index is None:
+        search_index = SearchIndex.build(documents)
+    counter = VocabularyCounter()
+    fields = list(settings.VOCABULARIES.values())
+    for doc in documents:
+        counter.add(doc.as_dict(fields))
+    database = {
+        settings.VOCABULARY_COLLECTION_PREFIX + name: ValueCollection(counts)
+        for name, counts in counter.deltas.items()}
+    database[DOCS_COLLECTION_NAME] = DocumentCollection(
+        documents, categories, time_index, search_index)
+    return database
+
+
+class Embedded(Mongo):
+    """
+    Eve's data layer reading collections built in memory instead of
+    MongoDB ones.
+
+    Configuration is read from application's config:
+      EMBEDDED_DATA: directory of .sgm files, or snapshot file
+      EMBEDDED_SEARCH_INDEX: search index file built by search.py, the
+        index is built from documents when they are loaded if not set
+    """
+
+    def init_app(self, app):
+        super().init_app(app)
+        self._source = None
+        self._corpus = None
+        self._database = None
+        self._loads = 0
+
+    @property
+    def database(self):
+        """
+        Collections built from the configured data, on first use, and
+        rebuilt when data files change.
+
+        :rtype: dict
+        """
+        config = self.app.config
+        source = (config['EMBEDDED_DATA'], config.get('EMBEDDED_SEARCH_INDEX'))
+        if source != self._source:
+            self._source, self._database = source, None
+            self._corpus = Corpus(source[0]) \
+                if os.path.isdir(source[0]) else None
+        if self._corpus is not None:
+            records, categories = self._corpus.index
+            if self._database is None or \
+                    self._database[DOCS_COLLECTION_NAME].documents \
+                    is not records:
+                self._load(records, categories, self._corpus.time_index)
+        elif self._database is None:
+            snapshot = Snapshot(source[0])
+            self._load(snapshot, CategoryIndex(snapshot), snapshot.time_index)
+        return self._database
+
+    def _load(self, documents, categories, time_index):
+        search_path = self._source[1]
+        self._database = build_database(
+            documents, categories, time_index,
+            SearchIndex.load(search_path) if search_path else None)
+        self._loads += 1
+
+    def generation(self):
+        """
+        :returns: number of times data was loaded, which tells cached
+          responses and totals apart
+        :rtype: int
+        """
+        self.database
+        return self._loads
+
+    def pymongo(self, resource=None, prefix=None):
+        return SimpleNamespace(db=self.database)
+
+    def find(self, resource, req, sub_resource_lookup, perform_count=True):
+        try:
+            return super().find(
+                resource, req, sub_resource_lookup, perform_count)
+        except ValueError as exc:
+            abort(400, description=str(exc))
+
+
+def not_implemented(**kwargs):
+    """
+    View of the endpoints listed in UNSUPPORTED_VIEWS.
+    """
+    abort(501, description='Not served without MongoDB: %s' % request.path)
+
+
+for endpoint, rule in UNSUPPORTED_VIEWS.items():
+    unsupported_views.add_url_rule(rule, endpoint, not_implemented)
+
+
+def collapse_unsupported(req, lookup):
+    """
+    on_pre_GET_documents hook rejecting the collapse parameter (see
+    views.collapse_filter()), as near-duplicates are not detected here.
+    """
+    if request.args.get('collapse') == '1':
+        abort(501, description='collapse is not served without MongoDB')
+
+
+main = Eve(data=Embedded)
+# registered first, so that time spent by other extensions is accounted
+metrics = Metrics(main)
+main.register_blueprint(unsupported_views)
+main.on_pre_GET_documents += time_range_filter
+main.on_pre_GET_documents += collapse_unsupported
+main.data.track_generation(main.data.generation)
+response_cache = ResponseCache(main, generation=main.data.generation)
+
+if __name__ == '__main__':
+    # documents are loaded before the first request
+    main.data.database
+    main.run()
@@ -1,43 +1,922 @@
 import argparse
+import hashlib
+import os
 import pymongo
+import pymongo.errors
+import queue
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.write_concern import WriteConcern
 
 import settings
-from data_browser import DataBrowser
+from data_browser import FALLBACK_ENCODING, DataBrowser
+from duplicates import LSHIndex, from_bytes, signature_fields
+from rollups import (
+    TimeseriesCounter, VocabularyCounter, count_buckets_stages,
+    count_values_stages, ensure_timeseries_indexes)
+from settings import DOCS_COLLECTION_NAME
+
+MANIFEST_COLLECTION_NAME = 'import_manifest'
+
+# error code of MongoDB reported on unique index violation
+DUPLICATE_KEY_ERROR = 11000
+
+# number of documents sent to the database in a single insert
+DEFAULT_BATCH_SIZE = 1000
+
+# number of batches parsed ahead of the database writer
+DEFAULT_QUEUE_SIZE = 4
+
+# size of the chunks read when computing checksums of data files
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_file(filename):
+    """
+    Parse a single data file. Runs in worker processes when importing
+    with several workers, so it must only return picklable values.
+
+    :param filename: path to data file
+    :returns: filename, documents as dicts along with the signature of
+      their body (see duplicates.py), error message (or None) and number of
+      documents which were not valid UTF-8
+    :rtype: tuple
+    """
+    data = DataBrowser(filename)
+    docs = []
+    try:
+        # documents are parsed incrementally, so that memory usage
+        # does not depend on the size of the data file
+        for record in data.iter_records():
+            doc = record.as_dict()
+            doc.update(signature_fields(record.text.body))
+            docs.append(doc)
+    except OSError as exc:
+        return filename, [], str(exc), 0
+    return filename, docs, None, data.repaired
+
+
+def parse_files(filenames, workers=1):
+    """
+    Parse data files, in a pool of worker processes if more than one worker
+    is requested. Results are yielded in the order of filenames as soon as
+    they are available. At most one file more than the number of workers is
+    parsed ahead of the consumer, so that parsed files don't pile up in
+    memory when writing is slower than parsing.
+
+    :param filenames: paths to data files
+    :param workers: number of worker processes
+    :rtype: generator of tuples as returned by parse_file()
+    """
+    if workers <= 1:
+        yield from map(parse_file, filenames)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            for filename in filenames:
+                pending.append(executor.submit(parse_file, filename))
+                if len(pending) > workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # files not consumed yet when the generator is closed
+            for future in pending:
+                future.cancel()
+
+
+class StageStats():
+    """
+    Throughput of a single stage of the import pipeline.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: name of the stage
+        """
+        self.name = name
+        self.documents = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        """
+        :returns: processed documents per second
+        :rtype: float
+        """
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return '%s: %d documents in %.2fs (%.0f docs/sec)' % (
+            self.name, self.documents, self.seconds, self.rate)
+
+
+class BulkLoader():
+    """
+    Loads parsed documents into a collection in fixed-size unordered
+    batches. Parsing runs in a separate thread and hands batches to the
+    database writer through a bounded queue, so that parsing and writing
+    overlap while memory usage stays bounded.
+    """
+    _DONE = object()
+
+    # seconds between checks whether the writer stopped while the queue
+    # is full
+    _POLL_INTERVAL = 0.1
+
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE,
+                 queue_size=DEFAULT_QUEUE_SIZE, write_concern=None,
+                 upsert=False, counters=()):
+        """
+        :param collection: target collection (instance of
+          pymongo.collection.Collection)
+        :param batch_size: number of documents per insert
+        :param queue_size: number of batches parsed ahead of the writer
+        :param write_concern: instance of pymongo.write_concern.WriteConcern
+          used for inserts, e.g. a relaxed one for bulk loads; collection's
+          write concern is used if not specified
+        :param upsert: replace documents having the same reuters_id instead
+          of inserting duplicates
+        :param counters: objects accounting written (and replaced)
+          documents, with add(), remove() and the projection of fields they
+          read, e.g. instances of VocabularyCounter, TimeseriesCounter or
+          ChangedGroups
+        """
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
+        self.collection = collection
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.counters = counters
+        # data files whose documents are all written, and reuters_id of
+        # documents of every parsed data file
+        self.imported_files = []
+        self.reuters_ids = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self.parse_stats = StageStats('parse')
+        self.write_stats = StageStats('write')
+
+    def load(self, parsed_files):
+        """
+        :param parsed_files: iterable of tuples as returned by parse_file(),
+          consumed in a separate thread
+        :returns: number of documents written
+        :rtype: int
+        """
+        self._stopped.clear()
+        producer = threading.Thread(
+            target=self._produce, args=(parsed_files,), daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                batch, completed_files = item
+                if batch:
+                    started = time.perf_counter()
+                    try:
+                        self._write(batch)
+                    finally:
+                        self.write_stats.seconds += \
+                            time.perf_counter() - started
+                self.imported_files.extend(completed_files)
+        finally:
+            # the producer may be waiting for room in the queue if writing
+            # failed
+            self._stopped.set()
+            producer.join()
+        return self.write_stats.documents
+
+    def _write(self, batch):
+        """
+        Write a batch, and account the documents which were written (and
+        the ones they replaced), even if writing others failed.
+
+        :param batch: list of documents to write
+        """
+        replaced = {}
+        if self.counters and self.upsert:
+            projection = {'reuters_id': 1}
+            for counter in self.counters:
+                projection.update(counter.projection)
+            replaced = {
+                doc['reuters_id']: doc for doc in self.collection.find(
+                    {'reuters_id': {'$in': [_['reuters_id'] for _ in batch]}},
+                    projection=projection)}
+        try:
+            if self.upsert:
+                self.collection.bulk_write([
+                    ReplaceOne(
+                        {'reuters_id': doc['reuters_id']}, doc, upsert=True)
+                    for doc in batch], ordered=False)
+            else:
+                self.collection.insert_many(batch, ordered=False)
+        except pymongo.errors.BulkWriteError as exc:
+            failed = {_['index'] for _ in exc.details['writeErrors']}
+            self._account(
+                [doc for index, doc in enumerate(batch)
+                 if index not in failed], replaced)
+            raise
+        self._account(batch, replaced)
+
+    def _account(self, written, replaced):
+        """
+        :param written: documents written
+        :param replaced: documents replaced by written ones, by reuters_id
+        """
+        self.write_stats.documents += len(written)
+        for doc in written:
+            old_doc = replaced.get(doc['reuters_id'])
+            if self.upsert:
+                # a later document of the batch replaces this one
+                replaced[doc['reuters_id']] = doc
+            for counter in self.counters:
+                if old_doc is not None:
+                    counter.remove(old_doc)
+                counter.add(doc)
+
+    def _put(self, item):
+        """
+        Put an item into the queue, waiting for room unless the writer
+        stopped.
+
+        :returns: whether the item was put
+        :rtype: bool
+        """
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=self._POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, parsed_files):
+        """
+        Split parsed documents into batches and put them into the queue,
+        until parsed files are exhausted or the writer stops. Every batch is
+        put along with the data files whose last documents were in earlier
+        batches or in this one. Time spent waiting for the writer is not
+        accounted to parsing.
+        """
+        parsed_files = iter(parsed_files)
+        try:
+            batch = []
+            completed_files = []
+            while True:
+                started = time.perf_counter()
+                parsed_file = next(parsed_files, None)
+                self.parse_stats.seconds += time.perf_counter() - started
+                if parsed_file is None:
+                    break
+                filename, docs, error, repaired = parsed_file
+                print('importing data from ' + filename)
+                if repaired:
+                    print(
+                        'decoded %d documents of %s as %s' % (
+                            repaired, filename, FALLBACK_ENCODING),
+                        file=sys.stderr)
+                if error is not None:
+                    print(
+                        'error parsing data file (%s): %s' % (filename, error),
+                        file=sys.stderr)
+                    continue
+                self.parse_stats.documents += len(docs)
+                self.reuters_ids[filename] = [_['reuters_id'] for _ in docs]
+                for doc in docs:
+                    batch.append(doc)
+                    if len(batch) == self.batch_size:
+                        if not self._put((batch, completed_files)):
+                            return
+                        batch, completed_files = [], []
+                completed_files.append(filename)
+            if (batch or completed_files) and \
+                    not self._put((batch, completed_files)):
+                return
+            self._put(self._DONE)
+        except BaseException as exc:
+            self._put(exc)
+        finally:
+            # e.g. cancels files parsed ahead by worker processes
+            close = getattr(parsed_files, 'close', None)
+            if close is not None:
+                close()
+
+
+def rebuild_timeseries(mongo_db):
+    """
+    Recompute timeseries collections from the whole documents collection.
+
+    :param mongo_db: instance of pymongo.database.Database
+    """
+    # overall counts are stored with None as vocabulary name
+    fields = [(None, None)] + list(settings.VOCABULARIES.items())
+    for bucket in settings.TIMESERIES_BUCKETS:
+        collection_name = settings.TIMESERIES_COLLECTION_PREFIX + bucket
+        print('rebuilding %s collection' % collection_name)
+        counts = []
+        for name, field in fields:
+            for count in mongo_db[DOCS_COLLECTION_NAME].aggregate(
+                    count_buckets_stages(bucket, field)):
+                count['by'] = name
+                count.setdefault('value', None)
+                counts.append(count)
+        mongo_db.drop_collection(collection_name)
+        ensure_timeseries_indexes(mongo_db[collection_name])
+        if counts:
+            mongo_db[collection_name].insert_many(counts)
+
+
+def drop_timeseries(mongo_db):
+    """
+    :param mongo_db: instance of pymongo.database.Database
+    """
+    for bucket in settings.TIMESERIES_BUCKETS:
+        mongo_db.drop_collection(
+            settings.TIMESERIES_COLLECTION_PREFIX + bucket)
+
+
+def rebuild_vocabularies(mongo_db):
+    """
+    Recompute vocabulary collections from the whole documents collection.
+
+    :param mongo_db: instance of pymongo.database.Database
+    """
+    for name, field in settings.VOCABULARIES.items():
+        collection_name = settings.VOCABULARY_COLLECTION_PREFIX + name
+        print('rebuilding %s collection' % collection_name)
+        values = mongo_db[DOCS_COLLECTION_NAME].aggregate(
+            count_values_stages(field))
+        mongo_db.drop_collection(collection_name)
+        values = list(values)
+        if values:
+            mongo_db[collection_name].insert_many(values)
+
+
+def drop_vocabularies(mongo_db):
+    """
+    :param mongo_db: instance of pymongo.database.Database
+    """
+    for name in settings.VOCABULARIES:
+        mongo_db.drop_collection(settings.VOCABULARY_COLLECTION_PREFIX + name)
+
+
+class ChangedGroups():
+    """
+    Accumulates documents written and deleted by an import, along with the
+    groups of near-duplicates they belonged to, so that only these groups
+    are marked again by mark_duplicates(). Documents are accounted by
+    BulkLoader and remove_documents() along with rollup counters.
+    """
+
+    projection = {'reuters_id': 1, 'duplicate_of': 1}
+
+    def __init__(self):
+        self.reuters_ids = set()
+        # reuters_id of the earliest document of every group
+        self.groups = set()
+
+    def add(self, doc):
+        """
+        :param doc: document as dict added to the collection
+        """
+        self.reuters_ids.add(doc['reuters_id'])
+
+    def remove(self, doc):
+        """
+        :param doc: document as dict removed from the collection
+        """
+        self.reuters_ids.add(doc['reuters_id'])
+        self.groups.add(doc.get('duplicate_of') or doc['reuters_id'])
+
+
+def sign_documents(collection):
+    """
+    Store signatures of documents imported by older versions of the
+    importer, which scans the whole collection.
+
+    :param collection: documents collection (instance of
+      pymongo.collection.Collection)
+    """
+    signed = []
+    for doc in collection.find(
+            {'minhash': {'$exists': False}, 'text.body': {'$exists': True}},
+            projection={'text.body': 1}):
+        fields = signature_fields(doc['text']['body'])
+        if fields:
+            signed.append(UpdateOne({'_id': doc['_id']}, {'$set': fields}))
+    if signed:
+        collection.bulk_write(signed, ordered=False)
+
+
+def mark_duplicates(mongo_db, changed=None,
+                    threshold=settings.DUPLICATES_THRESHOLD):
+    """
+    Mark near-duplicates of earlier documents (see duplicates.py) with the
+    reuters_id of the earliest one in their duplicate_of field, and unmark
+    documents which are no longer near-duplicates.
+
+    Given changed documents, only the groups they join or leave are marked
+    again: their candidates are looked up by band keys (lsh index), and
+    compared along with the other documents of their groups. Documents are
+    signed when they are parsed; documents imported by older versions are
+    only signed when marking the whole collection.
+
+    :param mongo_db: instance of pymongo.database.Database
+    :param changed: instance of ChangedGroups, None to mark near-duplicates
+      among the whole collection
+    :param threshold: minimum similarity of near-duplicates
+    :returns: reuters_id of the earliest document by reuters_id of its
+      near-duplicates, among compared documents
+    :rtype: dict
+    """
+    collection = mongo_db[DOCS_COLLECTION_NAME]
+    if changed is None:
+        sign_documents(collection)
+    spec = {'minhash': {'$exists': True}}
+    # looking candidates up costs more than comparing all documents once
+    # most of them changed
+    if changed is not None and len(changed.reuters_ids) * 2 < \
+            collection.estimated_document_count():
+        reuters_ids = set(changed.reuters_ids)
+        groups = set(changed.groups)
+        docs = list(collection.find(
+            {'reuters_id': {'$in': sorted(reuters_ids)}},
+            projection={'_id': 0, 'lsh': 1}))
+        band_keys = sorted({key for doc in docs for key in doc.get('lsh', ())})
+        if band_keys:
+            for doc in collection.find(
+                    {'lsh': {'$in': band_keys}},
+                    projection={'_id': 0, 'reuters_id': 1, 'duplicate_of': 1}):
+                reuters_ids.add(doc['reuters_id'])
+                groups.add(doc.get('duplicate_of') or doc['reuters_id'])
+        groups = sorted(groups)
+        spec = {'$and': [spec, {'$or': [
+            {'reuters_id': {'$in': sorted(reuters_ids.union(groups))}},
+            {'duplicate_of': {'$in': groups}}]}]}
+    index = LSHIndex()
+    marked = {}
+    for doc in collection.find(
+            spec, projection={
+                '_id': 0, 'reuters_id': 1, 'minhash': 1, 'duplicate_of': 1}):
+        index.add(doc['reuters_id'], from_bytes(doc['minhash']))
+        if doc.get('duplicate_of') is not None:
+            marked[doc['reuters_id']] = doc['duplicate_of']
+    duplicates = index.duplicates(threshold)
+    requests = [
+        UpdateOne({'reuters_id': reuters_id},
+                  {'$set': {'duplicate_of': original}})
+        for reuters_id, original in duplicates.items()
+        if marked.get(reuters_id) != original]
+    requests.extend(
+        UpdateOne({'reuters_id': reuters_id}, {'$unset': {'duplicate_of': ''}})
+        for reuters_id in marked if reuters_id not in duplicates)
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+    print('%d near-duplicates of %d documents marked among %d compared '
+          'documents' % (
+              len(duplicates), len(set(duplicates.values())), len(index)))
+    return duplicates
+
+
+def remove_documents(collection, reuters_ids, counters=()):
+    """
+    :param collection: documents collection (instance of
+      pymongo.collection.Collection)
+    :param reuters_ids: reuters_id of the documents to delete
+    :param counters: objects accounting deleted documents, see BulkLoader
+    :returns: number of deleted documents
+    :rtype: int
+    """
+    if not reuters_ids:
+        return 0
+    spec = {'reuters_id': {'$in': sorted(reuters_ids)}}
+    if counters:
+        projection = {'_id': 0}
+        for counter in counters:
+            projection.update(counter.projection)
+        for doc in collection.find(spec, projection=projection):
+            for counter in counters:
+                counter.remove(doc)
+    return collection.delete_many(spec).deleted_count
+
+
+def file_checksum(filename):
+    """
+    :param filename: path to data file
+    :returns: hex digest of the file's content
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f_obj:
+        for chunk in iter(lambda: f_obj.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImportManifest():
+    """
+    Keeps track of imported data files (path, size and content checksum)
+    in a collection, so that unchanged files can be skipped on re-import.
+    """
+
+    def __init__(self, collection):
+        """
+        :param collection: manifest collection (instance of
+          pymongo.collection.Collection)
+        """
+        self.collection = collection
+        self._pending = {}
+        self._previous = {}
+
+    def changed(self, filenames):
+        """
+        :param filenames: paths to data files
+        :returns: paths to data files that are not imported yet or changed
+          since they were imported
+        :rtype: list
+        """
+        imported = {
+            entry['_id']: entry for entry in self.collection.find(
+                {'_id': {'$in': [os.path.abspath(_) for _ in filenames]}})}
+        changed = []
+        for filename in filenames:
+            path = os.path.abspath(filename)
+            entry = {
+                'size': os.path.getsize(filename),
+                'sha256': file_checksum(filename),
+            }
+            self._pending[filename] = dict(entry, _id=path)
+            previous = imported.get(path)
+            if previous is not None:
+                self._previous[filename] = previous
+            if previous is not None and \
+                    previous['size'] == entry['size'] and \
+                    previous['sha256'] == entry['sha256']:
+                continue
+            changed.append(filename)
+        return changed
+
+    def update(self, filenames, reuters_ids=None):
+        """
+        Record data files as imported.
+
+        :param filenames: paths to successfully imported data files
+        :param reuters_ids: reuters_id of documents by path of data file,
+          recorded so that documents removed from the file can be deleted
+          when it is imported again (see stale_ids())
+        """
+        for filename in filenames:
+            entry = self._pending.pop(filename, None)
+            if entry is None:
+                entry = {
+                    '_id': os.path.abspath(filename),
+                    'size': os.path.getsize(filename),
+                    'sha256': file_checksum(filename),
+                }
+            if reuters_ids is not None and filename in reuters_ids:
+                entry['reuters_ids'] = reuters_ids[filename]
+            self.collection.replace_one(
+                {'_id': entry['_id']}, entry, upsert=True)
+
+    def stale_ids(self, reuters_ids):
+        """
+        :param reuters_ids: reuters_id of documents by path of data file
+          imported again, checked by changed() before
+        :returns: reuters_id of documents recorded for these files when they
+          were imported before, which none of them holds anymore; files
+          recorded by older versions of the importer have no documents
+          recorded
+        :rtype: set
+        """
+        previous = set()
+        for filename in reuters_ids:
+            previous.update(
+                self._previous.get(filename, {}).get('reuters_ids', ()))
+        return previous.difference(*reuters_ids.values())
+
+
+# example queries from README.md, checked for index coverage by
+# --ensure-indexes
+README_QUERIES = [
+    {"reuters_id": 10},
+    {"text.author": "Yuko Nakamikado"},
+    {"$and": [{"topics": "corn"}, {"places": "usa"}]},
+    {"$or": [{"topics": "coffee"}, {"topics": "cocoa"}]},
+    {"$text": {"$search": "food coffee"}},
+    {"$text": {"$search": "\"new zealand\""}},
+    {"places": "canada"},
+    # start and end parameters of the documents resource
+    {"datetime": {"$gte": "Thu, 26 Feb 1987 16:00:00 GMT",
+                  "$lt": "Thu, 26 Feb 1987 17:00:00 GMT"}},
+]
+
+
+def _index_matches(info, spec):
+    """
+    :param info: index description as returned by index_information()
+    :param spec: index specification from settings.DOCUMENTS_INDEXES
+    :returns: whether the existing index matches the specification
+    :rtype: bool
+    """
+    options = spec.get('options', {})
+    if bool(info.get('unique')) != bool(options.get('unique')):
+        return False
+    text_fields = [
+        field for field, direction in spec['keys']
+        if direction == pymongo.TEXT]
+    if text_fields and 'weights' in info:
+        # text indexes are reported with internal keys, indexed fields are
+        # the keys of their weights
+        return info['weights'] == options.get(
+            'weights', dict.fromkeys(text_fields, 1)) and \
+            info.get('default_language') == options.get(
+                'default_language', 'english')
+    return [tuple(_) for _ in info['key']] == spec['keys']
+
+
+def _is_text_index(info):
+    """
+    :param info: index description as returned by index_information()
+    :rtype: bool
+    """
+    return 'weights' in info or any(
+        direction == pymongo.TEXT for _, direction in info['key'])
+
+
+def verify_indexes(collection, specs=None):
+    """
+    :param collection: instance of pymongo.collection.Collection
+    :param specs: index specifications, settings.DOCUMENTS_INDEXES
+      by default
+    :returns: names of specified indexes that are missing or differ from
+      their specification
+    :rtype: list
+    """
+    if specs is None:
+        specs = settings.DOCUMENTS_INDEXES
+    existing = collection.index_information()
+    return [
+        spec['name'] for spec in specs
+        if spec['name'] not in existing or
+        not _index_matches(existing[spec['name']], spec)]
+
+
+def ensure_indexes(collection, specs=None):
+    """
+    Create indexes according to their specifications. Existing indexes
+    with the same name or keys but different definition are replaced, as
+    well as any other text index (a collection has at most one). Called
+    once all data is imported, which is much faster than maintaining
+    indexes during inserts. Exits if a unique index can't be created
+    because of duplicate documents.
+
+    :param collection: instance of pymongo.collection.Collection
+    :param specs: index specifications, settings.DOCUMENTS_INDEXES
+      by default
+    """
+    if specs is None:
+        specs = settings.DOCUMENTS_INDEXES
+    for name in verify_indexes(collection, specs):
+        spec = next(_ for _ in specs if _['name'] == name)
+        text = any(direction == pymongo.TEXT for _, direction in spec['keys'])
+        for existing_name, info in collection.index_information().items():
+            if existing_name == name or existing_name != '_id_' and (
+                    [tuple(_) for _ in info['key']] == spec['keys'] or
+                    text and _is_text_index(info)):
+                print('dropping outdated index ' + existing_name)
+                collection.drop_index(existing_name)
+        print('creating index ' + name)
+        try:
+            collection.create_index(
+                spec['keys'], name=name, **spec.get('options', {}))
+        except pymongo.errors.OperationFailure as exc:
+            if exc.code != DUPLICATE_KEY_ERROR:
+                raise
+            print(
+                'cannot create unique index %s, the collection holds '
+                'duplicate documents (e.g. imported more than once by an '
+                'older version): import them again with --drop-collection '
+                'option' % name, file=sys.stderr)
+            sys.exit(1)
+
+
+def query_covered(query, specs=None):
+    """
+    Tell whether an index can serve a query, i.e. if it filters on the
+    first key of one of the indexes (any clause of $and, every clause of
+    $or), or is a text search and there is a text index.
+
+    :param query: query as passed in the where parameter of the API
+    :param specs: index specifications, settings.DOCUMENTS_INDEXES
+      by default
+    :rtype: bool
+    """
+    if specs is None:
+        specs = settings.DOCUMENTS_INDEXES
+    prefixes = set(spec['keys'][0][0] for spec in specs)
+    has_text = any(
+        direction == pymongo.TEXT
+        for spec in specs for _, direction in spec['keys'])
+    for field, condition in query.items():
+        if field == '$and' and \
+                any(query_covered(_, specs) for _ in condition):
+            return True
+        if field == '$or' and \
+                all(query_covered(_, specs) for _ in condition):
+            return True
+        if field == '$text' and has_text:
+            return True
+        if field in prefixes:
+            return True
+    return False
+
+
+def report_query_coverage(queries=README_QUERIES, specs=None):
+    """
+    Print which queries are served by an index.
+
+    :param queries: queries to check
+    :param specs: index specifications, settings.DOCUMENTS_INDEXES
+      by default
+    :returns: queries not served by any index
+    :rtype: list
+    """
+    uncovered = []
+    for query in queries:
+        covered = query_covered(query, specs)
+        if not covered:
+            uncovered.append(query)
+        print('%s: %s' % ('indexed' if covered else 'NOT INDEXED', query))
+    return uncovered
+
+
+def bump_generation(mongo_db):
+    """
+    Increment the generation of imported data, which invalidates cached
+    API responses.
+
+    :param mongo_db: instance of pymongo.database.Database
+    """
+    mongo_db[settings.META_COLLECTION_NAME].update_one(
+        {'_id': 'generation'}, {'$inc': {'value': 1}}, upsert=True)
 
-DOCS_COLLECTION_NAME = 'documents'
 
 def main():
     parser = argparse.ArgumentParser(
         description='Import Reuters text collection into MongoDB.')
     parser.add_argument(
-        'paths', metavar='path', nargs='+',
+        'paths', metavar='path', nargs='*',
         help='path to the file whose data that needs to be parsed and imported')
     parser.add_argument(
         '--drop-collection', action='store_true', default=False,
         help='drop Documents collection in the database before importing')
+    parser.add_argument(
+        '--workers', type=int, default=1, metavar='N',
+        help='number of processes parsing data files in parallel')
+    parser.add_argument(
+        '--batch-size', type=int, default=DEFAULT_BATCH_SIZE, metavar='N',
+        help='number of documents inserted into the database at once')
+    parser.add_argument(
+        '--write-concern', type=int, default=None, metavar='W',
+        help='write concern (w) for inserts, e.g. 0 to not wait for '
+             'acknowledgement during bulk loads')
+    parser.add_argument(
+        '--incremental', action='store_true', default=False,
+        help='skip data files that are unchanged since they were imported, '
+             'and replace documents of changed ones by their reuters_id')
+    parser.add_argument(
+        '--rebuild-vocabularies', action='store_true', default=False,
+        help='recompute vocabulary collections from the whole Documents '
+             'collection')
+    parser.add_argument(
+        '--rebuild-timeseries', action='store_true', default=False,
+        help='recompute timeseries collections from the whole Documents '
+             'collection')
+    parser.add_argument(
+        '--rebuild-duplicates', action='store_true', default=False,
+        help='mark near-duplicates among the whole Documents collection '
+             'again, e.g. once DUPLICATES_THRESHOLD is changed')
+    parser.add_argument(
+        '--ensure-indexes', action='store_true', default=False,
+        help='create missing indexes of Documents collection, verify them '
+             'and report which example queries they serve')
     args = parser.parse_args()
+    if not args.paths and not (
+            args.rebuild_vocabularies or args.rebuild_timeseries or
+            args.rebuild_duplicates or args.ensure_indexes):
+        parser.error('at least one path is required')
     mongo_con = pymongo.MongoClient(settings.MONGO_HOST)
     mongo_db = mongo_con[settings.MONGO_DBNAME]
     if args.drop_collection and \
             DOCS_COLLECTION_NAME in mongo_db.list_collection_names():
         print('dropping existing %s collection' % DOCS_COLLECTION_NAME)
         mongo_db.drop_collection(DOCS_COLLECTION_NAME)
-    for filename in sorted(args.paths):
-        print('importing data from ' + filename)
-        data = DataBrowser(filename)
-        try:
-            docs = data.documents
-        except UnicodeDecodeError as exc:
-            print(
-                'error parsing data file (%s): %s' % (filename, exc),
-                file=sys.stderr)
-        mongo_db.documents.insert_many(_.as_dict() for _ in docs)
-    # creating full text search index
-    mongo_db[DOCS_COLLECTION_NAME].create_index(
-        [('text.title', pymongo.TEXT), ('text.body', pymongo.TEXT)],
-        name='search_index_for_text_title_and_body',
-        default_language='english')
+    if args.drop_collection:
+        mongo_db.drop_collection(MANIFEST_COLLECTION_NAME)
+        drop_vocabularies(mongo_db)
+        drop_timeseries(mongo_db)
+    try:
+        if args.paths:
+            import_files(mongo_db, sorted(args.paths), args)
+        if args.rebuild_vocabularies:
+            rebuild_vocabularies(mongo_db)
+        if args.rebuild_timeseries:
+            rebuild_timeseries(mongo_db)
+        if args.rebuild_duplicates:
+            mark_duplicates(mongo_db)
+    finally:
+        if args.drop_collection or args.paths or \
+                args.rebuild_vocabularies or args.rebuild_timeseries or \
+                args.rebuild_duplicates:
+            bump_generation(mongo_db)
+    if args.ensure_indexes:
+        collection = mongo_db[DOCS_COLLECTION_NAME]
+        ensure_indexes(collection)
+        invalid = verify_indexes(collection)
+        uncovered = report_query_coverage()
+        if invalid:
+            print('invalid indexes: ' + ', '.join(invalid), file=sys.stderr)
+        if invalid or uncovered:
+            sys.exit(1)
+
+
+def import_files(mongo_db, paths, args):
+    """
+    :param mongo_db: instance of pymongo.database.Database
+    :param paths: paths to data files
+    :param args: parsed command line arguments
+    :returns: loader the documents were imported with, holding throughput
+      statistics
+    :rtype: instance of BulkLoader
+    """
+    manifest = ImportManifest(mongo_db[MANIFEST_COLLECTION_NAME])
+    if args.incremental:
+        changed = manifest.changed(paths)
+        for filename in paths:
+            if filename not in changed:
+                print('skipping unchanged data file ' + filename)
+        paths = changed
+        # upserts look documents up by reuters_id
+        ensure_indexes(mongo_db[DOCS_COLLECTION_NAME])
+    write_concern = None
+    if args.write_concern is not None:
+        write_concern = WriteConcern(w=args.write_concern)
+    # rollup counters are saved once documents are written, changed groups
+    # of near-duplicates marked again once indexes are ensured
+    counters = (VocabularyCounter(), TimeseriesCounter())
+    changed_groups = ChangedGroups()
+    accounts = counters + (changed_groups,)
+    loader = BulkLoader(
+        mongo_db[DOCS_COLLECTION_NAME], batch_size=args.batch_size,
+        write_concern=write_concern, upsert=args.incremental,
+        counters=accounts)
+    conflict = False
+    removed = 0
+    try:
+        loader.load(parse_files(paths, args.workers))
+    except pymongo.errors.BulkWriteError as exc:
+        if not any(_['code'] == DUPLICATE_KEY_ERROR
+                   for _ in exc.details['writeErrors']):
+            raise
+        conflict = True
+    finally:
+        # documents written before a failure are accounted, and data files
+        # whose documents are all written are recorded
+        reuters_ids = {_: loader.reuters_ids[_] for _ in loader.imported_files}
+        if args.incremental:
+            # documents removed from changed data files
+            removed = remove_documents(
+                mongo_db[DOCS_COLLECTION_NAME],
+                manifest.stale_ids(reuters_ids), accounts)
+            if removed:
+                print('%d documents removed from changed data files'
+                      % removed)
+        for counter in counters:
+            counter.save(mongo_db)
+        manifest.update(loader.imported_files, reuters_ids)
+    print(loader.parse_stats)
+    print(loader.write_stats)
+    ensure_indexes(mongo_db[DOCS_COLLECTION_NAME])
+    if changed_groups.reuters_ids:
+        # updates look documents up by reuters_id, candidates by band keys
+        mark_duplicates(mongo_db, changed_groups)
+    if conflict:
+        print(
+            'documents are already imported, use --incremental or '
+            '--drop-collection option to import them again',
+            file=sys.stderr)
+        sys.exit(1)
+    return loader
 
 if __name__ == '__main__':
     main()
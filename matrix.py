@@ -0,0 +1,283 @@
+"""
+Bag-of-words term-document matrix of the Reuters text collection, along with
+label matrices of categories and split attributes of documents, for
+training and evaluating classifiers without parsing data files again.
+
+Bodies of documents are tokenized batch by batch: words of a batch are
+mapped to term ids and counted per document with array operations, so that
+no Python code runs per word. Terms are sorted once all batches are read,
+so that every matrix built from the same documents is identical.
+
+A matrix is saved into a directory of .npy files, which are memory-mapped
+when loaded:
+  - indptr, indices and data: counts of terms in documents, in compressed
+    sparse row (CSR) format, a row per document and a column per term,
+  - terms: sorted terms, the vocabulary shared by all rows,
+  - reuters_id, lewis_split, cgi_split and topics_flag: a value per row,
+  - labels_<category> and values_<category>: a boolean matrix of documents
+    by values of the category (topics, places, people, orgs and
+    exchanges), and the sorted values of its columns.
+
+Usage:
+  python matrix.py build-matrix <output_dir> <path_to_data_file> ...
+"""
+
+import argparse
+import os
+import re
+import time
+from itertools import chain, count, islice
+
+import numpy
+
+from data_browser import CATEGORIES, SPLIT_FIELDS, DataBrowser
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# number of documents tokenized and counted at once
+BATCH_SIZE = 1000
+
+# names of arrays holding the term-document matrix in CSR format, a value
+# per document and labels of categories
+MATRIX_ARRAYS = ('indptr', 'indices', 'data', 'terms')
+COLUMN_ARRAYS = ('reuters_id',) + SPLIT_FIELDS
+LABEL_ARRAYS = tuple(
+    '%s_%s' % (prefix, name)
+    for name in CATEGORIES for prefix in ('labels', 'values'))
+
+
+def tokenize(text):
+    """
+    :param text: text to split
+    :returns: lowercase words of the text
+    :rtype: list
+    """
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _batches(iterable, size):
+    """
+    :returns: lists of up to size items of the iterable
+    :rtype: generator of lists
+    """
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def _label_matrix(values_of_rows):
+    """
+    :param values_of_rows: list of values of every row
+    :returns: sorted distinct values, and boolean matrix of rows by values
+    :rtype: tuple of numpy.ndarray
+    """
+    values = sorted(set(chain.from_iterable(values_of_rows)))
+    ids = dict(zip(values, count()))
+    lengths = numpy.fromiter(
+        map(len, values_of_rows), dtype=numpy.int64, count=len(values_of_rows))
+    labels = numpy.zeros((len(values_of_rows), len(values)), dtype=bool)
+    labels[numpy.repeat(numpy.arange(len(values_of_rows)), lengths),
+           numpy.fromiter(map(ids.__getitem__, chain.from_iterable(
+               values_of_rows)), dtype=numpy.int64, count=lengths.sum())] = True
+    return numpy.array(values, dtype=str), labels
+
+
+class TermDocumentMatrix():
+    """
+    Counts of terms in bodies of documents, with labels and splits of the
+    documents, held in numpy arrays (see module documentation).
+    """
+
+    def __init__(self, arrays):
+        """
+        :param arrays: numpy arrays by name, see MATRIX_ARRAYS,
+          COLUMN_ARRAYS and LABEL_ARRAYS
+        """
+        self.arrays = arrays
+        self.indptr, self.indices, self.data, self.terms = (
+            arrays[_] for _ in MATRIX_ARRAYS)
+        self.reuters_ids = arrays['reuters_id']
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def shape(self):
+        """
+        :returns: number of documents and number of terms
+        :rtype: tuple
+        """
+        return len(self), len(self.terms)
+
+    @classmethod
+    def build(cls, documents, batch_size=BATCH_SIZE):
+        """
+        Build the matrix in a single pass over documents.
+
+        :param documents: documents (instances of Document, DocumentRecord,
+          SnapshotDocument or any object with the same interface)
+        :param batch_size: number of documents tokenized and counted at once
+        :rtype: instance of TermDocumentMatrix
+        """
+        # ids of terms in order of appearance, sorted once all are known
+        vocabulary = {}
+        rows, columns, counts = [], [], []
+        columns_values = {name: [] for name in COLUMN_ARRAYS}
+        categories = {name: [] for name in CATEGORIES}
+        length = 0
+        for batch in _batches(documents, batch_size):
+            words = [tokenize(doc.text.body) for doc in batch]
+            lengths = numpy.fromiter(
+                map(len, words), dtype=numpy.int64, count=len(words))
+            words = list(chain.from_iterable(words))
+            new_words = set(words).difference(vocabulary)
+            vocabulary.update(zip(new_words, count(len(vocabulary))))
+            term_ids = numpy.fromiter(
+                map(vocabulary.__getitem__, words), dtype=numpy.int64,
+                count=len(words))
+            # pairs of document and term, sorted and counted at once
+            keys, key_counts = numpy.unique(
+                numpy.repeat(numpy.arange(length, length + len(batch)),
+                             lengths) << 32 | term_ids,
+                return_counts=True)
+            rows.append(keys >> 32)
+            columns.append(keys & 0xffffffff)
+            counts.append(key_counts)
+            for doc in batch:
+                columns_values['reuters_id'].append(doc.reuters_id)
+                for name in SPLIT_FIELDS:
+                    columns_values[name].append(getattr(doc, name) or '')
+                for name in CATEGORIES:
+                    categories[name].append(getattr(doc, name))
+            length += len(batch)
+
+        words = numpy.array(list(vocabulary), dtype=str)
+        order = numpy.argsort(words, kind='stable')
+        ranks = numpy.empty(len(order), dtype=numpy.int64)
+        ranks[order] = numpy.arange(len(order))
+        rows = numpy.concatenate(rows or [numpy.zeros(0, dtype=numpy.int64)])
+        columns = ranks[numpy.concatenate(
+            columns or [numpy.zeros(0, dtype=numpy.int64)])]
+        # rows are already in order, only terms of every row are sorted
+        permutation = numpy.argsort(
+            rows * max(len(order), 1) + columns, kind='stable')
+        arrays = {
+            'indptr': numpy.concatenate((
+                [0], numpy.cumsum(numpy.bincount(rows, minlength=length)))),
+            'indices': columns[permutation].astype(numpy.int32),
+            'data': numpy.concatenate(
+                counts or [numpy.zeros(0, dtype=numpy.int64)]
+            )[permutation].astype(numpy.int32),
+            'terms': words[order],
+            'reuters_id': numpy.array(
+                columns_values['reuters_id'], dtype=numpy.int32),
+        }
+        for name in SPLIT_FIELDS:
+            arrays[name] = numpy.array(columns_values[name], dtype=str)
+        for name in CATEGORIES:
+            arrays['values_' + name], arrays['labels_' + name] = \
+                _label_matrix(categories[name])
+        return cls(arrays)
+
+    def save(self, directory):
+        """
+        :param directory: path to the directory the arrays are saved into,
+          created if needed
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.arrays.items():
+            numpy.save(os.path.join(directory, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        :param directory: path to a directory of arrays saved by save()
+        :param mmap_mode: see numpy.load(), None to read arrays into memory
+        :rtype: instance of TermDocumentMatrix
+        """
+        return cls({
+            name: numpy.load(
+                os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+            for name in MATRIX_ARRAYS + COLUMN_ARRAYS + LABEL_ARRAYS})
+
+    def row(self, position):
+        """
+        :param position: position of the document in the matrix
+        :returns: counts of terms of the document's body
+        :rtype: dict
+        """
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return dict(zip(
+            self.terms[self.indices[start:end]].tolist(),
+            self.data[start:end].tolist()))
+
+    def labels(self, category):
+        """
+        :param category: one of CATEGORIES
+        :returns: sorted values of the category, and boolean matrix of
+          documents by values
+        :rtype: tuple of numpy.ndarray
+        """
+        return self.arrays['values_' + category], \
+            self.arrays['labels_' + category]
+
+    def modapte(self):
+        """
+        :returns: positions of documents of the training and test sets of
+          the ModApte split
+        :rtype: tuple of numpy.ndarray
+        """
+        topics = self.arrays['topics_flag'] == 'YES'
+        lewis_split = self.arrays['lewis_split']
+        return numpy.flatnonzero(topics & (lewis_split == 'TRAIN')), \
+            numpy.flatnonzero(topics & (lewis_split == 'TEST'))
+
+    def csr_matrix(self):
+        """
+        Requires scipy.
+
+        :rtype: instance of scipy.sparse.csr_matrix
+        """
+        from scipy.sparse import csr_matrix
+        return csr_matrix(
+            (self.data, self.indices, self.indptr), shape=self.shape)
+
+
+def build_matrix(paths, directory):
+    """
+    Build the matrix of documents of data files and save it.
+
+    :param paths: paths to data files, read in sorted order
+    :param directory: path to the directory the matrix is saved into
+    :rtype: instance of TermDocumentMatrix
+    """
+    matrix = TermDocumentMatrix.build(
+        record for path in sorted(paths)
+        for record in DataBrowser(path).iter_records())
+    matrix.save(directory)
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build term-document matrix of Reuters text collection.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser(
+        'build-matrix', help='build matrix and labels from data files')
+    build.add_argument(
+        'directory', help='path to the directory the matrix is saved into')
+    build.add_argument(
+        'paths', metavar='path', nargs='+',
+        help='path to the data file whose documents are counted')
+    args = parser.parse_args()
+    if args.command == 'build-matrix':
+        start = time.time()
+        matrix = build_matrix(args.paths, args.directory)
+        print('%d documents by %d terms (%d non-zero counts) built in %.2fs'
+              % (*matrix.shape, len(matrix.data), time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
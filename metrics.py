@@ -0,0 +1,323 @@
+"""
+Instrumentation of the API: latency of requests by endpoint, MongoDB
+commands run to serve them and rendering of responses, exposed in Prometheus
+text format at /metrics.
+
+Instrumentation is enabled by METRICS setting. When disabled, nothing is
+registered: requests, database commands and rendering run exactly as without
+it. Metrics are kept by every process, so that with several uWSGI workers
+every scrape reports the worker that served it.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from eve import render
+
+import renderers
+from flask import Response, current_app, g, request
+from pymongo import monitoring
+
+# upper bounds of histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Eve's renderers, replaced by timed ones when instrumentation is enabled
+_TIMED_RENDERERS = {
+    'eve.render.JSONRenderer': 'metrics.JSONRenderer',
+    'eve.render.XMLRenderer': 'metrics.XMLRenderer',
+    'renderers.JSONRenderer': 'metrics.FastJSONRenderer',
+    'renderers.XMLRenderer': 'metrics.FastXMLRenderer',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+class Counter():
+    """
+    Monotonic counter, by values of its labels.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        :param name: name of the metric
+        :param documentation: description of the metric
+        :param labels: names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        """
+        :param labels: values of the labels, in the order of their names
+        :param amount: number to add to the counter
+        """
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        """
+        :returns: lines of the metric in Prometheus text format
+        :rtype: list
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            '%s%s %s' % (self.name, _labels(self.labels, labels), repr(value))
+            for labels, value in values]
+
+
+class Histogram():
+    """
+    Distribution of observed values in cumulative buckets, by values of its
+    labels.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        """
+        :param name: name of the metric
+        :param documentation: description of the metric
+        :param labels: names of the labels
+        :param buckets: upper bounds of the buckets
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # per labels: count by bucket (last one is +Inf), and sum
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """
+        :param labels: values of the labels, in the order of their names
+        :param value: observed value
+        """
+        position = len(self.buckets)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                position = index
+                break
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0]
+            counts[0][position] += 1
+            counts[1] += value
+
+    def samples(self):
+        """
+        :returns: lines of the metric in Prometheus text format
+        :rtype: list
+        """
+        with self._lock:
+            values = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._values.items())
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    self.name,
+                    _labels(self.labels, labels, [('le', bound)]),
+                    cumulative))
+            lines.append('%s_sum%s %s' % (
+                self.name, _labels(self.labels, labels), repr(total)))
+            lines.append('%s_count%s %d' % (
+                self.name, _labels(self.labels, labels), cumulative))
+        return lines
+
+
+class CommandListener(monitoring.CommandListener):
+    """
+    Records duration and number of returned documents of MongoDB commands.
+    """
+
+    def __init__(self, metrics):
+        """
+        :param metrics: instance of Metrics
+        """
+        self.metrics = metrics
+        self._namespaces = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        namespace = event.database_name
+        if isinstance(collection, str):
+            namespace += '.' + collection
+        self._namespaces[event.connection_id, event.request_id] = namespace
+
+    def _labels(self, event):
+        namespace = self._namespaces.pop(
+            (event.connection_id, event.request_id), event.database_name)
+        return event.command_name, namespace
+
+    def succeeded(self, event):
+        labels = self._labels(event)
+        self.metrics.command_duration.observe(
+            labels, event.duration_micros / 1e6)
+        cursor = event.reply.get('cursor')
+        if isinstance(cursor, dict):
+            batch = cursor.get('firstBatch', cursor.get('nextBatch', ()))
+            self.metrics.command_documents.inc(labels, len(batch))
+
+    def failed(self, event):
+        labels = self._labels(event)
+        self.metrics.command_duration.observe(
+            labels, event.duration_micros / 1e6)
+        self.metrics.command_failures.inc(labels)
+
+
+class _TimedRenderer():
+    """
+    Mixin of Eve renderers recording rendering time.
+    """
+
+    def render(self, data):
+        metrics = current_app.extensions.get('metrics')
+        if metrics is None:
+            return super().render(data)
+        started = time.perf_counter()
+        try:
+            return super().render(data)
+        finally:
+            metrics.render_duration.observe(
+                (self.mime[0],), time.perf_counter() - started)
+
+
+class JSONRenderer(_TimedRenderer, render.JSONRenderer):
+    pass
+
+
+class XMLRenderer(_TimedRenderer, render.XMLRenderer):
+    pass
+
+
+class FastJSONRenderer(_TimedRenderer, renderers.JSONRenderer):
+    pass
+
+
+class FastXMLRenderer(_TimedRenderer, renderers.XMLRenderer):
+    pass
+
+
+class Metrics():
+    """
+    Instruments an Eve application and serves its metrics at /metrics.
+
+    Configuration is read from application's config:
+      METRICS: whether instrumentation is enabled (default: False)
+      METRICS_BUCKETS: upper bounds of latency histogram buckets, in seconds
+    """
+
+    def __init__(self, app=None):
+        """
+        :param app: instance of eve.Eve
+        """
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Must be called before the application connects to the database, and
+        before other extensions register request hooks, so that their work
+        is accounted to requests.
+
+        :param app: instance of eve.Eve
+        """
+        config = app.config
+        if not config.get('METRICS', False):
+            return
+        self.enabled = True
+        buckets = config.get('METRICS_BUCKETS', DEFAULT_BUCKETS)
+        self.request_duration = Histogram(
+            'http_request_duration_seconds',
+            'Time spent serving requests, by endpoint.',
+            ('method', 'endpoint', 'status'), buckets)
+        self.command_duration = Histogram(
+            'mongodb_command_duration_seconds',
+            'Time spent running MongoDB commands.',
+            ('command', 'namespace'), buckets)
+        self.command_documents = Counter(
+            'mongodb_command_documents_returned_total',
+            'Number of documents returned by MongoDB commands.',
+            ('command', 'namespace'))
+        self.command_failures = Counter(
+            'mongodb_command_failures_total',
+            'Number of failed MongoDB commands.',
+            ('command', 'namespace'))
+        self.render_duration = Histogram(
+            'api_render_duration_seconds',
+            'Time spent serializing responses, by media type.',
+            ('mime',), buckets)
+        self.metrics = (
+            self.request_duration, self.command_duration,
+            self.command_documents, self.command_failures,
+            self.render_duration)
+        app.extensions['metrics'] = self
+        # listens to clients created afterwards, Eve creates them on first
+        # use (MONGO_OPTIONS can't hold listeners, Eve validates them as
+        # URI options)
+        monitoring.register(CommandListener(self))
+        config['RENDERERS'] = [
+            _TIMED_RENDERERS.get(_, _) for _ in config.get('RENDERERS', ())]
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def render(self):
+        """
+        :returns: metrics in Prometheus text format
+        :rtype: str
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        response = Response(self.render(), content_type=CONTENT_TYPE)
+        response.cache_control.no_store = True
+        return response
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            rule = request.url_rule
+            self.request_duration.observe(
+                (request.method, rule.rule if rule else 'unmatched',
+                 str(response.status_code)),
+                time.perf_counter() - started)
+        return response
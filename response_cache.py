@@ -0,0 +1,315 @@
+"""
+In-process cache of API responses.
+
+The API is read-only and data only changes when import_data.py runs, which
+bumps the import generation stored in the database. Responses are cached
+until the generation changes, keyed on the normalized request URL and
+Accept header, and conditional requests carrying a generation-based ETag
+are answered without querying the data. Cached bodies are compressed once
+per content coding accepted by clients (gzip or deflate), and compressed
+bodies are cached along with them. ETags of compressed bodies end with their
+content coding (e.g. "<tag>-gzip"), so that caches never take a compressed
+body for the identity one.
+"""
+
+import gzip
+import hashlib
+import json
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from flask import Response, g, request
+
+# query parameters holding JSON documents, normalized before building keys
+_JSON_ARGS = ('where', 'projection')
+
+# response headers not worth caching, set again for every response
+_VOLATILE_HEADERS = ('Content-Length', 'Date', 'Set-Cookie')
+
+# compressors of bodies by content coding, in order of preference
+COMPRESSORS = {
+    'gzip': lambda body, level: gzip.compress(body, level, mtime=0),
+    'deflate': zlib.compress,
+}
+
+
+def cache_key(req):
+    """
+    :param req: instance of flask.Request
+    :returns: key identifying responses to the request
+    :rtype: str
+    """
+    args = []
+    for name, values in sorted(req.args.lists()):
+        for value in values:
+            if name in _JSON_ARGS:
+                try:
+                    value = json.dumps(
+                        json.loads(value), sort_keys=True,
+                        separators=(',', ':'))
+                except ValueError:
+                    pass
+            args.append((name, value))
+    return json.dumps([req.path, args, req.headers.get('Accept', '')])
+
+
+class LocalBackend():
+    """
+    Cache storage private to the process: a LRU bounded by number of entries,
+    safe to share between threads.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: maximum number of cached responses
+        """
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class UWSGIBackend():
+    """
+    Cache storage shared by all workers of a uWSGI instance, based on uWSGI
+    caching framework. The cache must be declared in uWSGI configuration
+    (see uwsgi.ini).
+    """
+
+    def __init__(self, name):
+        """
+        :param name: name of the uWSGI cache
+        """
+        import uwsgi
+        self._uwsgi = uwsgi
+        self.name = name
+
+    @staticmethod
+    def _key(key):
+        # uWSGI limits key sizes, keys include generation so stale entries
+        # are never returned
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self._uwsgi.cache_get(self._key(key), self.name)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, entry):
+        self._uwsgi.cache_update(
+            self._key(key), pickle.dumps(entry), 0, self.name)
+
+    def clear(self):
+        # entries of previous generations are unreachable and expire by LRU
+        pass
+
+
+class GenerationTracker():
+    """
+    Import generation, read again from its source at most once per check
+    interval.
+    """
+
+    def __init__(self, source, check_interval=1.0):
+        """
+        :param source: callable returning the current import generation
+        :param check_interval: number of seconds the generation is trusted
+          before it is read again
+        """
+        self.source = source
+        self.check_interval = check_interval
+        self._value = None
+        self._checked = 0.0
+
+    @property
+    def value(self):
+        """
+        :returns: current import generation
+        """
+        now = time.monotonic()
+        if self._value is None or now - self._checked >= self.check_interval:
+            self._value = self.source()
+            self._checked = now
+        return self._value
+
+
+class ResponseCache():
+    """
+    Caches successful GET responses of a Flask application until the
+    import generation changes.
+
+    Configuration is read from application's config:
+      RESPONSE_CACHE: whether caching is enabled (default: True)
+      RESPONSE_CACHE_SIZE: maximum number of responses cached by a process
+      RESPONSE_CACHE_UWSGI: name of a uWSGI cache to share responses between
+        workers, instead of caching them in the process
+      RESPONSE_CACHE_GENERATION_CHECK_INTERVAL: number of seconds the import
+        generation is trusted before it is read again
+      RESPONSE_CACHE_COMPRESS: whether cached bodies are compressed for
+        clients accepting it (default: True)
+      RESPONSE_CACHE_COMPRESS_MIN_SIZE: size in bytes under which bodies are
+        sent as they are
+      RESPONSE_CACHE_COMPRESS_LEVEL: compression level, from 1 to 9
+    """
+
+    def __init__(self, app=None, generation=None):
+        """
+        :param app: instance of flask.Flask
+        :param generation: callable returning the current import generation
+        """
+        self.generation_source = generation
+        self.backend = None
+        self.tracker = None
+        self.compress = False
+        self._generation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        :param app: instance of flask.Flask
+        """
+        config = app.config
+        if not config.get('RESPONSE_CACHE', True):
+            return
+        if config.get('RESPONSE_CACHE_UWSGI'):
+            self.backend = UWSGIBackend(config['RESPONSE_CACHE_UWSGI'])
+        else:
+            self.backend = LocalBackend(config.get('RESPONSE_CACHE_SIZE', 1024))
+        self.tracker = GenerationTracker(
+            self.generation_source,
+            config.get('RESPONSE_CACHE_GENERATION_CHECK_INTERVAL', 1.0))
+        self.compress = config.get('RESPONSE_CACHE_COMPRESS', True)
+        self.compress_min_size = config.get(
+            'RESPONSE_CACHE_COMPRESS_MIN_SIZE', 1024)
+        self.compress_level = config.get('RESPONSE_CACHE_COMPRESS_LEVEL', 6)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    @property
+    def generation(self):
+        """
+        :returns: current import generation, read at most once per check
+          interval
+        """
+        generation = self.tracker.value
+        if generation != self._generation:
+            self.backend.clear()
+            self._generation = generation
+        return generation
+
+    def etag(self, key, generation, encoding=None):
+        """
+        :param encoding: content coding of the body, None for identity
+        :returns: ETag of responses to the request identified by key, which
+          stays the same until the generation changes
+        :rtype: str
+        """
+        etag = hashlib.sha1(
+            ('%s\n%s' % (generation, key)).encode('utf-8')).hexdigest()
+        return '%s-%s' % (etag, encoding) if encoding else etag
+
+    def _compressible(self, body):
+        return self.compress and len(body) >= self.compress_min_size
+
+    def _negotiate(self, entry=None):
+        """
+        :param entry: cache entry of the response, None if not cached
+        :returns: content coding the body is sent with, None to send it as it
+          is; without entry, the coding a compressible body would be sent with
+        """
+        if not self.compress or \
+                entry is not None and not self._compressible(entry[2]):
+            return None
+        return request.accept_encodings.best_match(list(COMPRESSORS))
+
+    def _encode(self, key, entry, response):
+        """
+        Compress the body of the response with the content coding accepted
+        by the client, once per coding, and cache it with the entry.
+
+        :param key: key of the cache entry
+        :param entry: cache entry of the response
+        :param response: response whose body, Content-Encoding and ETag
+          are set
+        """
+        encoding = self._negotiate(entry)
+        if encoding is None:
+            return
+        body, encoded = entry[2], entry[3]
+        if encoding not in encoded:
+            encoded[encoding] = COMPRESSORS[encoding](
+                body, self.compress_level)
+            self.backend.set(key, entry)
+        response.content_encoding = encoding
+        response.set_data(encoded[encoding])
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag('%s-%s' % (etag, encoding), weak)
+
+    def _before_request(self):
+        if request.method != 'GET':
+            return None
+        generation = self.generation
+        key = cache_key(request)
+        g.response_cache_key = (generation, key)
+        entry_key = '%s\n%s' % (generation, key)
+        entry = self.backend.get(entry_key)
+        # compared to the ETag of the coding the body would be sent with
+        etag = self.etag(key, generation, self._negotiate(entry))
+        if request.if_none_match.contains(etag):
+            g.response_cache_hit = True
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        if entry is None:
+            return None
+        g.response_cache_hit = True
+        status, headers, body, _encoded = entry
+        response = Response(body, status=status, headers=headers)
+        self._encode(entry_key, entry, response)
+        response.headers['X-Cache'] = 'HIT'
+        # answers requests conditional on ETags set by the application
+        return response.make_conditional(request)
+
+    def _after_request(self, response):
+        if getattr(g, 'response_cache_hit', False) or \
+                'response_cache_key' not in g or \
+                response.status_code != 200 or \
+                response.is_streamed or \
+                response.cache_control.no_store:
+            return response
+        generation, key = g.response_cache_key
+        if 'ETag' not in response.headers:
+            response.set_etag(self.etag(key, generation))
+        body = response.get_data()
+        if self._compressible(body):
+            response.vary.add('Accept-Encoding')
+        headers = [
+            (name, value) for name, value in response.headers.items()
+            if name not in _VOLATILE_HEADERS]
+        entry_key = '%s\n%s' % (generation, key)
+        entry = (response.status_code, headers, body, {})
+        self.backend.set(entry_key, entry)
+        self._encode(entry_key, entry, response)
+        response.headers['X-Cache'] = 'MISS'
+        # answers conditional requests whose entry was not cached any more
+        return response.make_conditional(request)
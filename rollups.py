@@ -0,0 +1,221 @@
+"""
+Rollups of the documents collection, materialized by import_data.py and
+read by the API: vocabularies (number of documents per value, see
+settings.VOCABULARIES) and time series (number of documents per time
+bucket, see settings.TIMESERIES_BUCKETS). Holds the aggregation pipelines
+computing them from documents, and the counters maintaining them as
+documents are written.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from bson.son import SON
+from pymongo import UpdateOne
+
+import settings
+
+
+def _field_values(doc, field):
+    """
+    :param doc: document as dict
+    :param field: dotted path to the field
+    :returns: values of the field in the document
+    :rtype: list
+    """
+    value = doc
+    for key in field.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class VocabularyCounter():
+    """
+    Accumulates changes of vocabularies (see settings.VOCABULARIES) caused
+    by imported documents, and applies them to the vocabulary collections,
+    so that they don't need to be recomputed from the whole collection.
+    """
+
+    def __init__(self):
+        self.deltas = {name: Counter() for name in settings.VOCABULARIES}
+
+    @property
+    def projection(self):
+        """
+        :returns: projection of document fields needed to update
+          vocabularies
+        :rtype: dict
+        """
+        return {field: 1 for field in settings.VOCABULARIES.values()}
+
+    def add(self, doc, count=1):
+        """
+        :param doc: document as dict added to the collection
+        :param count: number to add to the count of every document's value
+        """
+        for name, field in settings.VOCABULARIES.items():
+            for value in set(_field_values(doc, field)):
+                self.deltas[name][value] += count
+
+    def remove(self, doc):
+        """
+        :param doc: document as dict removed from the collection
+        """
+        self.add(doc, count=-1)
+
+    def save(self, mongo_db):
+        """
+        Apply accumulated changes to vocabulary collections.
+
+        :param mongo_db: instance of pymongo.database.Database
+        """
+        for name, delta in self.deltas.items():
+            collection = mongo_db[settings.VOCABULARY_COLLECTION_PREFIX + name]
+            requests = [
+                UpdateOne({'_id': value}, {'$inc': {'count': count}},
+                          upsert=True)
+                for value, count in delta.items() if count]
+            if requests:
+                collection.bulk_write(requests, ordered=False)
+            collection.delete_many({'count': {'$lte': 0}})
+            delta.clear()
+
+
+def count_values_stages(field):
+    """
+    :param field: dotted path to a document field
+    :returns: aggregation pipeline stages counting documents per value of
+      the field, as {"_id": value, "count": number of documents}
+    :rtype: list
+    """
+    return [
+        {"$unwind": "$" + field},
+        {"$match": {field: {"$ne": None}}},
+        # a value may be repeated within a document
+        {"$group": {"_id": {"doc": "$_id", "value": "$" + field}}},
+        {"$group": {"_id": "$_id.value", "count": {"$sum": 1}}},
+    ]
+
+
+def bucket_start(value, bucket):
+    """
+    :param value: instance of datetime.datetime
+    :param bucket: name of the time bucket, see settings.TIMESERIES_BUCKETS
+    :returns: start of the bucket the datetime falls in
+    :rtype: datetime.datetime
+    """
+    parts = {
+        part: getattr(value, part)
+        for part in settings.TIMESERIES_BUCKETS[bucket]}
+    parts.setdefault('day', 1)
+    return datetime(**parts)
+
+
+class TimeseriesCounter():
+    """
+    Accumulates changes of document counts per time bucket (see
+    settings.TIMESERIES_BUCKETS) caused by imported documents, and applies
+    them to the timeseries collections.
+    """
+
+    def __init__(self):
+        self.deltas = {
+            bucket: Counter() for bucket in settings.TIMESERIES_BUCKETS}
+
+    @property
+    def projection(self):
+        """
+        :returns: projection of document fields needed to update counts
+        :rtype: dict
+        """
+        projection = {field: 1 for field in settings.VOCABULARIES.values()}
+        projection['datetime'] = 1
+        return projection
+
+    def add(self, doc, count=1):
+        """
+        :param doc: document as dict added to the collection
+        :param count: number to add to the counts of document's buckets
+        """
+        for bucket, delta in self.deltas.items():
+            time = bucket_start(doc['datetime'], bucket)
+            delta[time, None, None] += count
+            for name, field in settings.VOCABULARIES.items():
+                for value in set(_field_values(doc, field)):
+                    delta[time, name, value] += count
+
+    def remove(self, doc):
+        """
+        :param doc: document as dict removed from the collection
+        """
+        self.add(doc, count=-1)
+
+    def save(self, mongo_db):
+        """
+        Apply accumulated changes to timeseries collections.
+
+        :param mongo_db: instance of pymongo.database.Database
+        """
+        for bucket, delta in self.deltas.items():
+            collection = mongo_db[
+                settings.TIMESERIES_COLLECTION_PREFIX + bucket]
+            ensure_timeseries_indexes(collection)
+            requests = [
+                UpdateOne({'time': time, 'by': name, 'value': value},
+                          {'$inc': {'count': count}}, upsert=True)
+                for (time, name, value), count in delta.items() if count]
+            if requests:
+                collection.bulk_write(requests, ordered=False)
+            collection.delete_many({'count': {'$lte': 0}})
+            delta.clear()
+
+
+def count_buckets_stages(bucket, field=None):
+    """
+    :param bucket: name of the time bucket, see settings.TIMESERIES_BUCKETS
+    :param field: dotted path to a document field, or None to count all
+      documents
+    :returns: aggregation pipeline stages counting documents per bucket
+      (and value of the field), as {"time": bucket start, "value": value,
+      "count": number of documents}, sorted by time and value
+    :rtype: list
+    """
+    operators = {
+        'year': '$year', 'month': '$month', 'day': '$dayOfMonth',
+        'hour': '$hour'}
+    time = {"$dateFromParts": {
+        part: {operators[part]: "$datetime"}
+        for part in settings.TIMESERIES_BUCKETS[bucket]}}
+    if field is None:
+        stages = [
+            {"$group": {"_id": {"time": time}, "count": {"$sum": 1}}},
+        ]
+    else:
+        stages = [
+            {"$unwind": "$" + field},
+            {"$match": {field: {"$ne": None}}},
+            # a value may be repeated within a document
+            {"$group": {"_id": {
+                "doc": "$_id", "time": time, "value": "$" + field}}},
+            {"$group": {
+                "_id": {"time": "$_id.time", "value": "$_id.value"},
+                "count": {"$sum": 1}}},
+        ]
+    return stages + [
+        {"$project": {
+            "_id": 0, "time": "$_id.time", "value": "$_id.value",
+            "count": 1}},
+        {"$sort": SON([("time", 1), ("value", 1)])},
+    ]
+
+
+def ensure_timeseries_indexes(collection):
+    """
+    :param collection: timeseries collection (instance of
+      pymongo.collection.Collection)
+    """
+    for spec in settings.TIMESERIES_INDEXES:
+        collection.create_index(
+            spec['keys'], name=spec['name'], **spec.get('options', {}))
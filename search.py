@@ -0,0 +1,424 @@
+"""
+Full-text search over titles and bodies of documents, ranked by BM25.
+
+The index is built once from documents and saved into a file that is
+memory-mapped when loaded, so searching doesn't depend on MongoDB. Queries
+follow the syntax of MongoDB's $text operator:
+  - words are matched if any of them is found in a document,
+  - phrases enclosed in double quotes must all be found in a document,
+  - words prefixed with a minus sign exclude documents containing them.
+
+Usage:
+  python search.py build-index <index_file> <path_to_data_file> ...
+  python search.py search <index_file> <query>
+  python search.py benchmark <index_file> [--mongo]
+"""
+
+import argparse
+import heapq
+import math
+import re
+import time
+from array import array
+from functools import lru_cache
+
+import settings
+from data_browser import DataBrowser
+from snapshot import SectionFile, write_sections
+
+_MAGIC = b'RTRSRCH1'
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_QUERY_RE = re.compile(r'"([^"]*)"|(-?)([^\s"]+)')
+
+STOP_WORDS = frozenset('''
+    a about above after again against all am an and any are as at be because
+    been before being below between both but by can could did do does doing
+    down during each few for from further had has have having he her here
+    hers herself him himself his how i if in into is it its itself just me
+    more most my myself no nor not now of off on once only or other our ours
+    ourselves out over own same she should so some such than that the their
+    theirs them themselves then there these they this those through to too
+    under until up very was we were what when where which while who whom why
+    will with would you your yours yourself yourselves said says say reuter
+    reuters
+    '''.split())
+
+# suffixes stripped by stem(), tried in order, along with their replacement
+_SUFFIXES = (
+    ('ational', 'ate'),
+    ('ization', 'ize'),
+    ('fulness', 'ful'),
+    ('ousness', 'ous'),
+    ('iveness', 'ive'),
+    ('ments', ''),
+    ('ment', ''),
+    ('ness', ''),
+    ('ings', ''),
+    ('ing', ''),
+    ('sses', 'ss'),
+    ('ies', 'y'),
+    ('ied', 'y'),
+    ('edly', ''),
+    ('ed', ''),
+    ('ly', ''),
+    ('s', ''),
+)
+
+# minimum length of a stem
+_MIN_STEM = 3
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# gap between positions of title and body words, so that phrases don't
+# match across fields
+_FIELD_GAP = 1
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """
+    Light suffix-stripping stemmer, conflating plurals and the most common
+    inflections of English words.
+
+    :param word: lowercase word
+    :rtype: str
+    """
+    if word.endswith(('ss', 'us', 'is')) or word.isdigit():
+        return word
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and \
+                len(word) - len(suffix) + len(replacement) >= _MIN_STEM:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    """
+    :param text: text to split into terms
+    :returns: terms along with their positions in the text; stop words are
+      skipped but still take a position
+    :rtype: generator of tuples
+    """
+    for position, match in enumerate(_TOKEN_RE.finditer(text.lower())):
+        word = match.group()
+        if word not in STOP_WORDS:
+            yield position, stem(word)
+
+
+def parse_query(query):
+    """
+    :param query: query string, see module documentation
+    :returns: terms to rank documents by, phrases (lists of terms along with
+      their offsets in the phrase) and excluded terms
+    :rtype: tuple
+    """
+    terms, phrases, excluded = [], [], []
+    for phrase, negated, word in _QUERY_RE.findall(query):
+        if phrase:
+            tokens = list(tokenize(phrase))
+            if tokens:
+                phrases.append([
+                    (term, position - tokens[0][0])
+                    for position, term in tokens])
+                terms.extend(term for _, term in tokens)
+        else:
+            tokens = [term for _, term in tokenize(word)]
+            (excluded if negated else terms).extend(tokens)
+    return terms, phrases, excluded
+
+
+class SearchIndex():
+    """
+    Positional inverted index of document titles and bodies.
+
+    Terms are sorted, and every term refers to its postings: documents
+    containing it, with the term's frequency and positions in each of them.
+    All data is held in arrays, either in memory when the index is built or
+    as views of the memory-mapped index file when it is loaded.
+    """
+
+    def __init__(self, length, sections, source=None):
+        """
+        Use build() or load() to create instances.
+
+        :param length: number of indexed documents
+        :param sections: dict of arrays, see build()
+        :param source: instance of snapshot.SectionFile the sections are
+          views of, if any
+        """
+        self._length = length
+        self._sections = sections
+        self._source = source
+        lengths = sections['doc.length']
+        self._average_length = (
+            sum(lengths) / length if length else 0.0)
+
+    def __len__(self):
+        return self._length
+
+    @classmethod
+    def build(cls, documents):
+        """
+        :param documents: documents to index (instances of Document,
+          DocumentRecord or any object with the same interface)
+        :rtype: instance of SearchIndex
+        """
+        postings = {}
+        reuters_ids = array('i')
+        lengths = array('i')
+        for doc_index, doc in enumerate(documents):
+            reuters_ids.append(doc.reuters_id)
+            length = 0
+            offset = 0
+            for field in (doc.text.title, doc.text.body):
+                last = -1
+                for position, term in tokenize(field or ''):
+                    postings.setdefault(term, {}).setdefault(
+                        doc_index, []).append(offset + position)
+                    length += 1
+                    last = position
+                offset += last + 1 + _FIELD_GAP
+            lengths.append(length)
+        sections = {
+            'doc.reuters_id': reuters_ids,
+            'doc.length': lengths,
+            'terms.offsets': array('Q', [0]),
+            'terms.data': array('B'),
+            'postings.offsets': array('Q', [0]),
+            'postings.docs': array('i'),
+            'postings.freqs': array('i'),
+            'positions.offsets': array('Q', [0]),
+            'positions.data': array('i'),
+        }
+        for term in sorted(postings):
+            sections['terms.data'].frombytes(term.encode())
+            sections['terms.offsets'].append(len(sections['terms.data']))
+            for doc_index, positions in sorted(postings[term].items()):
+                sections['postings.docs'].append(doc_index)
+                sections['postings.freqs'].append(len(positions))
+                sections['positions.data'].extend(positions)
+                sections['positions.offsets'].append(
+                    len(sections['positions.data']))
+            sections['postings.offsets'].append(
+                len(sections['postings.docs']))
+        return cls(len(reuters_ids), sections)
+
+    def save(self, path):
+        """
+        :param path: path to index file to write
+        """
+        write_sections(path, _MAGIC, self._length, self._sections)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: path to index file, as written by save()
+        :rtype: instance of SearchIndex
+        """
+        source = SectionFile(path, _MAGIC)
+        return cls(source.length, source.sections, source)
+
+    def close(self):
+        """
+        Unmap the index file, if the index was loaded.
+        """
+        if self._source is not None:
+            self._source.close()
+
+    def _term_index(self, term):
+        """
+        :returns: position of the term in sorted terms, or None if the term
+          is not indexed
+        """
+        offsets = self._sections['terms.offsets']
+        data = self._sections['terms.data']
+        term = term.encode()
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            current = bytes(data[offsets[middle]:offsets[middle + 1]])
+            if current < term:
+                low = middle + 1
+            elif current > term:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _postings(self, term):
+        """
+        :returns: documents containing the term, along with the frequency
+          of the term in the document and the index of its positions
+        :rtype: generator of tuples
+        """
+        index = self._term_index(term)
+        if index is None:
+            return
+        offsets = self._sections['postings.offsets']
+        docs = self._sections['postings.docs']
+        freqs = self._sections['postings.freqs']
+        for posting in range(offsets[index], offsets[index + 1]):
+            yield docs[posting], freqs[posting], posting
+
+    def _positions(self, posting):
+        offsets = self._sections['positions.offsets']
+        return self._sections['positions.data'][
+            offsets[posting]:offsets[posting + 1]]
+
+    def _matches_phrase(self, phrase_postings):
+        """
+        :param phrase_postings: list of dicts of postings by document, one
+          per phrase term, along with the offset of the term in the phrase
+        :returns: documents containing the phrase
+        :rtype: set
+        """
+        candidates = set.intersection(
+            *(set(postings) for postings, _ in phrase_postings))
+        matching = set()
+        for doc_index in candidates:
+            (first, _), rest = phrase_postings[0], phrase_postings[1:]
+            starts = set(self._positions(first[doc_index]))
+            for postings, offset in rest:
+                starts &= set(
+                    _ - offset for _ in self._positions(postings[doc_index]))
+                if not starts:
+                    break
+            if starts:
+                matching.add(doc_index)
+        return matching
+
+    def search(self, query, limit=10):
+        """
+        :param query: query string, see module documentation
+        :param limit: maximum number of results
+        :returns: reuters_id of best matching documents along with their
+          score, best first
+        :rtype: list of tuples
+        """
+        terms, phrases, excluded = parse_query(query)
+        lengths = self._sections['doc.length']
+        scores = {}
+        for term in set(terms):
+            postings = list(self._postings(term))
+            if not postings:
+                continue
+            idf = math.log(1 + (self._length - len(postings) + 0.5) /
+                           (len(postings) + 0.5))
+            for doc_index, freq, _ in postings:
+                norm = 1 - B + B * lengths[doc_index] / self._average_length
+                scores[doc_index] = scores.get(doc_index, 0.0) + \
+                    idf * freq * (K1 + 1) / (freq + K1 * norm)
+        for phrase in phrases:
+            phrase_postings = [
+                ({doc: posting for doc, _, posting in self._postings(term)},
+                 offset)
+                for term, offset in phrase]
+            matching = self._matches_phrase(phrase_postings)
+            scores = {
+                doc: score for doc, score in scores.items() if doc in matching}
+        for term in excluded:
+            for doc_index, _, _ in self._postings(term):
+                scores.pop(doc_index, None)
+        reuters_ids = self._sections['doc.reuters_id']
+        return [
+            (reuters_ids[doc_index], score)
+            for doc_index, score in heapq.nlargest(
+                limit, scores.items(), key=lambda item: item[1])]
+
+
+# queries timed by the benchmark command
+BENCHMARK_QUERIES = [
+    'food coffee',
+    '"new zealand"',
+    'oil prices',
+    'interest rates -japan',
+    '"trade deficit" japan',
+    'wheat corn soybean export',
+]
+
+
+def benchmark(index, queries=BENCHMARK_QUERIES, repeat=20, mongo_db=None):
+    """
+    Time queries against the index and, if a database is given, against
+    MongoDB's $text search on the documents collection.
+
+    :param index: instance of SearchIndex
+    :param queries: query strings
+    :param repeat: number of times each query is run
+    :param mongo_db: instance of pymongo.database.Database
+    :returns: average latency in milliseconds by query, for 'local' and
+      'mongo' engines
+    :rtype: dict
+    """
+    def timed(run):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat
+
+    results = {}
+    for query in queries:
+        results[query] = {'local': timed(lambda: index.search(query))}
+        if mongo_db is not None:
+            score = {'score': {'$meta': 'textScore'}}
+            results[query]['mongo'] = timed(lambda: list(
+                mongo_db.documents.find(
+                    {'$text': {'$search': query}}, score
+                ).sort([('score', {'$meta': 'textScore'})]).limit(10)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Full-text search over Reuters text collection.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser(
+        'build-index', help='build search index from data files')
+    build.add_argument('index', help='path to index file to write')
+    build.add_argument(
+        'paths', metavar='path', nargs='+',
+        help='path to the data file whose documents are indexed')
+    search = commands.add_parser('search', help='search documents')
+    search.add_argument('index', help='path to index file')
+    search.add_argument('query', help='query string')
+    search.add_argument(
+        '--limit', type=int, default=10, help='maximum number of results')
+    bench = commands.add_parser(
+        'benchmark', help='time queries, optionally against MongoDB')
+    bench.add_argument('index', help='path to index file')
+    bench.add_argument(
+        '--mongo', action='store_true', default=False,
+        help='also time MongoDB $text search on the imported documents')
+    bench.add_argument(
+        '--repeat', type=int, default=20,
+        help='number of times each query is run')
+    args = parser.parse_args()
+    if args.command == 'build-index':
+        documents = (
+            record for path in sorted(args.paths)
+            for record in DataBrowser(path).iter_records())
+        index = SearchIndex.build(documents)
+        index.save(args.index)
+        print('%d documents indexed into %s' % (len(index), args.index))
+    elif args.command == 'search':
+        index = SearchIndex.load(args.index)
+        for reuters_id, score in index.search(args.query, args.limit):
+            print('%d\t%.3f' % (reuters_id, score))
+    elif args.command == 'benchmark':
+        index = SearchIndex.load(args.index)
+        mongo_db = None
+        if args.mongo:
+            import pymongo
+            mongo_db = pymongo.MongoClient(
+                settings.MONGO_HOST)[settings.MONGO_DBNAME]
+        results = benchmark(index, repeat=args.repeat, mongo_db=mongo_db)
+        for query, latencies in results.items():
+            print('%-30s %s' % (query, '  '.join(
+                '%s: %.3fms' % _ for _ in sorted(latencies.items()))))
+
+
+if __name__ == '__main__':
+    main()
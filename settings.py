@@ -1,8 +1,94 @@
 from bson.son import SON
+from pymongo import ASCENDING, TEXT
 
 MONGO_HOST = '127.0.0.1'
 MONGO_DBNAME = 'reuters_data'
 
+# vocabulary endpoints along with the document fields they list values of.
+# Every vocabulary is materialized by import_data.py into its own collection
+# (see VOCABULARY_COLLECTION_PREFIX), holding a document per value, with the
+# value as _id and the number of documents having it as count.
+VOCABULARIES = {
+    'topics': 'topics',
+    'places': 'places',
+    'people': 'people',
+    'orgs': 'orgs',
+    'exchanges': 'exchanges',
+    'authors': 'text.author',
+}
+VOCABULARY_COLLECTION_PREFIX = 'vocabulary_'
+
+# time buckets of the timeseries endpoint, along with the date parts kept
+# when truncating datetimes to the start of their bucket. Document counts per
+# bucket, overall and per value of every vocabulary, are materialized by
+# import_data.py into a collection per bucket (see
+# TIMESERIES_COLLECTION_PREFIX), holding a document per bucket start (time),
+# vocabulary name (by, None for overall counts) and value.
+TIMESERIES_BUCKETS = {
+    'hour': ('year', 'month', 'day', 'hour'),
+    'day': ('year', 'month', 'day'),
+    'month': ('year', 'month'),
+}
+TIMESERIES_COLLECTION_PREFIX = 'timeseries_'
+TIMESERIES_INDEXES = [
+    {
+        # serves counts of all values of a vocabulary, in time order
+        'keys': [('by', ASCENDING), ('time', ASCENDING), ('value', ASCENDING)],
+        'name': 'by_time_value',
+        'options': {'unique': True},
+    },
+    {
+        'keys': [('by', ASCENDING), ('value', ASCENDING), ('time', ASCENDING)],
+        'name': 'by_value_time',
+    },
+]
+
+# collection holding documents imported by import_data.py
+DOCS_COLLECTION_NAME = 'documents'
+
+# collection holding the generation of imported data, bumped by
+# import_data.py every time data changes
+META_COLLECTION_NAME = 'meta'
+
+# API responses are cached until the generation of imported data changes,
+# see response_cache.py
+RESPONSE_CACHE = True
+RESPONSE_CACHE_SIZE = 1024
+# name of the uWSGI cache shared by workers (see uwsgi.ini), responses are
+# cached by every process if not set
+RESPONSE_CACHE_UWSGI = None
+RESPONSE_CACHE_GENERATION_CHECK_INTERVAL = 1.0
+# request latency, MongoDB commands and rendering time are measured and
+# exposed at /metrics when enabled, see metrics.py
+METRICS = False
+
+# number of documents matching a query is cached by every process until the
+# generation of imported data changes, see data_layer.py
+TOTALS_CACHE_SIZE = 1024
+
+# near-duplicate documents are found by MinHash signatures of their bodies,
+# see duplicates.py. Documents at least that similar to an earlier one are
+# marked as its duplicates by import_data.py
+DUPLICATES_THRESHOLD = 0.8
+# default minimum similarity of documents listed by /documents/<id>/similar
+SIMILAR_THRESHOLD = 0.5
+
+# source of documents served by embedded.py without MongoDB: directory of
+# .sgm files, or snapshot file built by snapshot.py
+EMBEDDED_DATA = 'raw_data'
+# search index file built by search.py, serving $text queries of
+# embedded.py; built from documents when they are loaded if not set
+EMBEDDED_SEARCH_INDEX = None
+
+# renderers of responses, producing the same bytes as Eve's ones faster, see
+# renderers.py
+RENDERERS = ['renderers.JSONRenderer', 'renderers.XMLRenderer']
+# function encoding JSON responses, see renderers.encode_json
+JSON_ENCODER = 'renderers.encode_json'
+# XML responses of pages holding at least this many items are streamed
+# instead of being built in memory (and cached), never if not set
+XML_STREAM_MIN_ITEMS = None
+
 RESOURCE_METHODS = ['GET']
 ITEM_METHODS = ['GET']
 
@@ -33,6 +119,11 @@ DOMAIN = {
             'exchanges': {
                 'type': 'list',
             },
+            # reuters_id of the earliest document this one is a
+            # near-duplicate of, see duplicates.py
+            'duplicate_of': {
+                'type': 'int',
+            },
             'text': {
                 'type': 'dict',
                 'schema': {
@@ -55,11 +146,9 @@ DOMAIN = {
     'topics': {
         'pagination': False,
         'datasource': {
-            'source': 'documents',
+            'source': VOCABULARY_COLLECTION_PREFIX + 'topics',
             'aggregation': {
                 'pipeline': [
-                    {"$unwind": "$topics"},
-                    {"$group": {"_id": "$topics"}},
                     {"$sort": SON([("_id", 1)])}
                 ]
             }
@@ -68,11 +157,9 @@ DOMAIN = {
     'places': {
         'pagination': False,
         'datasource': {
-            'source': 'documents',
+            'source': VOCABULARY_COLLECTION_PREFIX + 'places',
             'aggregation': {
                 'pipeline': [
-                    {"$unwind": "$places"},
-                    {"$group": {"_id": "$places"}},
                     {"$sort": SON([("_id", 1)])}
                 ]
             }
@@ -81,11 +168,9 @@ DOMAIN = {
     'people': {
         'pagination': False,
         'datasource': {
-            'source': 'documents',
+            'source': VOCABULARY_COLLECTION_PREFIX + 'people',
             'aggregation': {
                 'pipeline': [
-                    {"$unwind": "$people"},
-                    {"$group": {"_id": "$people"}},
                     {"$sort": SON([("_id", 1)])}
                 ]
             }
@@ -94,11 +179,9 @@ DOMAIN = {
     'orgs': {
         'pagination': False,
         'datasource': {
-            'source': 'documents',
+            'source': VOCABULARY_COLLECTION_PREFIX + 'orgs',
             'aggregation': {
                 'pipeline': [
-                    {"$unwind": "$orgs"},
-                    {"$group": {"_id": "$orgs"}},
                     {"$sort": SON([("_id", 1)])}
                 ]
             }
@@ -107,11 +190,9 @@ DOMAIN = {
     'exchanges': {
         'pagination': False,
         'datasource': {
-            'source': 'documents',
+            'source': VOCABULARY_COLLECTION_PREFIX + 'exchanges',
             'aggregation': {
                 'pipeline': [
-                    {"$unwind": "$exchanges"},
-                    {"$group": {"_id": "$exchanges"}},
                     {"$sort": SON([("_id", 1)])}
                 ]
             }
@@ -120,14 +201,71 @@ DOMAIN = {
     'authors': {
         'pagination': False,
         'datasource': {
-            'source': 'documents',
+            'source': VOCABULARY_COLLECTION_PREFIX + 'authors',
             'aggregation': {
                 'pipeline': [
-                    {"$match": {"text.author": {"$exists": True, "$ne": None}}},
-                    {"$group": {"_id": "$text.author"}},
                     {"$sort": SON([("_id", 1)])}
                 ]
             }
         }
     },
 }
+
+# indexes of the documents collection, applied by import_data.py (see its
+# --ensure-indexes option). Every index is described by its keys, as
+# accepted by pymongo's create_index(), its name and extra index options.
+DOCUMENTS_INDEXES = [
+    {
+        'keys': [('reuters_id', ASCENDING)],
+        'name': 'reuters_id',
+        'options': {'unique': True},
+    },
+    {
+        # also serves time range queries, ordered by reuters_id
+        'keys': [('datetime', ASCENDING), ('reuters_id', ASCENDING)],
+        'name': 'datetime_reuters_id',
+    },
+    {
+        # multikey indexes on category lists; compound indexes can't include
+        # more than one list field, so categories are combined with datetime
+        'keys': [('topics', ASCENDING), ('datetime', ASCENDING)],
+        'name': 'topics_datetime',
+    },
+    {
+        'keys': [('places', ASCENDING), ('datetime', ASCENDING)],
+        'name': 'places_datetime',
+    },
+    {
+        'keys': [('people', ASCENDING)],
+        'name': 'people',
+    },
+    {
+        'keys': [('orgs', ASCENDING)],
+        'name': 'orgs',
+    },
+    {
+        'keys': [('exchanges', ASCENDING)],
+        'name': 'exchanges',
+    },
+    {
+        'keys': [('text.author', ASCENDING)],
+        'name': 'text_author',
+    },
+    {
+        # band keys of signatures, looking up near-duplicates of a document
+        # (see duplicates.py)
+        'keys': [('lsh', ASCENDING)],
+        'name': 'lsh',
+    },
+    {
+        # near-duplicates of a document, marked again when it changes
+        'keys': [('duplicate_of', ASCENDING)],
+        'name': 'duplicate_of',
+        'options': {'sparse': True},
+    },
+    {
+        'keys': [('text.title', TEXT), ('text.body', TEXT)],
+        'name': 'search_index_for_text_title_and_body',
+        'options': {'default_language': 'english'},
+    },
+]
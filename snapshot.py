@@ -0,0 +1,513 @@
+"""
+Compact binary snapshot of the Reuters text collection.
+
+A snapshot is built once from .sgm files and memory-mapped by readers, so
+opening the whole collection doesn't require parsing, and pages of the file
+are shared between processes. Documents are stored column-wise:
+  - fixed-width columns of ids and timestamps,
+  - dictionary-encoded categories, types, authors and split attributes
+    (LEWISSPLIT, CGISPLIT and TOPICS): every document's values are indexes
+    into a table of distinct strings,
+  - text fields concatenated into a single blob, with a table of offsets.
+
+Usage:
+  python snapshot.py build-snapshot <snapshot_file> <path_to_data_file> ...
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+import numpy
+
+from data_browser import (
+    CATEGORIES, DOCUMENT_FIELDS, SPLIT_FIELDS, TEXT_FIELDS, DataBrowser,
+    TimeIndex, select_fields)
+
+# the version is bumped when sections are added, e.g. split attributes in
+# version 2, so that older snapshots are rejected instead of misread
+_MAGIC = b'RTRSNAP2'
+
+# header: magic, byte order of columns, number of documents and sections
+_HEADER = struct.Struct('<8s8sQQ')
+# section directory entry: name, typecode, offset and number of items
+_SECTION = struct.Struct('<32s1s7xQQ')
+
+_EPOCH = datetime(1970, 1, 1)
+
+# text fields stored in the text blob, in the order of their offsets
+_TEXT_FIELDS = ('dateline', 'title', 'body')
+
+# index of missing values in dictionary-encoded columns
+_NONE = -1
+
+
+class SectionFile():
+    """
+    Memory-mapped file made of named sections, each holding an array of
+    fixed-width items, as written by write_sections().
+    """
+
+    def __init__(self, path, magic):
+        """
+        :param path: path to the file
+        :param magic: bytes identifying the expected kind of file
+        """
+        self.path = path
+        with open(path, 'rb') as f_obj:
+            self._mmap = mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, byte_order, self.length, sections = _HEADER.unpack_from(
+            self._mmap)
+        if file_magic != magic:
+            self._mmap.close()
+            raise ValueError('%s is not a %s file' % (path, magic.decode()))
+        if byte_order.rstrip(b'\0').decode() != sys.byteorder:
+            self._mmap.close()
+            raise ValueError('%s was built on a different platform' % path)
+        self._buffer = memoryview(self._mmap)
+        self.sections = {}
+        for position in range(sections):
+            name, typecode, offset, length = _SECTION.unpack_from(
+                self._mmap, _HEADER.size + position * _SECTION.size)
+            typecode = typecode.decode()
+            self.sections[name.rstrip(b'\0').decode()] = self._buffer[
+                offset:offset + length * array(typecode).itemsize].cast(
+                    typecode)
+
+    def close(self):
+        """
+        Unmap the file. Sections can't be accessed anymore.
+        """
+        for section in self.sections.values():
+            section.release()
+        self.sections.clear()
+        self._buffer.release()
+        self._mmap.close()
+
+
+def write_sections(path, magic, length, sections):
+    """
+    Write arrays into a file readable by SectionFile. Arrays are written in
+    native byte order, and are 8-byte aligned so that they can be viewed
+    without copies once the file is memory-mapped.
+
+    :param path: path to the file
+    :param magic: bytes identifying the kind of file, at most 8 bytes long
+    :param length: number of items (e.g. documents) described by the file
+    :param sections: dict of arrays (instances of array.array) by name
+    """
+    offset = _HEADER.size + len(sections) * _SECTION.size
+    directory = []
+    for name, values in sections.items():
+        offset += -offset % 8
+        directory.append(_SECTION.pack(
+            name.encode(), values.typecode.encode(), offset, len(values)))
+        offset += len(values) * values.itemsize
+    with open(path, 'wb') as f_obj:
+        f_obj.write(_HEADER.pack(
+            magic, sys.byteorder.encode(), length, len(sections)))
+        f_obj.write(b''.join(directory))
+        for values in sections.values():
+            f_obj.write(b'\0' * (-f_obj.tell() % 8))
+            values.tofile(f_obj)
+
+
+class SnapshotDocumentText():
+    """
+    Represents text info of a single document in a snapshot. Exposes the same
+    interface as data_browser.DocumentText, values are decoded on access.
+    """
+
+    def __init__(self, snapshot, index):
+        """
+        :param snapshot: instance of Snapshot
+        :param index: position of the document in the snapshot
+        """
+        self._snapshot = snapshot
+        self._index = index
+
+    def as_dict(self, fields=None):
+        """
+        Return document's text info as dict.
+
+        :param fields: names of the fields to return, all of them by default
+        """
+        if fields is not None:
+            return select_fields(self, fields, TEXT_FIELDS)
+        return {
+            'type': self.type,
+            'author': self.author,
+            'dateline': self.dateline,
+            'title': self.title,
+            'body': self.body
+            }
+
+    @property
+    def author(self):
+        return self._snapshot.string(
+            self._snapshot.section('author')[self._index])
+
+    @property
+    def body(self):
+        return self._snapshot.text(self._index, 'body')
+
+    @property
+    def dateline(self):
+        return self._snapshot.text(self._index, 'dateline')
+
+    @property
+    def title(self):
+        return self._snapshot.text(self._index, 'title')
+
+    @property
+    def type(self):
+        return self._snapshot.string(
+            self._snapshot.section('type')[self._index])
+
+
+class SnapshotDocument():
+    """
+    Represents a single document in a snapshot. Exposes the same interface
+    as data_browser.Document, values are decoded on access.
+    """
+
+    def __init__(self, snapshot, index):
+        """
+        :param snapshot: instance of Snapshot
+        :param index: position of the document in the snapshot
+        """
+        self._snapshot = snapshot
+        self._index = index
+
+    def as_dict(self, fields=None):
+        """
+        :param fields: dotted paths to the fields to return, see
+          data_browser.select_fields()
+        :returns: document's info
+        :rtype: dict
+        """
+        if fields is not None:
+            return select_fields(self, fields, DOCUMENT_FIELDS)
+        return {
+            'reuters_id': self.reuters_id,
+            'reuters_old_id': self.reuters_old_id,
+            'datetime': self.datetime,
+            'topics': self.topics,
+            'places': self.places,
+            'people': self.people,
+            'orgs': self.orgs,
+            'exchanges': self.exchanges,
+            'text': self.text.as_dict(),
+        }
+
+    @property
+    def reuters_id(self):
+        return self._snapshot.section('reuters_id')[self._index]
+
+    @property
+    def reuters_old_id(self):
+        return self._snapshot.section('reuters_old_id')[self._index]
+
+    @property
+    def datetime(self):
+        return _EPOCH + timedelta(
+            seconds=self._snapshot.section('datetime')[self._index])
+
+    @property
+    def cgi_split(self):
+        return self._snapshot.string(
+            self._snapshot.section('cgi_split')[self._index])
+
+    @property
+    def exchanges(self):
+        return self._snapshot.categories(self._index, 'exchanges')
+
+    @property
+    def lewis_split(self):
+        return self._snapshot.string(
+            self._snapshot.section('lewis_split')[self._index])
+
+    @property
+    def orgs(self):
+        return self._snapshot.categories(self._index, 'orgs')
+
+    @property
+    def people(self):
+        return self._snapshot.categories(self._index, 'people')
+
+    @property
+    def places(self):
+        return self._snapshot.categories(self._index, 'places')
+
+    @property
+    def text(self):
+        return SnapshotDocumentText(self._snapshot, self._index)
+
+    @property
+    def topics(self):
+        return self._snapshot.categories(self._index, 'topics')
+
+    @property
+    def topics_flag(self):
+        return self._snapshot.string(
+            self._snapshot.section('topics_flag')[self._index])
+
+
+class Snapshot():
+    """
+    Memory-mapped snapshot of documents. Behaves as a read-only sequence of
+    SnapshotDocument.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path to snapshot file, as built by build_snapshot()
+        """
+        self.path = path
+        self._file = SectionFile(path, _MAGIC)
+        self._length = self._file.length
+        self._sections = self._file.sections
+        self._strings = {}
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('document index out of range')
+        return SnapshotDocument(self, index)
+
+    def section(self, name):
+        """
+        :param name: name of the column
+        :returns: zero-copy view of the column
+        :rtype: memoryview
+        """
+        return self._sections[name]
+
+    def string(self, index):
+        """
+        :param index: index in the table of distinct strings
+        :returns: decoded string, or None for missing values
+        :rtype: str
+        """
+        if index == _NONE:
+            return None
+        string = self._strings.get(index)
+        if string is None:
+            offsets = self._sections['strings.offsets']
+            string = self._strings[index] = bytes(self._sections[
+                'strings.data'][offsets[index]:offsets[index + 1]]).decode()
+        return string
+
+    def categories(self, index, name):
+        """
+        :param index: position of the document
+        :param name: name of the category, one of data_browser.CATEGORIES
+        :returns: sorted values of the category associated with the document
+        :rtype: list
+        """
+        offsets = self._sections[name + '.offsets']
+        values = self._sections[name + '.values']
+        return [self.string(_) for _ in
+                values[offsets[index]:offsets[index + 1]]]
+
+    def text(self, index, field):
+        """
+        :param index: position of the document
+        :param field: name of the text field, one of 'dateline', 'title' and
+          'body'
+        :returns: value of the text field
+        :rtype: str
+        """
+        position = index * len(_TEXT_FIELDS) + _TEXT_FIELDS.index(field)
+        if not self._sections['text.present'][position]:
+            return None
+        offsets = self._sections['text.offsets']
+        return bytes(self._sections['text.data'][
+            offsets[position]:offsets[position + 1]]).decode()
+
+    @property
+    def documents(self):
+        """
+        :returns: documents available in the snapshot, decoded lazily
+        :rtype: list
+        """
+        return [SnapshotDocument(self, _) for _ in range(self._length)]
+
+    def iter_documents(self):
+        """
+        :returns: documents available in the snapshot
+        :rtype: generator of SnapshotDocument
+        """
+        return (SnapshotDocument(self, _) for _ in range(self._length))
+
+    @property
+    def vocabularies(self):
+        """
+        :returns: sorted lists of values keyed by vocabulary name, see
+          data_browser.DataBrowser.vocabularies
+        :rtype: dict
+        """
+        vocabularies = {
+            name: set(self._sections[name + '.values'])
+            for name in CATEGORIES}
+        vocabularies['authors'] = set(self._sections['author'])
+        vocabularies['authors'].discard(_NONE)
+        return {
+            name: sorted(self.string(_) for _ in values)
+            for name, values in vocabularies.items()}
+
+    @property
+    def time_index(self):
+        """
+        :returns: index of documents' datetimes, built from the datetime
+          column without decoding documents
+        :rtype: instance of data_browser.TimeIndex
+        """
+        return TimeIndex(numpy.frombuffer(
+            self._sections['datetime'], dtype='int64').view('datetime64[s]'))
+
+    def close(self):
+        """
+        Unmap the snapshot file. Documents of the snapshot can't be accessed
+        anymore.
+        """
+        self._file.close()
+
+    @property
+    def authors(self):
+        """
+        :returns: authors available across all documents in the snapshot.
+        :rtype: list
+        """
+        return self.vocabularies['authors']
+
+    @property
+    def exchanges(self):
+        """
+        :returns: exchanges available across all documents in the snapshot.
+        :rtype: list
+        """
+        return self.vocabularies['exchanges']
+
+    @property
+    def orgs(self):
+        """
+        :returns: orgs available across all documents in the snapshot.
+        :rtype: list
+        """
+        return self.vocabularies['orgs']
+
+    @property
+    def people(self):
+        """
+        :returns: people available across all documents in the snapshot.
+        :rtype: list
+        """
+        return self.vocabularies['people']
+
+    @property
+    def places(self):
+        """
+        :returns: places available across all documents in the snapshot.
+        :rtype: list
+        """
+        return self.vocabularies['places']
+
+    @property
+    def topics(self):
+        """
+        :returns: topics available across all documents in the snapshot.
+        :rtype: list
+        """
+        return self.vocabularies['topics']
+
+
+def build_snapshot(data_files, path):
+    """
+    Build snapshot of documents available in data files.
+
+    :param data_files: paths to data files
+    :param path: path to snapshot file to write
+    :returns: number of documents in the snapshot
+    :rtype: int
+    """
+    sections = {
+        'reuters_id': array('i'),
+        'reuters_old_id': array('i'),
+        'datetime': array('q'),
+        'type': array('i'),
+        'author': array('i'),
+        'strings.offsets': array('Q', [0]),
+        'strings.data': array('B'),
+        'text.offsets': array('Q', [0]),
+        'text.present': array('B'),
+        'text.data': array('B'),
+    }
+    for name in SPLIT_FIELDS:
+        sections[name] = array('i')
+    for name in CATEGORIES:
+        sections[name + '.offsets'] = array('I', [0])
+        sections[name + '.values'] = array('i')
+    strings = {}
+
+    def encode_string(string):
+        if string is None:
+            return _NONE
+        index = strings.get(string)
+        if index is None:
+            index = strings[string] = len(strings)
+            sections['strings.data'].frombytes(string.encode())
+            sections['strings.offsets'].append(len(sections['strings.data']))
+        return index
+
+    length = 0
+    for data_file in data_files:
+        for record in DataBrowser(data_file).iter_records():
+            length += 1
+            sections['reuters_id'].append(record.reuters_id)
+            sections['reuters_old_id'].append(record.reuters_old_id)
+            sections['datetime'].append(
+                int((record.datetime - _EPOCH).total_seconds()))
+            sections['type'].append(encode_string(record.text.type))
+            sections['author'].append(encode_string(record.text.author))
+            for name in SPLIT_FIELDS:
+                sections[name].append(encode_string(getattr(record, name)))
+            for name in CATEGORIES:
+                values = sections[name + '.values']
+                values.extend(encode_string(_) for _ in getattr(record, name))
+                sections[name + '.offsets'].append(len(values))
+            for field in _TEXT_FIELDS:
+                value = getattr(record.text, field)
+                sections['text.present'].append(value is not None)
+                if value is not None:
+                    sections['text.data'].frombytes(value.encode())
+                sections['text.offsets'].append(len(sections['text.data']))
+
+    write_sections(path, _MAGIC, length, sections)
+    return length
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Manage binary snapshots of Reuters text collection.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser(
+        'build-snapshot', help='build snapshot from data files')
+    build.add_argument('snapshot', help='path to snapshot file to write')
+    build.add_argument(
+        'paths', metavar='path', nargs='+',
+        help='path to the data file whose documents are included')
+    args = parser.parse_args()
+    if args.command == 'build-snapshot':
+        length = build_snapshot(sorted(args.paths), args.snapshot)
+        print('%d documents written to %s' % (length, args.snapshot))
+
+
+if __name__ == '__main__':
+    main()
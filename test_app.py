@@ -1,3 +1,7 @@
+import csv
+import gzip
+import io
+import json
 import lxml.etree
 import pymongo
 import pytest
@@ -5,7 +9,8 @@ import sys
 
 import app
 import import_data
-# from data_browser import DataBrowser, Document, DocumentText
+from data_browser import DataBrowser
+from duplicates import LSHIndex
 
 MONGO_DBNAME_TEST = 'test_reuters_data'
 
@@ -49,6 +54,144 @@ class TestAppJSON():
             'last': {'title': 'last page', 'href': 'documents?page=40'}}
         assert len(json_data['_items']) == 25
 
+    def test_topics(self, client):
+        resp = client.get('/topics')
+        items = resp.get_json()['_items']
+        assert [_['_id'] for _ in items] == \
+            DataBrowser('test_data/test.sgm').topics
+        assert all(_['count'] > 0 for _ in items)
+
+    def test_facets(self, client):
+        json_data = client.get('/facets').get_json()
+        assert sorted(json_data.keys()) == [
+            'authors', 'exchanges', 'orgs', 'people', 'places', 'topics']
+        assert sorted(_['_id'] for _ in json_data['topics']) == \
+            DataBrowser('test_data/test.sgm').topics
+        resp = client.get('/facets?where={"topics": "corn"}')
+        json_data = resp.get_json()
+        assert json_data['topics'][0] == {'_id': 'corn', 'count': 14}
+        assert json_data['places'][0] == {'_id': 'usa', 'count': 8}
+
+    def test_time_range(self, client):
+        resp = client.get(
+            '/documents?start=1987-02-26T16:00:00&end=1987-02-26T17:00:00')
+        assert resp.get_json()['_meta']['total'] == 67
+        resp = client.get('/documents?start=Thu, 26 Feb 1987 16:00:00 GMT')
+        assert resp.get_json()['_meta']['total'] == 941
+        assert client.get('/documents?start=today').status_code == 400
+
+    def test_timeseries(self, client):
+        items = client.get('/timeseries').get_json()['_items']
+        assert sum(_['count'] for _ in items) == 1000
+        assert items[0] == {
+            'time': 'Thu, 26 Feb 1987 00:00:00 GMT', 'count': 229}
+        resp = client.get('/timeseries?bucket=month&by=topics')
+        assert {'time': 'Sun, 01 Feb 1987 00:00:00 GMT', 'value': 'cocoa',
+                'count': 1} in resp.get_json()['_items']
+        # counts of a single value are read from rollups, others aggregated
+        corn = client.get('/timeseries?where={"topics": "corn"}').get_json()
+        assert sum(_['count'] for _ in corn['_items']) == 14
+        resp = client.get('/timeseries?where={"topics": {"$in": ["corn"]}}')
+        assert resp.get_json()['_items'] == corn['_items']
+        assert client.get('/timeseries?bucket=year').status_code == 400
+
+    def test_filters(self, client):
+        start, end = 'Thu, 26 Feb 1987 16:00:00 GMT', 'Thu, 26 Feb 1987 17:00:00 GMT'
+        where = json.dumps({'datetime': {'$gte': start, '$lt': end}})
+        for url in ('/facets', '/timeseries?bucket=hour'):
+            separator = '&' if '?' in url else '?'
+            resp = client.get(url + separator + 'start=%s&end=%s' % (start, end))
+            assert resp.get_json() == client.get(
+                url + separator + 'where=' + where).get_json()
+        items = client.get('/timeseries?collapse=1').get_json()['_items']
+        assert sum(_['count'] for _ in items) == 976
+        collapsed = client.get('/facets?collapse=1').get_json()
+        assert sum(_['count'] for _ in collapsed['places']) < sum(
+            _['count'] for _ in client.get('/facets').get_json()['places'])
+        assert client.get('/facets?start=today').status_code == 400
+
+    def test_cursor(self, client):
+        reuters_ids = []
+        url = 'documents?cursor=&sort=datetime&max_results=50'
+        while url:
+            json_data = client.get('/' + url).get_json()
+            assert json_data['_meta'] == {'max_results': 50, 'total': 1000}
+            reuters_ids += [_['reuters_id'] for _ in json_data['_items']]
+            url = json_data['_links'].get('next', {}).get('href')
+        records = DataBrowser('test_data/test.sgm').records
+        assert reuters_ids == [_.reuters_id for _ in sorted(
+            records, key=lambda doc: (doc.datetime, doc.reuters_id))]
+        first = client.get('/documents?cursor=&max_results=10').get_json()
+        second = client.get('/' + first['_links']['next']['href']).get_json()
+        assert second['_items'][0]['reuters_id'] == 11
+        previous = client.get('/' + second['_links']['prev']['href'])
+        assert previous.get_json()['_items'] == first['_items']
+        assert client.get('/documents?cursor=invalid').status_code == 400
+
+    def test_export(self, client):
+        resp = client.get('/documents/export')
+        assert resp.is_streamed
+        docs = [json.loads(_) for _ in resp.get_data(as_text=True).splitlines()]
+        records = DataBrowser('test_data/test.sgm').records
+        duplicate_of = LSHIndex.build(records).duplicates()
+        assert docs == [
+            json.loads(json.dumps(dict(_.as_dict(), **(
+                {'duplicate_of': duplicate_of[_.reuters_id]}
+                if _.reuters_id in duplicate_of else {})),
+                default=lambda value:
+                value.strftime('%a, %d %b %Y %H:%M:%S GMT')))
+            for _ in records]
+        resp = client.get(
+            '/documents/export?format=csv&where={"topics": "corn"}'
+            '&projection={"reuters_id": 1, "topics": 1}',
+            headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        rows = list(csv.reader(io.StringIO(
+            gzip.decompress(resp.get_data()).decode('utf-8'))))
+        assert rows[0] == ['reuters_id', 'topics']
+        assert len(rows) == 15
+        assert 'corn' in rows[1][1].split(';')
+        resp = client.get('/documents/export?projection={"minhash": 1}')
+        assert resp.status_code == 400
+        resp = client.get(
+            '/documents/export?projection={"minhash": 0, "text": 0}')
+        doc = json.loads(resp.get_data(as_text=True).splitlines()[0])
+        assert 'reuters_id' in doc
+        assert not {'minhash', 'lsh', 'text', '_id'}.intersection(doc)
+
+    def test_similar(self, client):
+        resp = client.get('/documents?where={"reuters_id": 930}')
+        _id = resp.get_json()['_items'][0]['_id']
+        assert 'minhash' not in resp.get_json()['_items'][0]
+        items = client.get('/documents/%s/similar' % _id).get_json()['_items']
+        assert items[0]['reuters_id'] == 945
+        assert items[0]['similarity'] > 0.8
+        assert sorted(items[0]) == [
+            '_id', 'datetime', 'reuters_id', 'similarity', 'text']
+        resp = client.get('/documents/%s/similar?threshold=0.95' % _id)
+        assert resp.get_json()['_items'] == []
+        resp = client.get('/documents/%s/similar?threshold=high' % _id)
+        assert resp.status_code == 400
+        resp = client.get('/documents/%s/similar' % ('0' * 24))
+        assert resp.status_code == 404
+
+    def test_collapse(self, client):
+        resp = client.get('/documents?collapse=1')
+        assert resp.get_json()['_meta']['total'] == 976
+        resp = client.get('/documents?collapse=1&where={"reuters_id": 945}')
+        assert resp.get_json()['_items'] == []
+        resp = client.get('/documents/export?collapse=1')
+        assert len(resp.get_data(as_text=True).splitlines()) == 976
+
+    def test_cached(self, client):
+        first = client.get('/documents?page=2')
+        resp = client.get('/documents?page=2')
+        assert resp.headers['X-Cache'] == 'HIT'
+        assert resp.get_data() == first.get_data()
+        resp = client.get(
+            '/documents?page=2', headers={'If-None-Match': first.headers['ETag']})
+        assert resp.status_code == 304
+
 class TestAppXML():
     def test_root(self, client):
         resp = client.get('/', headers={'Accept': 'application/xml'})
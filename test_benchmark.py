@@ -0,0 +1,31 @@
+import flask
+import pytest
+
+import benchmark
+
+
+class TestBenchmark():
+    def test_percentiles(self):
+        results = benchmark.percentiles([_ / 1000 for _ in range(1, 101)])
+        assert results['p50'] == pytest.approx(50)
+        assert results['p99'] == pytest.approx(99)
+        assert results['mean'] == pytest.approx(50.5)
+        assert benchmark.percentiles([0.002])['p95'] == pytest.approx(2)
+
+    def test_parse(self):
+        results = benchmark.bench_parse(['test_data/test.sgm'])
+        assert results['files']['test_data/test.sgm']['documents'] == 1000
+        assert results['total']['documents'] == 1000
+
+    def test_readme_urls(self):
+        assert benchmark.readme_urls()[0] == \
+            '/documents?where={"reuters_id": 10}'
+
+    def test_api_errors(self):
+        main = flask.Flask(__name__)
+        main.route('/ok')(lambda: 'ok')
+        main.route('/error', endpoint='error')(lambda: flask.abort(500))
+        results = benchmark.bench_api(main, ['/ok', '/error'], 3, cache=True)
+        assert results['/ok']['errors'] == 0
+        assert 'p50' in results['/ok']
+        assert results['/error'] == {'status': 500, 'errors': 3}
@@ -1,6 +1,34 @@
 import datetime
+import gc
 import pytest
-from data_browser import DataBrowser, Document, DocumentText
+import weakref
+from data_browser import (
+    CategoryIndex, Corpus, DataBrowser, Document, DocumentRecord, DocumentText,
+    DocumentTextRecord, TimeIndex)
+
+
+def track_documents(monkeypatch):
+    """
+    :returns: list of weak references appended to for every parsed document
+    """
+    iter_documents = DataBrowser.iter_documents
+    references = []
+
+    def tracking_iter_documents(self):
+        for doc in iter_documents(self):
+            references.append(weakref.ref(doc))
+            yield doc
+
+    monkeypatch.setattr(DataBrowser, 'iter_documents', tracking_iter_documents)
+    return references
+
+
+def retained(references):
+    """
+    :returns: number of tracked documents still in memory
+    """
+    gc.collect()
+    return sum(1 for _ in references if _() is not None)
 
 
 @pytest.fixture
@@ -16,6 +44,20 @@ class TestDocument():
         for doc in data.documents:
             assert isinstance(doc.as_dict(), dict)
 
+    def test_as_dict_fields(self, data):
+        doc = data.documents[0]
+        assert doc.as_dict(['text.title', 'reuters_id', 'places']) == {
+            'reuters_id': 1,
+            'places': ['el-salvador', 'uruguay', 'usa'],
+            'text': {'title': 'BAHIA COCOA REVIEW'},
+        }
+        assert doc.as_dict(['text', 'text.title']) == \
+            {'text': doc.text.as_dict()}
+        assert doc.as_dict([]) == {}
+        for fields in (['body'], ['topics.name'], ['text.unknown']):
+            with pytest.raises(ValueError):
+                doc.as_dict(fields)
+
     def test_reuters_id(self, data):
         for doc in data.documents:
             assert isinstance(doc.reuters_id, int)
@@ -32,6 +74,41 @@ class TestDocument():
         for doc in data.documents:
             assert isinstance(doc.text, DocumentText)
 
+    def test_splits(self, data):
+        doc = data.documents[0]
+        assert (doc.lewis_split, doc.cgi_split, doc.topics_flag) == \
+            ('TRAIN', 'TRAINING-SET', 'YES')
+        assert {_.lewis_split for _ in data.documents} <= \
+            {'TRAIN', 'TEST', 'NOT-USED'}
+
+
+class TestDocumentRecord():
+    def test_as_dict(self, data):
+        for doc, record in zip(data.documents, data.records):
+            assert record.as_dict() == doc.as_dict()
+
+    def test_as_dict_fields(self, data):
+        fields = ['reuters_id', 'topics', 'text.author', 'text.body']
+        for doc, record in zip(data.documents, data.records):
+            assert record.as_dict(fields) == doc.as_dict(fields)
+
+    def test_attributes(self, data):
+        record = data.records[0]
+        assert isinstance(record, DocumentRecord)
+        assert isinstance(record.text, DocumentTextRecord)
+        assert record.reuters_id == 1
+        assert record.places == ('el-salvador', 'uruguay', 'usa')
+        assert record.text.title == 'BAHIA COCOA REVIEW'
+        assert record.lewis_split == 'TRAIN'
+        assert not hasattr(record, '__dict__')
+
+    def test_interned_categories(self, data):
+        usa = [
+            _.places[_.places.index('usa')] for _ in data.records
+            if 'usa' in _.places]
+        assert len(usa) > 1
+        assert all(_ is usa[0] for _ in usa)
+
 
 class TestDataBrowser(object):
     def test_documents(self, data):
@@ -303,3 +380,203 @@ class TestDataBrowser(object):
             'wool',
             'yen'
         ]
+
+    def test_iter_documents(self, data):
+        documents = data.documents
+        count = 0
+        for doc, expected in zip(data.iter_documents(), documents):
+            assert isinstance(doc, Document)
+            assert doc.as_dict() == expected.as_dict()
+            count += 1
+        assert count == len(documents)
+
+    def test_to_dicts(self, data):
+        fields = ['reuters_id', 'text.title']
+        assert data.to_dicts(fields) == [
+            _.as_dict(fields) for _ in data.documents]
+        assert data.to_dicts() == [_.as_dict() for _ in data.records]
+
+    def test_records(self, data):
+        assert len(data.records) == 1000
+        assert [_.reuters_id for _ in data.iter_records()] == [
+            _.reuters_id for _ in data.documents]
+
+    def test_trees_released(self, data, monkeypatch):
+        references = track_documents(monkeypatch)
+        assert data.topics
+        assert data.places
+        assert data.records
+        assert list(data.iter_records())
+        assert data.to_dicts()
+        # records are extracted in a single pass, without keeping trees
+        assert len(references) == 1000
+        assert retained(references) == 0
+        assert 'documents' not in data._cache
+
+    def test_cache_invalidation(self, data, tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        data_file.write_bytes(open(data.data_file, 'rb').read())
+        browser = DataBrowser(str(data_file))
+        assert len(browser.documents) == 1000
+        with open(str(data_file), 'a') as f_obj:
+            f_obj.write(
+                '<REUTERS OLDID="1" NEWID="100001">'
+                '<DATE>1-MAR-1987 00:00:00.00</DATE>'
+                '<TOPICS><D>zzz</D></TOPICS><TEXT></TEXT></REUTERS>')
+        assert len(browser.documents) == 1001
+        assert browser.topics[-1] == 'zzz'
+
+    def test_invalid_bytes(self, data, tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        data_file.write_bytes(
+            open(data.data_file, 'rb').read() +
+            b'<REUTERS OLDID="1" NEWID="100001">'
+            b'<DATE>31-MAR-1987 605:12:19.12</DATE><TEXT>'
+            b'<TITLE>M\xfcNCHEN</TITLE></TEXT></REUTERS>\n'
+            b'<REUTERS OLDID="2" NEWID="100002">'
+            b'<DATE>1-APR-1987 00:00:00.00</DATE><TEXT>'
+            b'<TITLE>M\xc3\xbcNCHEN</TITLE></TEXT></REUTERS>\n')
+        browser = DataBrowser(str(data_file))
+        documents = browser.documents
+        assert browser.repaired == 1
+        assert [_.as_dict() for _ in documents[:1000]] == [
+            _.as_dict() for _ in data.documents]
+        assert [_.text.title for _ in documents[1000:]] == [
+            'M\xfcNCHEN', 'M\xfcNCHEN']
+        assert documents[1000].datetime == datetime.datetime(
+            1987, 3, 31, 5, 12, 19)
+        assert len(list(browser.iter_documents())) == 1002
+        assert browser.repaired == 1
+
+    def test_empty_file(self, tmp_path):
+        data_file = tmp_path / 'empty.sgm'
+        data_file.write_bytes(b'')
+        assert DataBrowser(str(data_file)).documents == []
+
+
+@pytest.fixture
+def corpus():
+    """
+    Corpus instance over ./test_data directory.
+    """
+    return Corpus('./test_data', cache_size=1)
+
+
+class TestCorpus():
+    def test_data_files(self, corpus):
+        assert corpus.data_files == ['./test_data/test.sgm']
+
+    def test_documents(self, corpus):
+        assert len(corpus.documents) == 1000
+
+    def test_vocabularies(self, corpus, data):
+        assert corpus.vocabularies == data.vocabularies
+        assert corpus.topics == data.topics
+        assert corpus.authors == data.authors
+
+    def test_query(self, corpus, data):
+        records = corpus.query({'$and': [{'topics': 'corn'}, {'places': 'usa'}]})
+        assert [_.reuters_id for _ in records] == [
+            _.reuters_id for _ in data.records
+            if 'corn' in _.topics and 'usa' in _.places]
+        # index is built once
+        assert corpus.index[1] is corpus.index[1]
+
+    def test_between(self, corpus, data):
+        start = datetime.datetime(1987, 2, 26, 16)
+        end = datetime.datetime(1987, 2, 26, 17)
+        records = corpus.between(start, end)
+        assert sorted(_.reuters_id for _ in records) == [
+            _.reuters_id for _ in data.records if start <= _.datetime < end]
+        assert [_.datetime for _ in records] == \
+            sorted(_.datetime for _ in records)
+        assert corpus.time_index is corpus.time_index
+
+    def test_trees_released(self, corpus, monkeypatch):
+        references = track_documents(monkeypatch)
+        assert corpus.topics
+        assert corpus.query({'topics': 'corn'})
+        assert corpus.between(end=datetime.datetime(1987, 3, 1))
+        assert len(references) == len(corpus.records)
+        assert retained(references) == 0
+
+    def test_browser_cache(self, corpus):
+        browser = corpus.browser('./test_data/test.sgm')
+        assert corpus.browser('./test_data/test.sgm') is browser
+        corpus.browser('./test_data/other.sgm')
+        assert corpus.browser('./test_data/test.sgm') is not browser
+
+
+@pytest.fixture
+def index(data):
+    """
+    CategoryIndex over records of ./test_data/test.sgm data file.
+    """
+    return CategoryIndex(data.records)
+
+
+def matching(data, predicate):
+    return [
+        position for position, doc in enumerate(data.records)
+        if predicate(doc)]
+
+
+class TestCategoryIndex():
+    def test_field(self, index, data):
+        assert index.query({'topics': 'corn'}) == matching(
+            data, lambda doc: 'corn' in doc.topics)
+        assert index.query({'text.author': 'Yuko Nakamikado'}) == matching(
+            data, lambda doc: doc.text.author == 'Yuko Nakamikado')
+        assert index.query({'reuters_id': 10}) == [9]
+        assert index.query({'topics': 'unknown'}) == []
+        assert index.query({}) == list(range(1000))
+
+    def test_and(self, index, data):
+        assert index.query(
+            {'$and': [{'topics': 'corn'}, {'places': 'usa'}]}) == matching(
+            data, lambda doc: 'corn' in doc.topics and 'usa' in doc.places)
+        assert index.query({'topics': 'corn', 'places': 'usa'}) == \
+            index.query({'$and': [{'topics': 'corn'}, {'places': 'usa'}]})
+
+    def test_or(self, index, data):
+        assert index.query(
+            {'$or': [{'topics': 'coffee'}, {'topics': 'cocoa'}]}) == matching(
+            data, lambda doc: 'coffee' in doc.topics or 'cocoa' in doc.topics)
+        assert index.query({'topics': {'$in': ['coffee', 'cocoa']}}) == \
+            index.query({'$or': [{'topics': 'coffee'}, {'topics': 'cocoa'}]})
+
+    def test_not(self, index, data):
+        assert index.query({'places': {'$ne': 'usa'}}) == matching(
+            data, lambda doc: 'usa' not in doc.places)
+        assert index.query({'$nor': [{'places': 'usa'}]}) == \
+            index.query({'places': {'$not': {'$eq': 'usa'}}})
+        assert index.query({'topics': {'$nin': ['earn', 'acq']}}) == matching(
+            data, lambda doc: not {'earn', 'acq'} & set(doc.topics))
+        assert index.count({'places': {'$ne': 'usa'}}) + \
+            index.count({'places': 'usa'}) == 1000
+
+    def test_unsupported(self, index):
+        with pytest.raises(ValueError):
+            index.query({'text.title': 'x'})
+        with pytest.raises(ValueError):
+            index.query({'topics': {'$regex': 'x'}})
+        for condition in (['corn'], {'$in': 'corn'}, {'$eq': {'a': 1}},
+                          {'$all': [['corn']]}):
+            with pytest.raises(ValueError):
+                index.query({'topics': condition})
+
+
+class TestTimeIndex():
+    def test_between(self, data):
+        index = TimeIndex.from_documents(data.records)
+        datetimes = [_.datetime for _ in data.records]
+        start = datetime.datetime(1987, 2, 26, 16, 3, 15)
+        end = datetime.datetime(1987, 3, 1)
+        assert sorted(index.between(start, end)) == [
+            position for position, value in enumerate(datetimes)
+            if start <= value < end]
+        assert list(index.between()) == sorted(
+            range(1000), key=lambda position: datetimes[position])
+        assert len(index.between(start=end)) == len(index) - len(
+            index.between(end=end))
+        assert len(index.between(end, start)) == 0
@@ -0,0 +1,50 @@
+import datetime
+import pytest
+from eve.utils import ParsedRequest
+
+from data_layer import (
+    decode_cursor, encode_cursor, keyset_condition, totals_key)
+
+
+class TestCursor():
+    def test_round_trip(self):
+        values = [datetime.datetime(1987, 2, 26, 15, 1, 1), 1]
+        token = encode_cursor('datetime', -1, values, backward=True)
+        assert decode_cursor(token) == ('datetime', -1, values, True)
+        assert decode_cursor(encode_cursor('reuters_id', 1, [10])) == \
+            ('reuters_id', 1, [10], False)
+
+    def test_invalid(self):
+        for token in ('', 'xx', encode_cursor('text.title', 1, ['x']),
+                      encode_cursor('reuters_id', 1, [1, 2])):
+            with pytest.raises(ValueError):
+                decode_cursor(token)
+
+
+class TestKeysetCondition():
+    def test_single_field(self):
+        assert keyset_condition(('reuters_id',), 1, [10]) == \
+            {'reuters_id': {'$gt': 10}}
+
+    def test_compound(self):
+        when = datetime.datetime(1987, 2, 26)
+        assert keyset_condition(('datetime', 'reuters_id'), -1, [when, 10]) == {
+            '$or': [
+                {'datetime': {'$lt': when}},
+                {'datetime': when, 'reuters_id': {'$lt': 10}},
+            ]}
+
+
+class TestTotalsKey():
+    def test_if_modified_since(self):
+        req = ParsedRequest()
+        req.where = '{"topics": "corn"}'
+        other = ParsedRequest()
+        other.where = req.where
+        assert totals_key('documents', req, {}) == \
+            totals_key('documents', other, {})
+        other.if_modified_since = datetime.datetime(1987, 2, 26)
+        assert totals_key('documents', req, {}) != \
+            totals_key('documents', other, {})
+        assert totals_key('documents', None, {}) != \
+            totals_key('documents', req, {})
@@ -0,0 +1,68 @@
+import pytest
+
+import duplicates
+from data_browser import DataBrowser
+
+
+@pytest.fixture(scope='module')
+def records():
+    return DataBrowser('test_data/test.sgm').records
+
+
+@pytest.fixture(scope='module')
+def index(records):
+    return duplicates.LSHIndex.build(records)
+
+
+class TestSignature():
+    def test_shingles(self):
+        assert len(duplicates.shingles('One two, three FOUR')) == 2
+        assert len(duplicates.shingles('one two')) == 1
+        assert len(duplicates.shingles(' -- ')) == 0
+        assert len(duplicates.shingles('a b c a b c')) == 3
+
+    def test_signature(self):
+        sig = duplicates.signature('Mobil plans to open an office in Peking')
+        assert sig.shape == (duplicates.NUM_PERM,)
+        assert duplicates.signature(None) is None
+        assert duplicates.similarity(sig, sig) == 1.0
+
+    def test_similarity(self):
+        text = ' '.join('word%d' % _ for _ in range(100))
+        edited = text.replace('word50', 'other')
+        # 3 shingles out of 98 changed: Jaccard similarity is 95/101
+        similarity = duplicates.similarity(
+            duplicates.signature(text), duplicates.signature(edited))
+        assert 0.85 < similarity < 1.0
+        unrelated = duplicates.signature(text.replace('word', 'term'))
+        assert duplicates.similarity(
+            duplicates.signature(text), unrelated) < 0.1
+
+    def test_signature_fields(self):
+        fields = duplicates.signature_fields('a b c d')
+        assert sorted(fields) == ['lsh', 'minhash']
+        assert len(fields['lsh']) == duplicates.BANDS
+        assert list(duplicates.from_bytes(fields['minhash'])) == \
+            list(duplicates.signature('a b c d'))
+        assert duplicates.signature_fields('') == {}
+
+
+class TestLSHIndex():
+    def test_similar(self, index, records):
+        assert len(index) == sum(1 for _ in records if _.text.body)
+        results = index.similar(index.signatures[930])
+        assert results[0] == (930, 1.0)
+        assert results[1][0] == 945
+        assert all(score >= 0.5 for _, score in results)
+
+    def test_duplicates(self, index):
+        found = index.duplicates()
+        assert found[945] == 930
+        assert found[240] == 230
+        assert found[347] == 230
+        assert all(original < _ for _, original in found.items())
+        assert duplicates.groups(found)[230] == [240, 347]
+
+    def test_threshold(self, index):
+        assert len(index.duplicates(0.95)) < len(index.duplicates())
+        assert 945 not in index.duplicates(0.95)
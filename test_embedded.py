@@ -0,0 +1,181 @@
+import lxml.etree
+import pytest
+from bson import ObjectId
+
+import embedded
+from data_browser import DataBrowser
+from search import SearchIndex
+from snapshot import build_snapshot
+
+
+@pytest.fixture
+def client():
+    embedded.main.config['EMBEDDED_DATA'] = 'test_data'
+    yield embedded.main.test_client()
+    embedded.main.config['EMBEDDED_DATA'] = embedded.settings.EMBEDDED_DATA
+
+
+@pytest.fixture
+def records():
+    return DataBrowser('test_data/test.sgm').records
+
+
+class TestEmbeddedJSON():
+    def test_root(self, client):
+        resp = client.get('/')
+        assert resp.get_data(as_text=True) == (
+            '{"_links": {"child": [{"href": "documents", "title": "documents"}, '
+            '{"href": "topics", "title": "topics"}, {"href": "places", "title": '
+            '"places"}, {"href": "people", "title": "people"}, {"href": "orgs", '
+            '"title": "orgs"}, {"href": "exchanges", "title": "exchanges"}, '
+            '{"href": "authors", "title": "authors"}]}}')
+
+    def test_documents(self, client, records):
+        resp = client.get('/documents')
+        json_data = resp.get_json()
+        assert json_data['_meta'] == {'page': 1, 'max_results': 25, 'total': 1000}
+        assert sorted(json_data.keys()) == ['_items', '_links', '_meta']
+        assert json_data['_links'] == {
+            'parent': {'title': 'home', 'href': '/'},
+            'self': {'title': 'documents', 'href': 'documents'},
+            'next': {'title': 'next page', 'href': 'documents?page=2'},
+            'last': {'title': 'last page', 'href': 'documents?page=40'}}
+        items = json_data['_items']
+        assert [_['reuters_id'] for _ in items] == list(range(1, 26))
+        assert list(items[0])[:10] == [
+            '_id', 'reuters_id', 'reuters_old_id', 'datetime', 'topics',
+            'places', 'people', 'orgs', 'exchanges', 'text']
+        assert items[0]['text'] == records[0].text.as_dict()
+        assert items[0]['datetime'] == 'Thu, 26 Feb 1987 15:01:01 GMT'
+
+    def test_document(self, client):
+        _id = str(embedded.document_id(10))
+        json_data = client.get('/documents/' + _id).get_json()
+        assert json_data['_id'] == _id
+        assert json_data['reuters_id'] == 10
+        assert client.get('/documents/' + str(ObjectId())).status_code == 404
+
+    def test_where(self, client, records):
+        resp = client.get(
+            '/documents?where={"topics": "corn", "places": "usa"}'
+            '&max_results=50')
+        assert [_['reuters_id'] for _ in resp.get_json()['_items']] == [
+            _.reuters_id for _ in records
+            if 'corn' in _.topics and 'usa' in _.places]
+        resp = client.get(
+            '/documents?where={"$or": [{"reuters_id": {"$gt": 995}}, '
+            '{"text.author": "By Jeremy Clift, Reuters"}]}')
+        assert [_['reuters_id'] for _ in resp.get_json()['_items']] == [
+            _.reuters_id for _ in records
+            if _.reuters_id > 995 or
+            _.text.author == 'By Jeremy Clift, Reuters']
+        resp = client.get('/documents?where={"reuters_id": "5"}')
+        assert resp.get_json()['_meta']['total'] == 0
+        assert client.get(
+            '/documents?where={"text.body": "x"}').status_code == 400
+        assert client.get(
+            '/documents?where={"topics": ["corn"]}').status_code == 400
+
+    def test_projection(self, client):
+        resp = client.get(
+            '/documents?projection={"text.title": 1}&max_results=1')
+        item = resp.get_json()['_items'][0]
+        assert item['text'] == {'title': 'BAHIA COCOA REVIEW'}
+        assert 'reuters_id' not in item
+        resp = client.get('/documents?projection={"text": 0}&max_results=1')
+        item = resp.get_json()['_items'][0]
+        assert 'text' not in item
+        assert item['reuters_id'] == 1
+
+    def test_sort(self, client, records):
+        resp = client.get('/documents?sort=-datetime,reuters_id&max_results=5')
+        assert [_['reuters_id'] for _ in resp.get_json()['_items']] == [
+            _.reuters_id for _ in sorted(
+                records, key=lambda doc: (-doc.datetime.timestamp(),
+                                          doc.reuters_id))][:5]
+        assert client.get('/documents?sort=text.title').status_code == 400
+
+    def test_text_search(self, client, records):
+        resp = client.get(
+            '/documents?where={"$text": {"$search": "\\"new zealand\\""}}'
+            '&projection={"reuters_id": 1}&max_results=50')
+        expected = SearchIndex.build(records).search(
+            '"new zealand"', limit=len(records))
+        assert [_['reuters_id'] for _ in resp.get_json()['_items']] == \
+            sorted(_ for _, _score in expected)
+
+    def test_topics(self, client, records):
+        items = client.get('/topics').get_json()['_items']
+        assert [_['_id'] for _ in items] == \
+            DataBrowser('test_data/test.sgm').topics
+        assert {'_id': 'corn', 'count': 14} in items
+
+    def test_time_range(self, client):
+        resp = client.get(
+            '/documents?start=1987-02-26T16:00:00&end=1987-02-26T17:00:00')
+        assert resp.get_json()['_meta']['total'] == 67
+        resp = client.get('/documents?start=Thu, 26 Feb 1987 16:00:00 GMT')
+        assert resp.get_json()['_meta']['total'] == 941
+        assert client.get('/documents?start=today').status_code == 400
+
+    def test_unsupported(self, client):
+        _id = client.get('/documents').get_json()['_items'][0]['_id']
+        for url in ('/facets', '/timeseries', '/documents/export',
+                    '/documents/%s/similar' % _id, '/documents?collapse=1'):
+            assert client.get(url).status_code == 501
+        assert client.get('/documents?collapse=0').status_code == 200
+
+    def test_cursor(self, client, records):
+        reuters_ids = []
+        url = 'documents?cursor=&sort=datetime&max_results=50'
+        while url:
+            json_data = client.get('/' + url).get_json()
+            assert json_data['_meta'] == {'max_results': 50, 'total': 1000}
+            reuters_ids += [_['reuters_id'] for _ in json_data['_items']]
+            url = json_data['_links'].get('next', {}).get('href')
+        assert reuters_ids == [_.reuters_id for _ in sorted(
+            records, key=lambda doc: (doc.datetime, doc.reuters_id))]
+        first = client.get('/documents?cursor=&max_results=10').get_json()
+        second = client.get('/' + first['_links']['next']['href']).get_json()
+        assert second['_items'][0]['reuters_id'] == 11
+        previous = client.get('/' + second['_links']['prev']['href'])
+        assert previous.get_json()['_items'] == first['_items']
+
+    def test_snapshot(self, client, tmp_path):
+        expected = client.get('/documents?where={"topics": "corn"}').get_json()
+        snapshot_file = str(tmp_path / 'test.snapshot')
+        build_snapshot(['test_data/test.sgm'], snapshot_file)
+        embedded.main.config['EMBEDDED_DATA'] = snapshot_file
+        resp = client.get('/documents?where={"topics": "corn"}')
+        assert resp.get_json()['_items'] == expected['_items']
+
+
+class TestEmbeddedXML():
+    def test_root(self, client):
+        resp = client.get('/', headers={'Accept': 'application/xml'})
+        assert resp.get_data(as_text=True) == (
+            '<resource><link rel="child" href="documents" title="documents" />'
+            '<link rel="child" href="topics" title="topics" /><link rel="child" '
+            'href="places" title="places" /><link rel="child" href="people" '
+            'title="people" /><link rel="child" href="orgs" title="orgs" />'
+            '<link rel="child" href="exchanges" title="exchanges" /><link '
+            'rel="child" href="authors" title="authors" /></resource>')
+
+    def test_topics(self, client):
+        resp = client.get('/topics', headers={'Accept': 'application/xml'})
+        xml_root = lxml.etree.fromstring(resp.get_data())
+        assert [_.text for _ in xml_root.iterfind('resource/_id')] == \
+            DataBrowser('test_data/test.sgm').topics
+
+
+class TestProject():
+    def test_project(self):
+        doc = {'_id': 1, 'a': 2, 'text': {'title': 't', 'body': 'b'}}
+        assert embedded.project(doc, {}) == doc
+        assert embedded.project(doc, {'text.title': 1}) == {
+            '_id': 1, 'text': {'title': 't'}}
+        assert embedded.project(doc, {'a': 1, '_id': 0}) == {'a': 2}
+        assert embedded.project(doc, {'text.body': 0}) == {
+            '_id': 1, 'a': 2, 'text': {'title': 't'}}
+        assert embedded.project(doc, {'_id': 0}) == {
+            'a': 2, 'text': {'title': 't', 'body': 'b'}}
@@ -0,0 +1,401 @@
+import datetime
+import mongomock
+import pytest
+import sys
+
+import import_data
+from data_browser import DataBrowser
+from duplicates import LSHIndex
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """
+    In-memory stand-in for the database used by the importer.
+    """
+    mongo_con = mongomock.MongoClient()
+    monkeypatch.setattr(
+        import_data.pymongo, 'MongoClient', lambda *args: mongo_con)
+    return mongo_con[import_data.settings.MONGO_DBNAME]
+
+
+class TestParseFiles():
+    def test_parse_file(self):
+        filename, docs, error, repaired = import_data.parse_file(
+            'test_data/test.sgm')
+        assert filename == 'test_data/test.sgm'
+        assert error is None
+        assert repaired == 0
+        assert len(docs) == 1000
+        assert docs[0]['reuters_id'] == 1
+        assert len(docs[0]['lsh']) == 32
+
+    def test_parse_file_repaired(self, tmp_path):
+        data_file = tmp_path / 'bad.sgm'
+        data_file.write_bytes(
+            b'<REUTERS OLDID="1" NEWID="1">'
+            b'<DATE>1-MAR-1987 00:00:00.00</DATE>'
+            b'<TEXT><TITLE>\xfc</TITLE></TEXT></REUTERS>')
+        filename, docs, error, repaired = import_data.parse_file(
+            str(data_file))
+        assert error is None
+        assert repaired == 1
+        assert docs[0]['text']['title'] == '\xfc'
+
+    def test_parse_file_error(self, tmp_path):
+        filename, docs, error, repaired = import_data.parse_file(
+            str(tmp_path / 'missing.sgm'))
+        assert docs == []
+        assert 'No such file' in error
+
+    def test_parse_files_workers(self, tmp_path):
+        missing_file = str(tmp_path / 'missing.sgm')
+        filenames = ['test_data/test.sgm', missing_file, 'test_data/test.sgm']
+        sequential = list(import_data.parse_files(filenames))
+        parallel = list(import_data.parse_files(filenames, workers=2))
+        assert [_[0] for _ in parallel] == filenames
+        assert [_[2] is None for _ in parallel] == [True, False, True]
+        assert parallel == sequential
+
+    def test_parse_files_window(self, monkeypatch):
+        submitted = []
+        submit = import_data.ProcessPoolExecutor.submit
+
+        def counting_submit(self, fn, filename):
+            submitted.append(filename)
+            return submit(self, fn, filename)
+
+        monkeypatch.setattr(
+            import_data.ProcessPoolExecutor, 'submit', counting_submit)
+        parsed = import_data.parse_files(['test_data/test.sgm'] * 6, workers=2)
+        next(parsed)
+        assert len(submitted) == 3
+        parsed.close()
+
+
+class TestBulkLoader():
+    def test_load(self, mongo_db):
+        loader = import_data.BulkLoader(mongo_db.documents, batch_size=300)
+        batches = []
+        insert_many = loader.collection.insert_many
+
+        def counting_insert_many(docs, **kwargs):
+            batches.append(len(docs))
+            assert kwargs == {'ordered': False}
+            return insert_many(docs, **kwargs)
+
+        loader.collection.insert_many = counting_insert_many
+        count = loader.load(import_data.parse_files(['test_data/test.sgm']))
+        assert count == 1000
+        assert batches == [300, 300, 300, 100]
+        assert mongo_db.documents.count_documents({}) == 1000
+        assert loader.parse_stats.documents == 1000
+        assert loader.write_stats.documents == 1000
+        assert loader.write_stats.rate > 0
+
+    def test_load_error(self, mongo_db):
+        def failing_parse():
+            yield import_data.parse_file('test_data/test.sgm')
+            raise RuntimeError('parsing failed')
+
+        loader = import_data.BulkLoader(mongo_db.documents)
+        with pytest.raises(RuntimeError):
+            loader.load(failing_parse())
+
+    def test_write_error(self, mongo_db):
+        closed = []
+
+        def parse():
+            try:
+                while True:
+                    yield import_data.parse_file('test_data/test.sgm')
+            finally:
+                closed.append(True)
+
+        def failing_insert_many(docs, **kwargs):
+            raise RuntimeError('writing failed')
+
+        loader = import_data.BulkLoader(
+            mongo_db.documents, batch_size=10, queue_size=1)
+        loader.collection.insert_many = failing_insert_many
+        with pytest.raises(RuntimeError):
+            loader.load(parse())
+        # the producer stopped and closed parsed files
+        assert closed == [True]
+
+
+class TestMain():
+    def test_main(self, mongo_db, monkeypatch, capsys):
+        monkeypatch.setattr(sys, 'argv', [
+            '', '--drop-collection', '--batch-size', '64',
+            '--write-concern', '0', 'test_data/test.sgm'])
+        import_data.main()
+        assert mongo_db.documents.count_documents({}) == 1000
+        assert 'search_index_for_text_title_and_body' in \
+            mongo_db.documents.index_information()
+        out = capsys.readouterr().out
+        assert 'parse: 1000 documents' in out
+        assert 'write: 1000 documents' in out
+
+    def test_incremental(self, mongo_db, monkeypatch, capsys, tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        data_file.write_bytes(open('test_data/test.sgm', 'rb').read())
+        argv = ['', '--incremental', str(data_file)]
+        monkeypatch.setattr(sys, 'argv', argv)
+        import_data.main()
+        import_data.main()
+        assert mongo_db.documents.count_documents({}) == 1000
+        assert 'skipping unchanged data file' in capsys.readouterr().out
+        data_file.write_bytes(data_file.read_bytes().replace(
+            b'BAHIA COCOA REVIEW', b'BAHIA COCOA WEEKLY REVIEW'))
+        import_data.main()
+        assert 'skipping' not in capsys.readouterr().out
+        assert mongo_db.documents.count_documents({}) == 1000
+        doc = mongo_db.documents.find_one({'reuters_id': 1})
+        assert doc['text']['title'] == 'BAHIA COCOA WEEKLY REVIEW'
+        entry = mongo_db.import_manifest.find_one()
+        assert entry['size'] == len(data_file.read_bytes())
+
+    def test_vocabularies(self, mongo_db, monkeypatch):
+        monkeypatch.setattr(sys, 'argv', ['', 'test_data/test.sgm'])
+        import_data.main()
+        data = DataBrowser('test_data/test.sgm')
+        for name in import_data.settings.VOCABULARIES:
+            collection = mongo_db['vocabulary_' + name]
+            assert sorted(_['_id'] for _ in collection.find()) == \
+                getattr(data, name)
+        cocoa = mongo_db.vocabulary_topics.find_one({'_id': 'cocoa'})
+        assert cocoa['count'] == sum(
+            'cocoa' in _.topics for _ in data.records)
+        incremental = {
+            name: sorted((_['_id'], _['count']) for _ in mongo_db[
+                'vocabulary_' + name].find())
+            for name in import_data.settings.VOCABULARIES}
+        monkeypatch.setattr(sys, 'argv', ['', '--rebuild-vocabularies'])
+        import_data.main()
+        for name, values in incremental.items():
+            assert sorted((_['_id'], _['count']) for _ in mongo_db[
+                'vocabulary_' + name].find()) == values
+
+    def test_incremental_vocabularies(self, mongo_db, monkeypatch, tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        data_file.write_bytes(open('test_data/test.sgm', 'rb').read())
+        monkeypatch.setattr(sys, 'argv', ['', '--incremental', str(data_file)])
+        import_data.main()
+        cocoa = mongo_db.vocabulary_topics.find_one({'_id': 'cocoa'})['count']
+        # first document moves from cocoa topic to a new one
+        data_file.write_bytes(data_file.read_bytes().replace(
+            b'<TOPICS><D>cocoa</D></TOPICS>', b'<TOPICS><D>cacao</D></TOPICS>',
+            1))
+        import_data.main()
+        assert mongo_db.vocabulary_topics.find_one(
+            {'_id': 'cocoa'})['count'] == cocoa - 1
+        assert mongo_db.vocabulary_topics.find_one(
+            {'_id': 'cacao'})['count'] == 1
+
+    def test_incremental_removed(self, mongo_db, monkeypatch, capsys,
+                                 tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        content = open('test_data/test.sgm', 'rb').read()
+        data_file.write_bytes(content)
+        monkeypatch.setattr(sys, 'argv', ['', '--incremental', str(data_file)])
+        import_data.main()
+        cocoa = mongo_db.vocabulary_topics.find_one({'_id': 'cocoa'})['count']
+        # first document (about cocoa) is removed from the file
+        data_file.write_bytes(content[content.index(b'<REUTERS', 100):])
+        import_data.main()
+        assert '1 documents removed' in capsys.readouterr().out
+        assert mongo_db.documents.count_documents({}) == 999
+        assert mongo_db.documents.find_one({'reuters_id': 1}) is None
+        assert mongo_db.vocabulary_topics.find_one(
+            {'_id': 'cocoa'})['count'] == cocoa - 1
+
+    def test_timeseries(self, mongo_db, monkeypatch, tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        data_file.write_bytes(open('test_data/test.sgm', 'rb').read())
+        monkeypatch.setattr(sys, 'argv', ['', '--incremental', str(data_file)])
+        import_data.main()
+        data = DataBrowser('test_data/test.sgm')
+        day = mongo_db.timeseries_day.find_one(
+            {'by': None, 'time': datetime.datetime(1987, 2, 26)})
+        assert day['count'] == sum(
+            _.datetime.date() == datetime.date(1987, 2, 26)
+            for _ in data.records)
+        # first document moves from cocoa topic to a new one
+        data_file.write_bytes(data_file.read_bytes().replace(
+            b'<TOPICS><D>cocoa</D></TOPICS>', b'<TOPICS><D>cacao</D></TOPICS>',
+            1))
+        import_data.main()
+
+        def counts():
+            return {
+                bucket: sorted(
+                    (_['time'], _['by'] or '', _['value'] or '', _['count'])
+                    for _ in mongo_db['timeseries_' + bucket].find())
+                for bucket in import_data.settings.TIMESERIES_BUCKETS}
+        incremental = counts()
+        assert mongo_db.timeseries_month.find_one(
+            {'by': 'topics', 'value': 'cacao'})['count'] == 1
+        monkeypatch.setattr(sys, 'argv', ['', '--rebuild-timeseries'])
+        import_data.main()
+        assert counts() == incremental
+
+    def test_duplicates(self, mongo_db, monkeypatch, capsys):
+        monkeypatch.setattr(sys, 'argv', ['', 'test_data/test.sgm'])
+        import_data.main()
+        assert '24 near-duplicates of 23 documents marked' in \
+            capsys.readouterr().out
+        assert mongo_db.documents.find_one(
+            {'reuters_id': 945})['duplicate_of'] == 930
+        assert mongo_db.documents.count_documents(
+            {'duplicate_of': {'$ne': None}}) == 24
+        mongo_db.documents.update_one(
+            {'reuters_id': 1}, {'$set': {'duplicate_of': 2}})
+        mongo_db.documents.update_one(
+            {'reuters_id': 945}, {'$unset': {'minhash': '', 'lsh': ''}})
+        monkeypatch.setattr(sys, 'argv', ['', '--rebuild-duplicates'])
+        import_data.main()
+        assert 'duplicate_of' not in mongo_db.documents.find_one(
+            {'reuters_id': 1})
+        assert mongo_db.documents.count_documents(
+            {'duplicate_of': {'$ne': None}}) == 24
+        assert len(mongo_db.documents.find_one({'reuters_id': 945})['lsh']) \
+            == 32
+
+    def test_incremental_duplicates(self, mongo_db, monkeypatch, capsys,
+                                    tmp_path):
+        data_file = tmp_path / 'test.sgm'
+        content = open('test_data/test.sgm', 'rb').read()
+        data_file.write_bytes(content)
+        monkeypatch.setattr(sys, 'argv', ['', '--incremental', str(data_file)])
+        import_data.main()
+        assert mongo_db.documents.find_one(
+            {'reuters_id': 347})['duplicate_of'] == 230
+        # earliest document of a group is removed from the file
+        start = content.rindex(b'<REUTERS', 0, content.index(b'NEWID="230"'))
+        end = content.index(b'</REUTERS>', start) + len(b'</REUTERS>\n')
+        data_file.write_bytes(content[:start] + content[end:])
+        # unsigned documents are left to --rebuild-duplicates
+        mongo_db.documents.insert_one(
+            {'reuters_id': 100001, 'text': {'body': 'imported long ago'}})
+        capsys.readouterr()
+        import_data.main()
+        assert 'minhash' not in mongo_db.documents.find_one(
+            {'reuters_id': 100001})
+        out = capsys.readouterr().out
+        compared = int(out.split(' compared documents')[0].split()[-1])
+        assert 0 < compared < 999
+        marked = {
+            _['reuters_id']: _['duplicate_of'] for _ in mongo_db.documents.find(
+                {'duplicate_of': {'$ne': None}})}
+        assert 230 not in marked.values()
+        assert marked == LSHIndex.build(
+            DataBrowser(str(data_file)).records).duplicates()
+
+    def test_generation(self, mongo_db, monkeypatch):
+        monkeypatch.setattr(sys, 'argv', ['', 'test_data/test.sgm'])
+        import_data.main()
+        monkeypatch.setattr(sys, 'argv', ['', '--rebuild-vocabularies'])
+        import_data.main()
+        assert mongo_db.meta.find_one({'_id': 'generation'})['value'] == 2
+
+
+class TestImportManifest():
+    def test_changed(self, mongo_db):
+        manifest = import_data.ImportManifest(mongo_db.import_manifest)
+        filenames = ['test_data/test.sgm']
+        assert manifest.changed(filenames) == filenames
+        manifest.update(filenames)
+        assert manifest.changed(filenames) == []
+
+
+class TestIndexes():
+    def test_ensure_indexes(self, mongo_db):
+        collection = mongo_db.documents
+        collection.create_index([('reuters_id', 1)], name='reuters_id_1')
+        assert 'reuters_id' in import_data.verify_indexes(collection)
+        import_data.ensure_indexes(collection)
+        assert import_data.verify_indexes(collection) == []
+        indexes = collection.index_information()
+        assert 'reuters_id_1' not in indexes
+        assert indexes['reuters_id']['unique']
+        import_data.ensure_indexes(collection)
+        assert collection.index_information() == indexes
+
+    def test_text_index(self, mongo_db):
+        collection = mongo_db.documents
+        spec = next(
+            _ for _ in import_data.settings.DOCUMENTS_INDEXES
+            if _['name'] == 'search_index_for_text_title_and_body')
+        # text indexes as reported by MongoDB
+        info = {'key': [('_fts', 'text'), ('_ftsx', 1)], 'v': 2,
+                'weights': {'text.title': 1, 'text.body': 1},
+                'default_language': 'english', 'language_override': 'language',
+                'textIndexVersion': 3}
+        assert import_data._index_matches(info, spec)
+        assert not import_data._index_matches(
+            dict(info, weights={'text.title': 1}), spec)
+        assert not import_data._index_matches(
+            dict(info, default_language='none'), spec)
+        collection.create_index([('text.title', 'text')], name='title')
+        import_data.ensure_indexes(collection)
+        assert 'title' not in collection.index_information()
+
+    def test_duplicate_documents(self, mongo_db, capsys):
+        mongo_db.documents.insert_many([{'reuters_id': 1}, {'reuters_id': 1}])
+        with pytest.raises(SystemExit):
+            import_data.ensure_indexes(mongo_db.documents)
+        assert '--drop-collection' in capsys.readouterr().err
+
+    def test_query_covered(self):
+        assert import_data.query_covered({'places': 'usa'})
+        assert import_data.query_covered(
+            {'$and': [{'topics': 'corn'}, {'text.dateline': 'x'}]})
+        assert not import_data.query_covered(
+            {'$or': [{'topics': 'corn'}, {'text.dateline': 'x'}]})
+        assert not import_data.query_covered({'text.dateline': 'x'})
+        assert not import_data.query_covered(
+            {'$text': {'$search': 'x'}}, specs=[])
+
+    def test_readme_queries_covered(self, capsys):
+        assert import_data.report_query_coverage() == []
+        assert 'NOT INDEXED' not in capsys.readouterr().out
+
+    def test_ensure_indexes_command(self, mongo_db, monkeypatch):
+        monkeypatch.setattr(sys, 'argv', ['', '--ensure-indexes'])
+        import_data.main()
+        assert import_data.verify_indexes(mongo_db.documents) == []
+
+    def test_duplicate_import(self, mongo_db, monkeypatch, capsys):
+        monkeypatch.setattr(sys, 'argv', ['', 'test_data/test.sgm'])
+        import_data.main()
+        with pytest.raises(SystemExit):
+            import_data.main()
+        assert '--incremental' in capsys.readouterr().err
+
+    def test_partial_duplicate_import(self, mongo_db, monkeypatch, tmp_path):
+        monkeypatch.setattr(sys, 'argv', ['', 'test_data/test.sgm'])
+        import_data.main()
+        data_file = tmp_path / 'more.sgm'
+        data_file.write_bytes(
+            b'<REUTERS OLDID="1" NEWID="100001">'
+            b'<DATE>1-MAR-1987 00:00:00.00</DATE>'
+            b'<TOPICS><D>zzz</D></TOPICS><TEXT></TEXT></REUTERS>\n' +
+            open('test_data/test.sgm', 'rb').read())
+        monkeypatch.setattr(sys, 'argv', ['', str(data_file)])
+        with pytest.raises(SystemExit):
+            import_data.main()
+        # the new document is written and accounted, the file isn't
+        # recorded as imported
+        assert mongo_db.documents.count_documents({}) == 1001
+        assert mongo_db.vocabulary_topics.find_one({'_id': 'zzz'}) is not None
+        assert mongo_db.import_manifest.count_documents({}) == 1
+        # only written documents are counted
+        def counts():
+            return sorted(
+                (_['_id'], _['count'])
+                for _ in mongo_db.vocabulary_topics.find())
+        incremental = counts()
+        monkeypatch.setattr(sys, 'argv', ['', '--rebuild-vocabularies'])
+        import_data.main()
+        assert counts() == incremental
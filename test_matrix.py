@@ -0,0 +1,85 @@
+from collections import Counter
+
+import numpy
+import pytest
+
+from data_browser import CATEGORIES, DataBrowser
+from matrix import TermDocumentMatrix, build_matrix, tokenize
+from snapshot import Snapshot, build_snapshot
+
+
+@pytest.fixture(scope='module')
+def records():
+    return DataBrowser('test_data/test.sgm').records
+
+
+@pytest.fixture(scope='module')
+def matrix(records):
+    return TermDocumentMatrix.build(records)
+
+
+class TestTermDocumentMatrix():
+    def test_rows(self, matrix, records):
+        assert matrix.shape == (1000, len(matrix.terms))
+        assert list(matrix.terms) == sorted(set(
+            word for doc in records for word in tokenize(doc.text.body)))
+        assert list(matrix.reuters_ids) == [_.reuters_id for _ in records]
+        for position, doc in enumerate(records):
+            assert matrix.row(position) == Counter(tokenize(doc.text.body))
+
+    def test_batches(self, matrix, records):
+        other = TermDocumentMatrix.build(records, batch_size=7)
+        for name, array in matrix.arrays.items():
+            assert numpy.array_equal(other.arrays[name], array)
+
+    def test_labels(self, matrix, records):
+        for name in CATEGORIES:
+            values, labels = matrix.labels(name)
+            assert list(values) == sorted(set(
+                value for doc in records for value in getattr(doc, name)))
+            assert labels.shape == (1000, len(values))
+            assert [set(values[row].tolist()) for row in labels] == \
+                [set(getattr(doc, name)) for doc in records]
+
+    def test_splits(self, matrix, records):
+        assert matrix.arrays['lewis_split'][0] == 'TRAIN'
+        assert matrix.arrays['cgi_split'][0] == 'TRAINING-SET'
+        train, test = matrix.modapte()
+        assert list(train) == [
+            position for position, doc in enumerate(records)
+            if doc.lewis_split == 'TRAIN' and doc.topics_flag == 'YES']
+        assert len(test) == sum(
+            1 for doc in records
+            if doc.lewis_split == 'TEST' and doc.topics_flag == 'YES')
+
+    def test_snapshot(self, matrix, tmp_path):
+        path = str(tmp_path / 'test.snapshot')
+        build_snapshot(['test_data/test.sgm'], path)
+        snapshot = Snapshot(path)
+        try:
+            other = TermDocumentMatrix.build(snapshot)
+        finally:
+            snapshot.close()
+        for name, array in matrix.arrays.items():
+            assert numpy.array_equal(other.arrays[name], array)
+        assert [list(_) for _ in other.modapte()] == \
+            [list(_) for _ in matrix.modapte()]
+
+    def test_load(self, matrix, tmp_path):
+        build_matrix(['test_data/test.sgm'], str(tmp_path / 'matrix'))
+        loaded = TermDocumentMatrix.load(str(tmp_path / 'matrix'))
+        assert isinstance(loaded.data, numpy.memmap)
+        assert loaded.arrays.keys() == matrix.arrays.keys()
+        for name, array in matrix.arrays.items():
+            assert numpy.array_equal(loaded.arrays[name], array)
+
+    def test_empty(self):
+        matrix = TermDocumentMatrix.build([])
+        assert matrix.shape == (0, 0)
+        assert list(matrix.indptr) == [0]
+
+    def test_csr_matrix(self, matrix):
+        pytest.importorskip('scipy')
+        csr = matrix.csr_matrix()
+        assert csr.shape == matrix.shape
+        assert csr.sum() == matrix.data.sum()
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import flask
+import pytest
+
+from metrics import CommandListener, Counter, Histogram, Metrics
+
+
+@pytest.fixture
+def app():
+    """
+    Flask application with instrumentation enabled.
+    """
+    app = flask.Flask(__name__)
+    app.config['METRICS'] = True
+
+    @app.route('/documents')
+    def documents():
+        return flask.jsonify([])
+
+    app.metrics = Metrics(app)
+    return app
+
+
+def command_event(command_name, command, reply=None, request_id=1):
+    return SimpleNamespace(
+        command_name=command_name, command=command, reply=reply,
+        database_name='reuters_data', connection_id=('localhost', 27017),
+        request_id=request_id, duration_micros=1500)
+
+
+class TestHistogram():
+    def test_samples(self):
+        histogram = Histogram('latency', 'Latency.', ('path',), (0.1, 1))
+        histogram.observe(('/a',), 0.05)
+        histogram.observe(('/a',), 0.5)
+        histogram.observe(('/a',), 5)
+        assert histogram.samples() == [
+            'latency_bucket{path="/a",le="0.1"} 1',
+            'latency_bucket{path="/a",le="1"} 2',
+            'latency_bucket{path="/a",le="+Inf"} 3',
+            'latency_sum{path="/a"} 5.55',
+            'latency_count{path="/a"} 3',
+        ]
+
+    def test_counter(self):
+        counter = Counter('requests_total', 'Requests.', ('path',))
+        counter.inc(('say "hi"',), 2)
+        assert counter.samples() == ['requests_total{path="say \\"hi\\""} 2.0']
+
+
+class TestMetrics():
+    def test_disabled(self):
+        app = flask.Flask(__name__)
+        assert not Metrics(app).enabled
+        assert app.test_client().get('/metrics').status_code == 404
+
+    def test_requests(self, app):
+        client = app.test_client()
+        client.get('/documents')
+        client.get('/missing')
+        resp = client.get('/metrics')
+        assert resp.headers['Cache-Control'] == 'no-store'
+        text = resp.get_data(as_text=True)
+        assert '# TYPE http_request_duration_seconds histogram' in text
+        assert 'http_request_duration_seconds_count{method="GET",' \
+            'endpoint="/documents",status="200"} 1' in text
+        assert 'http_request_duration_seconds_count{method="GET",' \
+            'endpoint="unmatched",status="404"} 1' in text
+
+    def test_commands(self, app):
+        listener = CommandListener(app.metrics)
+        listener.started(command_event('find', {'find': 'documents'}))
+        listener.succeeded(command_event(
+            'find', None, {'cursor': {'firstBatch': [{}, {}], 'id': 0}}))
+        listener.started(command_event(
+            'aggregate', {'aggregate': 'documents'}, request_id=2))
+        listener.failed(command_event('aggregate', None, request_id=2))
+        text = app.metrics.render()
+        assert 'mongodb_command_duration_seconds_count{command="find",' \
+            'namespace="reuters_data.documents"} 1' in text
+        assert 'mongodb_command_documents_returned_total{command="find",' \
+            'namespace="reuters_data.documents"} 2.0' in text
+        assert 'mongodb_command_failures_total{command="aggregate",' \
+            'namespace="reuters_data.documents"} 1.0' in text
@@ -0,0 +1,103 @@
+import copy
+import json
+from datetime import datetime, timezone
+
+import pytest
+from eve import render
+
+import embedded
+from data_browser import DataBrowser
+from renderers import JSONRenderer, XMLRenderer, encode_json
+
+
+@pytest.fixture
+def page():
+    items = []
+    for doc in DataBrowser('test_data/test.sgm').records[:25]:
+        item = doc.as_dict()
+        item['_id'] = embedded.document_id(doc.reuters_id)
+        item['datetime'] = doc.datetime.replace(tzinfo=timezone.utc)
+        item['_links'] = {
+            'self': {'title': 'Document', 'href': 'documents/%s' % item['_id']}}
+        items.append(item)
+    items[0]['text']['title'] = 'caf\xe9 & <cr\xe8me> \U0001f600 \x7f\x03'
+    return {
+        '_items': items,
+        '_links': {
+            'self': {'title': 'documents', 'href': 'documents?a=1&b=2'},
+            'parent': {'title': 'home', 'href': '/'},
+        },
+        '_meta': {'page': 1, 'max_results': 25, 'total': 1000},
+    }
+
+
+def encode_compact(data, default, sort_keys=False):
+    return json.dumps(data, default=default, separators=(',', ':'))
+
+
+def rendered(renderer, data, url='/documents'):
+    with embedded.main.test_request_context(url):
+        return renderer().render(copy.deepcopy(data))
+
+
+class TestJSONRenderer():
+    def test_page(self, page):
+        assert rendered(JSONRenderer, page) == \
+            rendered(render.JSONRenderer, page)
+
+    def test_pretty(self, page):
+        assert rendered(JSONRenderer, page, '/documents?pretty') == \
+            rendered(render.JSONRenderer, page, '/documents?pretty')
+
+    def test_fallback(self):
+        data = {'_items': [{'value': {1, 2}, 'time': datetime(1987, 2, 26)}]}
+        assert rendered(JSONRenderer, data) == \
+            rendered(render.JSONRenderer, data)
+
+    def test_encoder(self):
+        embedded.main.config['JSON_ENCODER'] = 'test_renderers.encode_compact'
+        try:
+            assert rendered(JSONRenderer, {'a': [1, 2]}) == '{"a":[1,2]}'
+        finally:
+            embedded.main.config['JSON_ENCODER'] = 'renderers.encode_json'
+
+    def test_encode_json(self):
+        assert encode_json({'b': [1, {}], 'a': None}, str, True) == \
+            '{"a": null, "b": [1, {}]}'
+
+
+class TestXMLRenderer():
+    def test_page(self, page):
+        assert rendered(XMLRenderer, page) == \
+            rendered(render.XMLRenderer, page)
+
+    def test_item(self, page):
+        item = page['_items'][0]
+        assert rendered(XMLRenderer, item) == \
+            rendered(render.XMLRenderer, item)
+
+    def test_related_links(self):
+        data = {
+            '_id': 1,
+            'parts': [{'a': 1}, {'a': 2, '_links': {'self': {
+                'title': 'part', 'href': 'parts/2'}}}],
+            '_links': {'related': {'parts': [
+                {'title': 'part', 'href': 'parts/1'},
+                {'title': 'part', 'href': 'parts/2'}]}},
+        }
+        assert rendered(XMLRenderer, data) == \
+            rendered(render.XMLRenderer, data)
+
+    def test_empty(self):
+        assert rendered(XMLRenderer, {}) == ''
+        assert rendered(XMLRenderer, []) == \
+            rendered(render.XMLRenderer, [])
+
+    def test_streamed(self, page):
+        embedded.main.config['XML_STREAM_MIN_ITEMS'] = 25
+        try:
+            chunks = rendered(XMLRenderer, page)
+        finally:
+            embedded.main.config['XML_STREAM_MIN_ITEMS'] = None
+        assert not isinstance(chunks, str)
+        assert ''.join(chunks) == rendered(render.XMLRenderer, page)
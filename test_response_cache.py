@@ -0,0 +1,219 @@
+import gzip
+import threading
+import zlib
+
+import flask
+import pytest
+
+from response_cache import LocalBackend, ResponseCache, cache_key
+
+
+@pytest.fixture
+def app():
+    """
+    Flask application counting requests reaching its views, with responses
+    cached until generation changes.
+    """
+    app = flask.Flask(__name__)
+    app.config['RESPONSE_CACHE_GENERATION_CHECK_INTERVAL'] = 0
+    app.calls = []
+    app.generation = 1
+
+    @app.route('/documents')
+    def documents():
+        app.calls.append(flask.request.full_path)
+        return flask.jsonify(where=flask.request.args.get('where'))
+
+    @app.route('/topics')
+    def topics():
+        app.calls.append(flask.request.full_path)
+        return flask.jsonify(['topic %d' % _ for _ in range(200)])
+
+    @app.route('/missing')
+    def missing():
+        app.calls.append(flask.request.full_path)
+        flask.abort(404)
+
+    @app.route('/live')
+    def live():
+        app.calls.append(flask.request.full_path)
+        response = flask.jsonify(calls=len(app.calls))
+        response.cache_control.no_store = True
+        return response
+
+    ResponseCache(app, generation=lambda: app.generation)
+    return app
+
+
+class TestCacheKey():
+    def test_normalized_where(self, app):
+        with app.test_request_context(
+                '/documents?where={"a": 1, "b": 2}&page=2'):
+            key = cache_key(flask.request)
+        with app.test_request_context(
+                '/documents?page=2&where={"b":2,"a":1}'):
+            assert cache_key(flask.request) == key
+
+    def test_accept(self, app):
+        with app.test_request_context('/documents'):
+            key = cache_key(flask.request)
+        with app.test_request_context(
+                '/documents', headers={'Accept': 'application/xml'}):
+            assert cache_key(flask.request) != key
+
+
+class TestLocalBackend():
+    def test_lru(self):
+        backend = LocalBackend(2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        assert backend.get('a') == 1
+        backend.set('c', 3)
+        assert backend.get('b') is None
+        assert backend.get('a') == 1
+        assert backend.get('c') == 3
+
+    def test_lru_threads(self):
+        backend = LocalBackend(8)
+        errors = []
+
+        def use(offset):
+            try:
+                for value in range(offset, offset + 2000):
+                    backend.set(value, value)
+                    assert backend.get(value) in (value, None)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [
+            threading.Thread(target=use, args=(_ * 2000,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert len(backend._entries) == 8
+
+
+class TestResponseCache():
+    def test_cached(self, app):
+        client = app.test_client()
+        first = client.get('/documents?where={"a": 1}')
+        second = client.get('/documents?where={"a":1}')
+        assert first.headers['X-Cache'] == 'MISS'
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.get_data() == first.get_data()
+        assert second.headers['Content-Type'] == first.headers['Content-Type']
+        assert len(app.calls) == 1
+
+    def test_generation(self, app):
+        client = app.test_client()
+        client.get('/documents')
+        app.generation += 1
+        assert client.get('/documents').headers['X-Cache'] == 'MISS'
+        assert len(app.calls) == 2
+
+    def test_conditional(self, app):
+        client = app.test_client()
+        etag = client.get('/documents').headers['ETag']
+        resp = client.get('/documents', headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert len(app.calls) == 1
+        app.generation += 1
+        resp = client.get('/documents', headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert len(app.calls) == 2
+
+    def test_errors_not_cached(self, app):
+        client = app.test_client()
+        client.get('/missing')
+        assert client.get('/missing').status_code == 404
+        assert len(app.calls) == 2
+
+    def test_no_store_not_cached(self, app):
+        client = app.test_client()
+        client.get('/live')
+        resp = client.get('/live')
+        assert 'ETag' not in resp.headers
+        assert len(app.calls) == 2
+
+    def test_disabled(self):
+        app = flask.Flask(__name__)
+        app.config['RESPONSE_CACHE'] = False
+        cache = ResponseCache(app, generation=lambda: 1)
+        assert cache.backend is None
+
+    def test_compressed(self, app):
+        client = app.test_client()
+        identity = client.get('/topics')
+        assert 'Content-Encoding' not in identity.headers
+        assert identity.headers['Vary'] == 'Accept-Encoding'
+        resp = client.get('/topics', headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert resp.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(resp.get_data()) == identity.get_data()
+        resp = client.get(
+            '/topics', headers={'Accept-Encoding': 'gzip;q=0.5, deflate'})
+        assert resp.headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(resp.get_data()) == identity.get_data()
+        assert len(app.calls) == 1
+
+    def test_compressed_etag(self, app):
+        client = app.test_client()
+        gzip_headers = {'Accept-Encoding': 'gzip'}
+        identity = client.get('/topics').headers['ETag']
+        etag = client.get('/topics', headers=gzip_headers).headers['ETag']
+        assert etag == identity[:-1] + '-gzip"'
+        resp = client.get('/topics', headers=dict(
+            gzip_headers, **{'If-None-Match': etag}))
+        assert resp.status_code == 304
+        assert resp.headers['ETag'] == etag
+        resp = client.get('/topics', headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert 'Content-Encoding' not in resp.headers
+        resp = client.get('/topics', headers=dict(
+            gzip_headers, **{'If-None-Match': identity}))
+        assert resp.status_code == 200
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert len(app.calls) == 1
+
+    def test_conditional_evicted(self):
+        app = flask.Flask(__name__)
+        app.config['RESPONSE_CACHE_SIZE'] = 1
+        app.route('/small', endpoint='small')(lambda: flask.jsonify(['topic']))
+        app.route('/large', endpoint='large')(
+            lambda: flask.jsonify(['topic'] * 200))
+        ResponseCache(app, generation=lambda: 1)
+        client = app.test_client()
+        etag = client.get('/small').headers['ETag']
+        client.get('/large')
+        # small bodies are not compressed for clients accepting it either
+        resp = client.get('/small', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.headers['X-Cache'] == 'MISS'
+
+    def test_compressed_miss(self, app):
+        client = app.test_client()
+        resp = client.get('/topics', headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['X-Cache'] == 'MISS'
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        cached = client.get('/topics', headers={'Accept-Encoding': 'gzip'})
+        assert cached.headers['X-Cache'] == 'HIT'
+        assert cached.get_data() == resp.get_data()
+
+    def test_small_not_compressed(self, app):
+        client = app.test_client()
+        resp = client.get('/documents', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in resp.headers
+        assert 'Vary' not in resp.headers
+
+    def test_compression_disabled(self):
+        app = flask.Flask(__name__)
+        app.config['RESPONSE_CACHE_COMPRESS'] = False
+        app.route('/topics')(lambda: flask.jsonify(['topic'] * 200))
+        ResponseCache(app, generation=lambda: 1)
+        resp = app.test_client().get(
+            '/topics', headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['X-Cache'] == 'MISS'
+        assert 'Content-Encoding' not in resp.headers
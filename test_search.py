@@ -0,0 +1,82 @@
+import re
+import pytest
+
+from data_browser import DataBrowser
+from search import SearchIndex, parse_query, stem, tokenize
+
+
+@pytest.fixture(scope='module')
+def records():
+    return {_.reuters_id: _ for _ in DataBrowser('./test_data/test.sgm').records}
+
+
+@pytest.fixture(scope='module')
+def index(records):
+    return SearchIndex.build(records.values())
+
+
+def text(record):
+    return ' '.join(filter(None, (record.text.title, record.text.body)))
+
+
+class TestAnalysis():
+    def test_stem(self):
+        assert stem('prices') == stem('price')
+        assert stem('exports') == stem('exported') == stem('exporting')
+        assert stem('countries') == 'country'
+        assert stem('gas') == 'gas'
+        assert stem('1987') == '1987'
+
+    def test_tokenize(self):
+        assert list(tokenize('The price of Coffee')) == [
+            (1, 'price'), (3, 'coffee')]
+
+    def test_parse_query(self):
+        assert parse_query('coffee "new zealand" -brazil') == (
+            ['coffee', 'new', 'zealand'], [[('new', 0), ('zealand', 1)]],
+            ['brazil'])
+
+
+class TestSearchIndex():
+    def test_search(self, index, records):
+        results = index.search('coffee', limit=5)
+        assert len(results) == 5
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+        for reuters_id, _ in results:
+            assert 'coffee' in text(records[reuters_id]).lower()
+
+    def test_any_word(self, index, records):
+        results = index.search('cocoa coffee', limit=1000)
+        matching = [
+            _ for _ in records.values()
+            if re.search(r'\b(cocoa|coffee)\b', text(_).lower())]
+        assert len(results) == len(matching)
+
+    def test_phrase(self, index, records):
+        results = index.search('"new zealand"', limit=1000)
+        assert results
+        for reuters_id, _ in results:
+            assert re.search(
+                r'new\s+zealand', text(records[reuters_id]).lower())
+
+    def test_excluded(self, index, records):
+        results = index.search('coffee -brazil', limit=1000)
+        assert results
+        for reuters_id, _ in results:
+            assert not re.search(
+                r'\bbrazil\b', text(records[reuters_id]).lower())
+
+    def test_unknown(self, index):
+        assert index.search('xyzzy') == []
+
+    def test_save_load(self, index, tmp_path):
+        path = str(tmp_path / 'test.idx')
+        index.save(path)
+        loaded = SearchIndex.load(path)
+        try:
+            assert len(loaded) == len(index)
+            for query in ('cocoa', '"new zealand"', 'oil prices -opec'):
+                assert loaded.search(query) == index.search(query)
+        finally:
+            loaded.close()
@@ -0,0 +1,59 @@
+import pytest
+
+from data_browser import DataBrowser, TimeIndex
+from snapshot import Snapshot, SnapshotDocument, build_snapshot
+
+
+@pytest.fixture(scope='module')
+def data():
+    return DataBrowser('./test_data/test.sgm')
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    """
+    Snapshot of ./test_data/test.sgm data file.
+    """
+    path = str(tmp_path / 'test.snap')
+    assert build_snapshot(['./test_data/test.sgm'], path) == 1000
+    snapshot = Snapshot(path)
+    yield snapshot
+    snapshot.close()
+
+
+class TestSnapshot():
+    def test_documents(self, snapshot, data):
+        assert len(snapshot) == 1000
+        assert isinstance(snapshot[0], SnapshotDocument)
+        assert [_.as_dict() for _ in snapshot.documents] == \
+            [_.as_dict() for _ in data.records]
+
+    def test_as_dict_fields(self, snapshot, data):
+        fields = ['reuters_id', 'datetime', 'places', 'text.title']
+        assert [_.as_dict(fields) for _ in snapshot.documents] == \
+            data.to_dicts(fields)
+
+    def test_document(self, snapshot):
+        doc = snapshot[-1]
+        assert doc.reuters_id == 1000
+        assert snapshot[999].text.title == doc.text.title
+        with pytest.raises(IndexError):
+            snapshot[1000]
+
+    def test_splits(self, snapshot, data):
+        for name in ('lewis_split', 'cgi_split', 'topics_flag'):
+            assert [getattr(_, name) for _ in snapshot.documents] == \
+                [getattr(_, name) for _ in data.records]
+
+    def test_vocabularies(self, snapshot, data):
+        assert snapshot.vocabularies == data.vocabularies
+        assert snapshot.authors == data.authors
+        assert snapshot.topics == data.topics
+
+    def test_time_index(self, snapshot, data):
+        assert list(snapshot.time_index.between()) == \
+            list(TimeIndex.from_documents(data.records).between())
+
+    def test_not_snapshot(self):
+        with pytest.raises(ValueError):
+            Snapshot('./test_data/test.sgm')
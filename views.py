@@ -0,0 +1,345 @@
+"""
+Read-only endpoints complementing the resources Eve serves from DOMAIN.
+"""
+
+import csv
+import io
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+from eve.render import send_response
+from eve.utils import date_to_str, parse_request, str_to_date
+from flask import (
+    Blueprint, Response, abort, current_app as app, request,
+    stream_with_context)
+
+import settings
+from duplicates import SIGNATURE_FIELDS, from_bytes, ranked
+from rollups import count_buckets_stages, count_values_stages
+from settings import DOCS_COLLECTION_NAME
+
+views = Blueprint('views', __name__)
+
+# columns of CSV exports; lists of values are joined with EXPORT_CSV_SEPARATOR
+EXPORT_CSV_FIELDS = (
+    'reuters_id', 'reuters_old_id', 'datetime', 'topics', 'places', 'people',
+    'orgs', 'exchanges', 'text.type', 'text.author', 'text.dateline',
+    'text.title', 'text.body')
+EXPORT_CSV_SEPARATOR = ';'
+
+# exported documents are read from the database and sent in chunks of about
+# that many bytes
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def documents_collection():
+    """
+    :returns: documents collection of the active database
+    :rtype: instance of pymongo.collection.Collection
+    """
+    return app.data.pymongo(DOCS_COLLECTION_NAME).db[DOCS_COLLECTION_NAME]
+
+
+def documents_filter():
+    """
+    :returns: filter passed in the where parameter of the request, parsed,
+      validated and converted the same way as for the documents resource
+    :rtype: dict
+    """
+    req = parse_request(DOCS_COLLECTION_NAME)
+    spec = app.data._convert_where_request_to_dict(DOCS_COLLECTION_NAME, req)
+    return app.data._mongotize(spec, DOCS_COLLECTION_NAME)
+
+
+def parse_datetime(value):
+    """
+    :param value: date in ISO 8601 format or in Eve's DATE_FORMAT
+    :rtype: datetime.datetime
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return str_to_date(value)
+
+
+def time_range_filter(req, lookup):
+    """
+    on_pre_GET_documents hook restricting documents to the time range given
+    by start (inclusive) and end (exclusive) parameters of the request. The
+    range is added to the query as is, so that it is served by the index on
+    datetime instead of being written by clients in the where parameter.
+    """
+    time_range = {}
+    for name, operator in (('start', '$gte'), ('end', '$lt')):
+        value = request.args.get(name)
+        if value:
+            try:
+                time_range[operator] = parse_datetime(value)
+            except ValueError:
+                abort(400, description='Invalid %s date: %s' % (name, value))
+    if time_range:
+        lookup['datetime'] = time_range
+
+
+def collapse_filter(req, lookup):
+    """
+    on_pre_GET_documents hook leaving near-duplicates of earlier documents
+    (see duplicates.py) out, if the collapse parameter is set to 1.
+    """
+    if request.args.get('collapse') == '1':
+        lookup['duplicate_of'] = None
+
+
+def documents_spec():
+    """
+    :returns: filter of documents matching the where parameter and the
+      start, end and collapse parameters of the request, as the documents
+      resource applies them (see time_range_filter() and collapse_filter())
+    :rtype: dict
+    """
+    spec = documents_filter()
+    lookup = {}
+    time_range_filter(request, lookup)
+    collapse_filter(request, lookup)
+    if lookup:
+        spec = {'$and': [spec, lookup]} if spec else lookup
+    return spec
+
+
+def _number_arg(name, convert, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        abort(400, description='Invalid %s: %s' % (name, value))
+
+
+@views.route('/facets')
+def facets():
+    """
+    Number of documents per value of every vocabulary (see
+    settings.VOCABULARIES), among documents matching the where, start, end
+    and collapse parameters (see documents_spec()). Values are sorted by
+    descending number of documents.
+    """
+    spec = documents_spec()
+    db = app.data.pymongo(DOCS_COLLECTION_NAME).db
+    if not spec:
+        # counts across all documents are maintained by the importer
+        response = {
+            name: list(db[settings.VOCABULARY_COLLECTION_PREFIX + name].find(
+                sort=[('count', -1), ('_id', 1)]))
+            for name in settings.VOCABULARIES}
+    else:
+        sort = {"$sort": {"count": -1, "_id": 1}}
+        response = next(documents_collection().aggregate([
+            {"$match": spec},
+            {"$facet": {
+                name: count_values_stages(field) + [sort]
+                for name, field in settings.VOCABULARIES.items()}},
+        ]))
+    return send_response(None, (response,))
+
+
+@views.route('/timeseries')
+def timeseries():
+    """
+    Number of documents per time bucket (bucket parameter, one of
+    settings.TIMESERIES_BUCKETS, day by default), overall or per value of
+    the vocabulary given in the by parameter, among documents matching the
+    where, start, end and collapse parameters (see documents_spec()).
+    Counts are sorted by time and value.
+    """
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in settings.TIMESERIES_BUCKETS:
+        abort(400, description='Unknown bucket: %s' % bucket)
+    name = request.args.get('by') or None
+    if name is not None and name not in settings.VOCABULARIES:
+        abort(400, description='Unknown vocabulary: %s' % name)
+    spec = documents_spec()
+    keys = ('time', 'count') if name is None else ('time', 'value', 'count')
+    rollup = None
+    if not spec:
+        rollup = {'by': name}
+    elif name is None and len(spec) == 1:
+        # counts of a single vocabulary value are maintained by the importer
+        field, value = next(iter(spec.items()))
+        names = [
+            _ for _, vocabulary_field in settings.VOCABULARIES.items()
+            if vocabulary_field == field]
+        if names and isinstance(value, str):
+            rollup = {'by': names[0], 'value': value}
+    if rollup is not None:
+        db = app.data.pymongo(DOCS_COLLECTION_NAME).db
+        items = list(db[settings.TIMESERIES_COLLECTION_PREFIX + bucket].find(
+            rollup, projection=dict(dict.fromkeys(keys, 1), _id=0),
+            sort=[('time', 1), ('value', 1)]))
+    else:
+        field = None if name is None else settings.VOCABULARIES[name]
+        items = [
+            {key: item[key] for key in keys}
+            for item in documents_collection().aggregate(
+                [{"$match": spec}] + count_buckets_stages(bucket, field))]
+    return send_response(None, ({'_items': items},))
+
+
+@views.route('/documents/<regex("[a-f0-9]{24}"):_id>/similar')
+def similar(_id):
+    """
+    Documents whose body is similar to the body of the document (see
+    duplicates.py), at least as much as the threshold parameter
+    (settings.SIMILAR_THRESHOLD by default), most similar first. Only
+    documents sharing a band of their signature with the document's one
+    are compared, found by the index on band keys.
+    """
+    threshold = _number_arg('threshold', float, settings.SIMILAR_THRESHOLD)
+    max_results = min(max(
+        _number_arg('max_results', int, app.config['PAGINATION_DEFAULT']), 1),
+        app.config['PAGINATION_LIMIT'])
+    collection = documents_collection()
+    doc = collection.find_one(
+        {'_id': ObjectId(_id)}, projection=dict.fromkeys(SIGNATURE_FIELDS, 1))
+    if doc is None:
+        abort(404)
+    items = []
+    if 'minhash' in doc:
+        candidates = {
+            _['reuters_id']: _ for _ in collection.find(
+                {'lsh': {'$in': doc['lsh']}, '_id': {'$ne': doc['_id']}},
+                projection={
+                    'reuters_id': 1, 'datetime': 1, 'text.title': 1,
+                    'minhash': 1})}
+        for reuters_id, score in ranked(
+                ((reuters_id, from_bytes(candidate.pop('minhash')))
+                 for reuters_id, candidate in candidates.items()),
+                from_bytes(doc['minhash']), threshold)[:max_results]:
+            items.append(dict(candidates[reuters_id], similarity=score))
+    return send_response(None, ({'_items': items},))
+
+
+def _projected(field, projection):
+    """
+    :param field: dotted path to a document field
+    :param projection: projection as passed in the projection parameter
+    :returns: whether the projection returns the field
+    :rtype: bool
+    """
+    matches = [
+        bool(value) for key, value in projection.items()
+        if field == key or field.startswith(key + '.') or
+        key.startswith(field + '.')]
+    if any(projection.values()):
+        return any(matches)
+    return not matches
+
+
+def _csv_value(doc, field):
+    value = doc
+    for key in field.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    if isinstance(value, list):
+        return EXPORT_CSV_SEPARATOR.join(value)
+    if isinstance(value, datetime):
+        return date_to_str(value)
+    return value
+
+
+def _export_lines(cursor, export_format, projection):
+    """
+    :returns: lines of the export, header included
+    :rtype: generator of str
+    """
+    if export_format == 'ndjson':
+        encoder = app.data.json_encoder_class()
+        for doc in cursor:
+            yield encoder.encode(doc) + '\n'
+        return
+    fields = [_ for _ in EXPORT_CSV_FIELDS if _projected(_, projection)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for doc in cursor:
+        writer.writerow([_csv_value(doc, field) for field in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_chunks(lines, compress):
+    """
+    :param lines: lines of the export
+    :param compress: whether to gzip the export
+    :returns: chunks of the encoded export
+    :rtype: generator of bytes
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            data = ''.join(chunk).encode('utf-8')
+            chunk, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = ''.join(chunk).encode('utf-8')
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+@views.route('/documents/export')
+def export():
+    """
+    All documents matching the where, start, end and collapse parameters
+    (see documents_spec()), ordered by reuters_id, with fields
+    selected by the projection parameter, in the format given by the format
+    parameter (ndjson, the default, or csv). Documents are read from a
+    single cursor and streamed, gzipped if the client accepts it, so that
+    memory usage doesn't depend on the number of documents.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description='Unknown format: %s' % export_format)
+    spec = documents_spec()
+    projection = app.data._client_projection(
+        parse_request(DOCS_COLLECTION_NAME))
+    # signatures are internal to the database
+    signatures = [_ for _ in SIGNATURE_FIELDS if projection.get(_)]
+    if signatures:
+        abort(400, description='Fields not exported: %s' % ', '.join(
+            signatures))
+    # _id is internal to the database too, unless asked for
+    find_projection = {
+        field: value for field, value in projection.items()
+        if field not in SIGNATURE_FIELDS}
+    find_projection.setdefault('_id', 0)
+    if not any(find_projection.values()):
+        find_projection.update(dict.fromkeys(SIGNATURE_FIELDS, 0))
+    cursor = documents_collection().find(
+        spec, projection=find_projection, sort=[('reuters_id', 1)],
+        batch_size=EXPORT_BATCH_SIZE)
+    compress = request.accept_encodings['gzip'] > 0
+    response = Response(
+        stream_with_context(_export_chunks(
+            _export_lines(cursor, export_format, projection), compress)),
+        mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=documents.%s' % export_format
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response